@@ -1,11 +1,20 @@
-from flask import Flask, jsonify, request, g, render_template, redirect, url_for
+from flask import Flask, jsonify, request, g, render_template, redirect, url_for, Response, stream_with_context
 from flask_cors import CORS
 from service.service import ArticleService, QuestionService, OrganizationService, AskService, LogService, webHook
+from service.service import LOG_FIELDS, LOG_DEFAULT_FIELDS, ARTICLE_FIELDS, QUESTION_FIELDS, QUESTION_ARTICLE_MODES
+from service.pagination import parse_fields, parse_limit
 from validation.validation import validate_article, validate_question, validate_organizations, validate_question_article_batch, validate_article_batch, validate_question_batch
-from validation.authentication import tokenService,require_token
-from service.chat import notification
+from validation.authentication import tokenService, require_token, invalidate_client, invalidate_user, auth_cache_stats
+from service.chat import notifier
+from service.proxy import upstream_proxy, UpstreamTokenError, check_target
+from model.embedding import embedding_cache
+from model.model import writer
+from model.answer_cache import answer_cache
+from model.memory_index import memory_index
+from model.indexes import vector_index_health, vector_index_name, create_vector_index, rebuild_vector_index, drop_vector_index, create_text_search, create_log_indexes
 from werkzeug.exceptions import BadRequest
-import os, jwt
+import os, jwt, json, io, csv
+from datetime import datetime
 import requests
 from dotenv import load_dotenv
 load_dotenv()
@@ -40,6 +49,28 @@ def get_token():
 #=============================#
 # Autogen Token
 #=============================#
+def forward_upstream(body, credentials):
+    # Token upstream di-cache dan session dipakai ulang, body response di-stream apa adanya
+    method = "POST" if body.get("method", "POST").upper() == "POST" else "GET"
+    try:
+        check_target(body.get("url_target"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        api_resp = upstream_proxy.forward(credentials, method, body.get("url_target"), body.get("payload"))
+    except UpstreamTokenError as e:
+        print(f"❌ Gagal mengambil token upstream: {e}")
+        return jsonify({"error": "cannot get token"}), 500
+    except requests.Timeout:
+        return jsonify({"error": "upstream timeout"}), 504
+    except requests.RequestException as e:
+        return jsonify({"error": f"upstream error: {e}"}), 502
+    return Response(
+        stream_with_context(upstream_proxy.iter_body(api_resp)),
+        status=api_resp.status_code,
+        content_type=api_resp.headers.get("Content-Type", "application/octet-stream"),
+    )
+
 @app.route("/request-access-nusa", methods=["POST"])
 def get_access():
     body = request.get_json(silent=True);
@@ -48,69 +79,14 @@ def get_access():
     check = t_service.checkUsers(body)
     if check == False:
         return jsonify({"error": "Your email is invalid"}), 401
-
-    resp = requests.post(
-       os.getenv("TOKEN_API"),
-        auth=(os.getenv("NUSA_ID"), os.getenv("NUSA_SECRET"))
-    )
-    if resp.status_code != 200:
-        return jsonify({"error": "cannot get token"}), 500
-    token = resp.json()["access_token"]
-    method = body.get("method", "POST").upper()
-    url_target = body.get("url_target")
-    payload = body.get("payload")
-    if method == "POST":
-        api_resp = requests.post(
-            url_target,
-            headers={"Authorization": f"Bearer {token}"},
-            json=payload,
-        )
-    else:
-       api_resp = requests.get(
-            url_target,
-            headers={"Authorization": f"Bearer {token}"},
-            json=payload, 
-       )
-
-    if "application/json" in api_resp.headers.get("Content-Type", ""):
-        result = api_resp.json()
-    else:
-        result = api_resp.text
-    return jsonify(result), api_resp.status_code
+    return forward_upstream(body, (os.getenv("TOKEN_API"), os.getenv("NUSA_ID"), os.getenv("NUSA_SECRET")))
 
 @app.route("/request-access-users", methods=["POST"])
 def get_access_user():
     body = request.get_json(silent=True);
     if body is None:
         return jsonify({"error": "Data is none"}), 404
-    resp = requests.post(
-       os.getenv("TOKEN_API"),
-        auth=(os.getenv("USERS_ID"), os.getenv("USERS_SECRET"))
-    )
-    if resp.status_code != 200:
-        return jsonify({"error": "cannot get token"}), 500
-    token = resp.json()["access_token"]
-    method = body.get("method", "POST").upper()
-    url_target = body.get("url_target")
-    payload = body.get("payload")
-    if method == "POST":
-        api_resp = requests.post(
-            url_target,
-            headers={"Authorization": f"Bearer {token}"},
-            json=payload,
-        )
-    else:
-       api_resp = requests.get(
-            url_target,
-            headers={"Authorization": f"Bearer {token}"},
-            json=payload,
-       )
-
-    if "application/json" in api_resp.headers.get("Content-Type", ""):
-        result = api_resp.json()
-    else:
-        result = api_resp.text
-    return jsonify(result), api_resp.status_code
+    return forward_upstream(body, (os.getenv("TOKEN_API"), os.getenv("USERS_ID"), os.getenv("USERS_SECRET")))
 
 @app.route("/", methods=["GET"])
 def main():
@@ -139,12 +115,29 @@ def testing_public():
         "service": "Seluruh aktivitas dikelola oleh Flask"
     })
 
+def list_filters(args):
+    return {
+        "organization_id": args.get("organization_id", type=int),
+        "status": args.get("status"),
+    }
+
 @app.route("/articles", methods=["GET"])
 @require_token(role="private")
 def get_articles():
+    # Paginasi aktif jika ?limit atau ?cursor dikirim; ?fields, ?organization_id, ?status opsional
     try:
-        articles = a_service.get_all_articles()
-        return jsonify({"success": True, "data": articles})
+        paginate = "limit" in request.args or "cursor" in request.args
+        page = a_service.get_all_articles(
+            fields=parse_fields(request.args.get("fields"), ARTICLE_FIELDS, []),
+            filters=list_filters(request.args),
+            cursor=request.args.get("cursor"),
+            limit=parse_limit(request.args.get("limit")) if paginate else None,
+        )
+        if not paginate:
+            page.pop("next_cursor")
+        return jsonify({"success": True, **page})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "message": "Gagal mengambil data artikel", "error": str(e)}), 500
 
@@ -175,9 +168,24 @@ def get_article_by_id(id):
 @app.route("/questions", methods=["GET"])
 @require_token(role="private")
 def get_all_questions():
+    # Seperti /articles, plus ?articles=full|summary|ref|none untuk bentuk artikel terkait
+    articles = request.args.get("articles", "full")
+    if articles not in QUESTION_ARTICLE_MODES:
+        return jsonify({"success": False, "message": f"articles harus salah satu dari {', '.join(QUESTION_ARTICLE_MODES)}"}), 400
     try:
-        question = q_service.get_all_question()
-        return jsonify({"success": True, "data": question})
+        paginate = "limit" in request.args or "cursor" in request.args
+        page = q_service.get_all_question(
+            fields=parse_fields(request.args.get("fields"), QUESTION_FIELDS, []),
+            filters=list_filters(request.args),
+            cursor=request.args.get("cursor"),
+            limit=parse_limit(request.args.get("limit")) if paginate else None,
+            articles=articles,
+        )
+        if not paginate:
+            page.pop("next_cursor")
+        return jsonify({"success": True, **page})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "message": "Gagal mengambil data question", "error": str(e)}), 500
     
@@ -198,14 +206,20 @@ def create_questions():
 def create_question_articles_batch():
     data = g.question_article_batch_data
     try:
-        result = q_service.attach_articles_to_questions_batch(data)
+        # ?mode=replace untuk truncate + insert ulang seluruh relasi (mode lama)
+        result = q_service.attach_articles_to_questions_batch(
+            data,
+            full_replace=request.args.get("mode") == "replace"
+        )
         
         if result.get("success") is False:
             return jsonify(result), 400  # Bad request for invalid ID
         
         return jsonify({
             "success": True,
-            "message": f"{len(data)} relasi berhasil dibuat"
+            "message": f"{len(data)} relasi berhasil dibuat",
+            "added": result.get("added"),
+            "removed": result.get("removed")
         }), 201
 
     except Exception as e:
@@ -280,13 +294,53 @@ def ask():
             "error": str(e)
         }), 500
 
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    body = request.get_json(silent=True)
+    if body is None:
+        return jsonify({
+            "success": False,
+            "message": "Invalid JSON format"
+        }), 400
+    # Default Server-Sent Events, ?format=ndjson untuk chunked NDJSON
+    ndjson = request.args.get("format") == "ndjson"
+
+    def encode(event, payload):
+        if ndjson:
+            return json.dumps({"event": event, **payload}, default=str) + "\n"
+        return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+    def generate():
+        try:
+            for event, value in ak_service.asking_stream(body):
+                if event == "token":
+                    yield encode("token", {"token": value})
+                else:
+                    yield encode("done", {"success": True, "data": value})
+        except Exception as e:
+            yield encode("error", {
+                "success": False,
+                "message": "Gagal mendapatkan jawaban",
+                "error": str(e)
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson" if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.route("/questions-batch", methods=["POST"])
 @require_token(role="private")
 @validate_question_batch
 def create_questions_batch():
     data = g.question_batch_data
     try:
-        result = q_service.create_question_batch(data)
+        result = q_service.create_question_batch(
+            data,
+            batch_size=request.args.get("batch_size", type=int),
+            concurrency=request.args.get("concurrency", type=int),
+        )
 
         if result.get("success") is False:
             return jsonify(result), 400
@@ -294,7 +348,8 @@ def create_questions_batch():
         return jsonify({
             "success": True,
             "message": f"{len(data)} questions successfully processed",
-            "data": result.get("data", [])
+            "data": result.get("data", []),
+            "chunks": result.get("chunks", [])
         }), 201
 
     except Exception as e:
@@ -311,29 +366,98 @@ def create_questions_batch():
 def create_articles_batch_v():
     data = g.article_batch_data
     try:
-        result = a_service.create_article_batch(data)
+        # Body NDJSON diproses per chunk dan di-commit per chunk
+        result = a_service.create_article_batch(
+            data,
+            chunk_size=request.args.get("batch_size", type=int),
+            chunked_commit=g.article_batch_streamed,
+        )
 
         if result.get("success") is False:
             return jsonify(result), 400
 
         return jsonify({
             "success": True,
-            "message": f"{len(data)} articles successfully processed",
+            "message": f"{result.get('processed', 0)} articles successfully processed",
             "data": result.get("data", [])
         }), 201
 
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": str(e),
+            "committed": getattr(e, "committed", 0)
+        }), 400
     except Exception as e:
         return jsonify({
             "success": False,
             "message": "An error occurred while processing article batch.",
-            "error": str(e)
+            "error": str(e),
+            "committed": getattr(e, "committed", 0)
         }), 500
 
+def log_filters(args):
+    filters = {
+        "organization_id": args.get("organization_id", type=int),
+        "session_id": args.get("session_id"),
+    }
+    for key in ("date_from", "date_to"):
+        value = args.get(key)
+        if value:
+            try:
+                filters[key] = datetime.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"{key} harus berformat ISO (YYYY-MM-DD atau YYYY-MM-DDTHH:MM:SS)")
+    return filters
+
 @app.route("/log", methods=["GET"])
 @require_token(role="private")
 def getLog():
-    data = l_service.get_Log()
-    return jsonify(data)
+    # ?limit, ?cursor, ?fields, filter organization_id/session_id/date_from/date_to,
+    # ?format=ndjson|csv untuk export yang di-stream. Tanpa ?limit/?cursor responsnya
+    # tetap array semua kolom seperti sebelumnya.
+    export = request.args.get("format")
+    paginate = "limit" in request.args or "cursor" in request.args
+    try:
+        default_fields = LOG_DEFAULT_FIELDS if paginate or export else list(LOG_FIELDS)
+        fields = parse_fields(request.args.get("fields"), LOG_FIELDS, default_fields)
+        filters = log_filters(request.args)
+        cursor = request.args.get("cursor")
+        if export in ("ndjson", "csv"):
+            limit = request.args.get("limit", type=int)
+            rows = l_service.iter_log(fields, filters, cursor, limit)
+        elif export:
+            return jsonify({"success": False, "message": f"Format '{export}' tidak dikenal"}), 400
+        elif paginate:
+            page = l_service.get_Log(fields, filters, cursor, parse_limit(request.args.get("limit")))
+            return jsonify({"success": True, **page})
+        else:
+            return jsonify(l_service.get_Log(fields, filters)["data"])
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    def generate_ndjson():
+        for row in rows:
+            yield json.dumps(row, default=str) + "\n"
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer_csv = csv.writer(buffer)
+        writer_csv.writerow(fields)
+        for row in rows:
+            writer_csv.writerow([row.get(f) for f in fields])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    if export == "csv":
+        return Response(
+            stream_with_context(generate_csv()),
+            mimetype="text/csv",
+            headers={"Content-Disposition": "attachment; filename=log.csv"},
+        )
+    return Response(stream_with_context(generate_ndjson()), mimetype="application/x-ndjson")
 
 @app.route("/get-article", methods=['GET'])
 @require_token(role="private")
@@ -348,6 +472,116 @@ def listener():
     save = h.setListenerHook(payload)
     return "ok", 200
 
+@app.route("/admin/embedding-cache", methods=["GET"])
+@require_token(role="private")
+def get_embedding_cache_stats():
+    return jsonify({"success": True, "data": embedding_cache.stats()})
+
+@app.route("/admin/embedding-cache", methods=["DELETE"])
+@require_token(role="private")
+def purge_embedding_cache():
+    try:
+        deleted = embedding_cache.purge_expired()
+        return jsonify({"success": True, "deleted": deleted})
+    except Exception as e:
+        return jsonify({"success": False, "message": "Gagal membersihkan cache embedding", "error": str(e)}), 500
+
+@app.route("/admin/write-queue", methods=["GET"])
+@require_token(role="private")
+def get_write_queue_stats():
+    return jsonify({"success": True, "data": writer.stats()})
+
+@app.route("/admin/notifications", methods=["GET"])
+@require_token(role="private")
+def get_notification_stats():
+    return jsonify({"success": True, "data": notifier.stats()})
+
+@app.route("/admin/answer-cache", methods=["GET"])
+@require_token(role="private")
+def get_answer_cache_stats():
+    return jsonify({"success": True, "data": answer_cache.stats()})
+
+@app.route("/admin/answer-cache", methods=["DELETE"])
+@require_token(role="private")
+def clear_answer_cache():
+    organization_id = request.args.get("organization_id", type=int)
+    answer_cache.clear(organization_id)
+    return jsonify({"success": True})
+
+@app.route("/admin/auth-cache", methods=["GET"])
+@require_token(role="private")
+def get_auth_cache_stats():
+    return jsonify({"success": True, "data": auth_cache_stats()})
+
+@app.route("/admin/auth-cache", methods=["DELETE"])
+@require_token(role="private")
+def clear_auth_cache():
+    # Panggil setelah oauth_clients/users diubah agar perubahan langsung berlaku
+    client_id = request.args.get("client_id")
+    username = request.args.get("username")
+    if username:
+        invalidate_user(username)
+    if client_id or not username:
+        invalidate_client(client_id)
+    if not client_id and not username:
+        invalidate_user()
+    return jsonify({"success": True})
+
+@app.route("/admin/upstream-proxy", methods=["GET"])
+@require_token(role="private")
+def get_upstream_proxy_stats():
+    return jsonify({"success": True, "data": upstream_proxy.stats()})
+
+@app.route("/admin/memory-index", methods=["GET"])
+@require_token(role="private")
+def get_memory_index_stats():
+    return jsonify({"success": True, "data": memory_index.stats()})
+
+@app.route("/admin/memory-index", methods=["DELETE"])
+@require_token(role="private")
+def clear_memory_index():
+    # Snapshot dimuat ulang dari database saat pencarian berikutnya
+    organization_id = request.args.get("organization_id", type=int)
+    memory_index.invalidate(organization_id)
+    return jsonify({"success": True})
+
+@app.route("/admin/vector-index", methods=["GET"])
+@require_token(role="private")
+def get_vector_index_health():
+    try:
+        return jsonify({"success": True, "data": vector_index_health()})
+    except Exception as e:
+        return jsonify({"success": False, "message": "Gagal mengambil status index vektor", "error": str(e)}), 500
+
+@app.route("/admin/vector-index", methods=["POST"])
+@require_token(role="private")
+def manage_vector_index():
+    body = request.get_json(silent=True) or {}
+    action = body.get("action", "create")
+    kind = body.get("kind", "hnsw")
+    organization_id = body.get("organization_id")
+    try:
+        if action == "create":
+            name = create_vector_index(kind, organization_id)
+        elif action == "rebuild":
+            name = rebuild_vector_index(body.get("name") or vector_index_name(kind, organization_id))
+        elif action == "drop":
+            name = drop_vector_index(body.get("name") or vector_index_name(kind, organization_id))
+        elif action == "text-search":
+            # Migrasi kolom tsvector + index GIN untuk retrieval hybrid (ALTER TABLE, jalankan di luar jam sibuk)
+            create_text_search()
+            name = "questions_question_tsv_idx, articles_search_tsv_idx"
+        elif action == "log-indexes":
+            # Index keyset untuk paginasi /log (membaca seluruh tabel log, jalankan di luar jam sibuk)
+            name = create_log_indexes()
+        else:
+            return jsonify({"success": False, "message": f"Action '{action}' tidak dikenal"}), 400
+        return jsonify({"success": True, "action": action, "index": name})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "message": "Gagal mengelola index vektor", "error": str(e)}), 500
+
 @app.route("/delete-article", methods=['POST'])
 @require_token(role="private")
 def clearArticle():
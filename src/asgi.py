@@ -0,0 +1,154 @@
+"""
+Mode serving ASGI.
+
+/ask dan /ask/stream dijalankan native async (LLM lewat ainvoke/astream).
+Query database dan embedding tetap blocking dan berjalan di executor
+ASYNC_BLOCKING_WORKERS thread, dengan koneksi dibatasi DB_POOL_MAX; kedua
+nilai itu yang membatasi jumlah percakapan bersamaan per proses. Route lain
+tetap dilayani aplikasi Flask lewat adapter WSGI -> ASGI.
+
+Belum ada hasil benchmark terhadap layanan asli, ukur dengan bench_ask.py
+sebelum mengganti mode serving.
+
+Menjalankan:
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+"""
+import os, json
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from dotenv import load_dotenv
+
+from app import app, ak_service
+from model.model import writer
+from service.chat import notifier
+
+load_dotenv()
+
+ASGI_MAX_BODY = int(os.getenv("ASGI_MAX_BODY", str(1024 * 1024)))
+
+flask_app = WsgiToAsgi(app)
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > ASGI_MAX_BODY:
+            raise ValueError("Body request terlalu besar")
+        if not message.get("more_body"):
+            return body
+
+
+def _headers(content_type, extra=()):
+    headers = [
+        (b"content-type", content_type.encode()),
+        (b"access-control-allow-origin", b"*"),
+    ]
+    headers.extend(extra)
+    return headers
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload, default=str).encode()
+    await send({"type": "http.response.start", "status": status, "headers": _headers("application/json")})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def parse_json(receive):
+    try:
+        body = json.loads(await read_body(receive) or b"null")
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+async def ask(scope, receive, send):
+    body = await parse_json(receive)
+    if body is None:
+        return await send_json(send, 400, {
+            "success": False,
+            "message": "Invalid JSON format"
+        })
+
+    try:
+        asking = await ak_service.aasking(body)
+        await send_json(send, 200, {"success": True, "data": asking})
+    except Exception as e:
+        await send_json(send, 500, {
+            "success": False,
+            "message": "Gagal mendapatkan jawaban",
+            "error": str(e)
+        })
+
+
+async def ask_stream(scope, receive, send):
+    body = await parse_json(receive)
+    if body is None:
+        return await send_json(send, 400, {
+            "success": False,
+            "message": "Invalid JSON format"
+        })
+    # Format sama dengan Flask: default Server-Sent Events, ?format=ndjson untuk NDJSON
+    query = parse_qs(scope.get("query_string", b"").decode())
+    ndjson = query.get("format", [""])[0] == "ndjson"
+
+    def encode(event, payload):
+        if ndjson:
+            return (json.dumps({"event": event, **payload}, default=str) + "\n").encode()
+        return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n".encode()
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": _headers(
+            "application/x-ndjson" if ndjson else "text/event-stream",
+            [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")],
+        ),
+    })
+    try:
+        async for event, value in ak_service.aasking_stream(body):
+            if event == "token":
+                chunk = encode("token", {"token": value})
+            else:
+                chunk = encode("done", {"success": True, "data": value})
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    except Exception as e:
+        await send({"type": "http.response.body", "more_body": True, "body": encode("error", {
+            "success": False,
+            "message": "Gagal mendapatkan jawaban",
+            "error": str(e)
+        })})
+    await send({"type": "http.response.body", "body": b""})
+
+
+ROUTES = {
+    ("POST", "/ask"): ask,
+    ("POST", "/ask/stream"): ask_stream,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Kosongkan antrian write-behind sebelum proses berhenti
+            writer.shutdown()
+            notifier.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    if scope["type"] == "http":
+        handler = ROUTES.get((scope["method"], scope["path"].rstrip("/") or "/"))
+        if handler:
+            return await handler(scope, receive, send)
+
+    return await flask_app(scope, receive, send)
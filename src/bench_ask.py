@@ -0,0 +1,85 @@
+"""
+Benchmark konkurensi endpoint /ask untuk membandingkan mode sync (Flask) dan
+mode async (ASGI).
+
+Contoh:
+    # sync
+    gunicorn -w 1 --threads 16 app:app -b :5000
+    # async
+    uvicorn asgi:application --port 8000
+
+    python bench_ask.py --url http://localhost:5000/ask --concurrency 50 --requests 500
+    python bench_ask.py --url http://localhost:8000/ask --concurrency 50 --requests 500
+
+Butuh database dan OpenAI asli; hasilnya belum pernah dicatat. Naikkan
+ASYNC_BLOCKING_WORKERS dan DB_POOL_MAX bersama saat menguji konkurensi tinggi.
+"""
+import argparse, asyncio, json, time, uuid
+
+import httpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(url, concurrency, total, organization_id, question, timeout):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def one():
+            nonlocal errors
+            # session_id unik agar setiap request adalah pertanyaan pertama
+            body = {"question": question, "session_id": str(uuid.uuid4()), "organization_id": organization_id}
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    resp = await client.post(url, json=body)
+                    ok = resp.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append((time.perf_counter() - started) * 1000)
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark konkurensi /ask")
+    parser.add_argument("--url", default="http://localhost:5000/ask")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--organization-id", type=int, default=1)
+    parser.add_argument("--question", default="Bagaimana cara mengganti password?")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.concurrency, args.requests,
+                             args.organization_id, args.question, args.timeout))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
 import psycopg2
-import os
+import os, time, threading, collections
 from dotenv import load_dotenv
-import psycopg2.extras 
+import psycopg2.extras
+import psycopg2.pool
 load_dotenv()
 
-def get_connection():
-    return psycopg2.connect(
+# Konfigurasi pool koneksi
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))
+
+
+def _connect_kwargs():
+    return dict(
         host=os.getenv("DB_HOST"),
         port=os.getenv("DB_PORT"),
         database=os.getenv("DB_NAME"),
@@ -13,3 +22,168 @@ def get_connection():
         password=os.getenv("DB_PASSWORD"),
         cursor_factory=psycopg2.extras.RealDictCursor
     )
+
+
+class ConnectionPool:
+    """Pool koneksi thread-safe dengan health check dan batas umur koneksi."""
+
+    def __init__(self, minconn, maxconn, timeout=POOL_TIMEOUT,
+                 max_lifetime=POOL_MAX_LIFETIME, healthcheck_idle=POOL_HEALTHCHECK_IDLE):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.healthcheck_idle = healthcheck_idle
+        # Semaphore membatasi jumlah koneksi yang sedang dipinjam, caller menunggu jika penuh
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._idle = collections.deque()
+        self._created = {}
+        self._last_used = {}
+        for _ in range(minconn):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        conn = psycopg2.connect(**_connect_kwargs())
+        now = time.monotonic()
+        with self._lock:
+            self._created[id(conn)] = now
+            self._last_used[id(conn)] = now
+        return conn
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            created = self._created.get(id(conn), now)
+            last_used = self._last_used.get(id(conn), now)
+        if self.max_lifetime and now - created > self.max_lifetime:
+            return False
+        if now - last_used < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created.pop(id(conn), None)
+            self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError("Pool koneksi penuh, timeout menunggu koneksi")
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return self._connect()
+                if self._is_healthy(conn):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            # Kembalikan koneksi dalam keadaan bersih
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+            with self._lock:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), collections.deque()
+        for conn in idle:
+            self._discard(conn)
+
+
+class PooledConnection:
+    """
+    Pembungkus koneksi dari pool. `close()` mengembalikan koneksi ke pool,
+    dan bisa dipakai sebagai context manager:
+
+        with get_connection() as conn:
+            ...
+    """
+
+    _pool = None
+    _conn = None
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("Koneksi sudah dikembalikan ke pool")
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        # Atribut koneksi (mis. autocommit) harus diset di koneksi psycopg2 aslinya
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+            return
+        if self._conn is None:
+            raise psycopg2.InterfaceError("Koneksi sudah dikembalikan ke pool")
+        setattr(self._conn, name, value)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is not None and self._conn is not None and not self._conn.closed:
+                self._conn.rollback()
+        finally:
+            # Rollback bisa gagal di koneksi mati; slot pool tetap harus dikembalikan
+            self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(POOL_MIN, POOL_MAX)
+    return _pool
+
+
+def get_connection():
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
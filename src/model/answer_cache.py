@@ -0,0 +1,219 @@
+import os, time, threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from connection.connection import get_connection
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_PER_ORG = int(os.getenv("ANSWER_CACHE_MAX_PER_ORG", "1000"))
+# Jeda maksimal sebelum invalidasi dari worker lain (tabel answer_cache_invalidations) terbaca
+ANSWER_CACHE_SYNC_INTERVAL = float(os.getenv("ANSWER_CACHE_SYNC_INTERVAL", "2"))
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """
+    Cache jawaban per organisasi berdasarkan kemiripan embedding pertanyaan.
+    Entri menyimpan id artikel yang dipakai sebagai konteks sehingga bisa
+    di-invalidate saat artikel berubah.
+
+    Entri disimpan per proses. Invalidasi juga dicatat di tabel
+    answer_cache_invalidations dan dibaca worker lain paling lambat
+    `sync_interval` detik kemudian; jika tabel tidak terbaca, lookup dianggap miss.
+    """
+
+    def __init__(self, ttl=ANSWER_CACHE_TTL, max_per_org=ANSWER_CACHE_MAX_PER_ORG,
+                 sync_interval=ANSWER_CACHE_SYNC_INTERVAL):
+        self.ttl = ttl
+        self.max_per_org = max_per_org
+        self.sync_interval = sync_interval
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._table_ready = False
+        # Id invalidasi terakhir yang sudah diterapkan di proses ini (None = belum pernah sync)
+        self._last_seen = None
+        self._synced_at = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.sync_errors = 0
+
+    def _bucket(self, organization_id):
+        return self._buckets.setdefault(organization_id, {"entries": [], "matrix": None})
+
+    def _purge_expired(self, bucket, now):
+        alive = [entry for entry in bucket["entries"] if entry["expires"] > now]
+        if len(alive) != len(bucket["entries"]):
+            bucket["entries"] = alive
+            bucket["matrix"] = None
+
+    def _ensure_table(self, cur):
+        if self._table_ready:
+            return
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache_invalidations (
+                id BIGSERIAL PRIMARY KEY,
+                organization_id INTEGER,
+                article_ids BIGINT[],
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+        """)
+        self._table_ready = True
+
+    def _publish(self, organization_id=None, article_ids=None):
+        # article_ids terisi = invalidasi per artikel; kosong = clear organisasi (atau semua jika org None)
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                self._ensure_table(cur)
+                cur.execute(
+                    "INSERT INTO answer_cache_invalidations (organization_id, article_ids) VALUES (%s, %s)",
+                    (organization_id, None if article_ids is None else list(article_ids)),
+                )
+                # Catatan yang lebih tua dari TTL tidak lagi berpengaruh
+                cur.execute(
+                    "DELETE FROM answer_cache_invalidations WHERE created_at < NOW() - make_interval(secs => %s)",
+                    (self.ttl * 2,),
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"❌ Gagal mencatat invalidasi answer cache, worker lain tetap memakai cache lama: {e}")
+
+    def sync(self, force=False):
+        """Terapkan invalidasi dari worker lain. False jika tabel invalidasi tidak bisa dibaca."""
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return True
+        with self._sync_lock:
+            if not force and self._synced_at is not None and time.monotonic() - self._synced_at < self.sync_interval:
+                return True
+            try:
+                with get_connection() as conn, conn.cursor() as cur:
+                    self._ensure_table(cur)
+                    if self._last_seen is None:
+                        cur.execute("SELECT coalesce(max(id), 0) AS id FROM answer_cache_invalidations")
+                        rows, last_seen = [], cur.fetchone()["id"]
+                    else:
+                        cur.execute("""
+                            SELECT id, organization_id, article_ids
+                            FROM answer_cache_invalidations
+                            WHERE id > %s
+                            ORDER BY id
+                        """, (self._last_seen,))
+                        rows = cur.fetchall()
+                        last_seen = rows[-1]["id"] if rows else self._last_seen
+                    conn.commit()
+            except Exception as e:
+                with self._lock:
+                    self.sync_errors += 1
+                print(f"❌ Gagal membaca invalidasi answer cache: {e}")
+                return False
+            if self._last_seen is None:
+                # Sync pertama: entri lokal belum pernah divalidasi, mulai dari kosong
+                self._clear_local(None)
+            for row in rows:
+                if row["article_ids"] is not None:
+                    self._invalidate_local(row["article_ids"])
+                else:
+                    self._clear_local(row["organization_id"])
+            self._last_seen = last_seen
+            self._synced_at = time.monotonic()
+            return True
+
+    def lookup(self, organization_id, vector, threshold=ANSWER_CACHE_THRESHOLD):
+        query = _normalize(vector)
+        if not self.sync():
+            # Tidak bisa memastikan entri masih valid: jawab dari pipeline, bukan dari cache
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            bucket = self._buckets.get(organization_id)
+            if bucket:
+                self._purge_expired(bucket, time.monotonic())
+            if not bucket or not bucket["entries"]:
+                self.misses += 1
+                return None
+            if bucket["matrix"] is None:
+                bucket["matrix"] = np.vstack([entry["vector"] for entry in bucket["entries"]])
+            similarities = bucket["matrix"] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = bucket["entries"][best]
+            return dict(entry["value"], cache_similarity=float(similarities[best]))
+
+    def store(self, organization_id, vector, value, article_ids=()):
+        entry = {
+            "vector": _normalize(vector),
+            "value": value,
+            "article_ids": set(article_ids),
+            "expires": time.monotonic() + self.ttl,
+        }
+        with self._lock:
+            bucket = self._bucket(organization_id)
+            bucket["entries"].append(entry)
+            # Buang entri terlama jika melebihi kapasitas
+            if len(bucket["entries"]) > self.max_per_org:
+                bucket["entries"] = bucket["entries"][-self.max_per_org:]
+            bucket["matrix"] = None
+
+    def invalidate_articles(self, article_ids):
+        article_ids = {article_id for article_id in article_ids if article_id is not None}
+        if not article_ids:
+            return
+        self._invalidate_local(article_ids)
+        self._publish(article_ids=sorted(article_ids))
+
+    def _invalidate_local(self, article_ids):
+        article_ids = set(article_ids)
+        with self._lock:
+            for bucket in self._buckets.values():
+                alive = [entry for entry in bucket["entries"] if not entry["article_ids"] & article_ids]
+                if len(alive) != len(bucket["entries"]):
+                    self.invalidations += len(bucket["entries"]) - len(alive)
+                    bucket["entries"] = alive
+                    bucket["matrix"] = None
+
+    def clear(self, organization_id=None):
+        self._clear_local(organization_id)
+        self._publish(organization_id=organization_id)
+
+    def _clear_local(self, organization_id=None):
+        with self._lock:
+            if organization_id is None:
+                self.invalidations += sum(len(b["entries"]) for b in self._buckets.values())
+                self._buckets.clear()
+            else:
+                bucket = self._buckets.pop(organization_id, None)
+                if bucket:
+                    self.invalidations += len(bucket["entries"])
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": ANSWER_CACHE_ENABLED,
+                "entries": {str(org): len(b["entries"]) for org, b in self._buckets.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "sync_errors": self.sync_errors,
+                "last_invalidation_id": self._last_seen,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,209 @@
+import os, re, hashlib, threading, traceback
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from connection.connection import get_connection
+from model.embedding import embed_query, iter_embedded_chunks, EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+from model.settings import estimate_tokens
+
+load_dotenv()
+
+# Potongan artikel untuk konteks jawaban
+CHUNKING_ENABLED = os.getenv("CHUNKING_ENABLED", "1") == "1"
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+# Jumlah potongan maksimal per artikel yang dimasukkan ke prompt
+CHUNKS_PER_ARTICLE = int(os.getenv("CHUNKS_PER_ARTICLE", "3"))
+# Dimensi embedding (text-embedding-3-small = 1536), dibutuhkan index HNSW
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "1536"))
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+
+def _units(content: str, max_chars: int):
+    # Paragraf/kalimat sebagai satuan, satuan yang terlalu panjang dipotong per karakter
+    for unit in _SENTENCE.split(content or ""):
+        unit = " ".join(unit.split())
+        while len(unit) > max_chars:
+            yield unit[:max_chars]
+            unit = unit[max_chars:]
+        if unit:
+            yield unit
+
+
+def split_article(content: str, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Membagi isi artikel menjadi potongan ~chunk_tokens token yang saling tumpang tindih."""
+    max_chars = max(1, chunk_tokens) * 4
+    overlap_chars = max(0, overlap_tokens) * 4
+    chunks = []
+    current = []
+    size = 0
+    for unit in _units(content, max_chars):
+        if current and size + len(unit) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            # Bawa kalimat terakhir ke potongan berikutnya sebagai overlap
+            carried = []
+            carried_size = 0
+            for prev in reversed(current):
+                if carried_size + len(prev) > overlap_chars:
+                    break
+                carried.insert(0, prev)
+                carried_size += len(prev) + 1
+            current, size = carried, carried_size
+        current.append(unit)
+        size += len(unit) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _ensure_table(cur):
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS article_chunks (
+                article_id BIGINT NOT NULL REFERENCES articles(id) ON DELETE CASCADE,
+                chunk_index INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                embedding vector({EMBED_DIMENSIONS}) NOT NULL,
+                content_hash TEXT,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (article_id, chunk_index)
+            )
+        """)
+        # Hash isi artikel saat potongan dibuat; potongan dengan hash berbeda sudah basi
+        cur.execute("ALTER TABLE article_chunks ADD COLUMN IF NOT EXISTS content_hash TEXT")
+        # Pencarian selalu per artikel (beberapa potongan saja) lewat primary key,
+        # index ANN di seluruh tabel tidak terpakai dan hanya menambah biaya tulis
+        cur.execute("DROP INDEX IF EXISTS article_chunks_embedding_hnsw_idx")
+        _table_ready = True
+
+
+def content_hash(content):
+    # Sama dengan md5(coalesce(content, '')) di Postgres (database UTF-8)
+    return hashlib.md5((content or "").encode("utf-8")).hexdigest()
+
+
+def index_articles(articles, batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY):
+    """
+    Membuat ulang potongan + embedding untuk `articles` (dict berisi id, title, content).
+    Embedding dikirim per batch; potongan yang isinya tidak berubah diambil dari cache embedding.
+    """
+    rows = []
+    for article in articles:
+        title = article.get("title") or ""
+        digest = content_hash(article.get("content"))
+        for index, text in enumerate(split_article(article.get("content") or "")):
+            # Judul ikut di-embed agar potongan tetap punya konteks
+            rows.append((article["id"], index, text, f"{title}\n{text}", digest))
+    article_ids = list({article["id"] for article in articles})
+
+    vectors = [None] * len(rows)
+    for offset, chunk_vectors in iter_embedded_chunks([row[3] for row in rows], batch_size, concurrency):
+        vectors[offset:offset + len(chunk_vectors)] = chunk_vectors
+
+    with get_connection() as conn, conn.cursor() as cur:
+        _ensure_table(cur)
+        cur.execute("DELETE FROM article_chunks WHERE article_id = ANY(%s)", (article_ids,))
+        if rows:
+            execute_values(
+                cur,
+                "INSERT INTO article_chunks (article_id, chunk_index, content, embedding, content_hash) VALUES %s",
+                [(row[0], row[1], row[2], vector, row[4]) for row, vector in zip(rows, vectors)],
+                template="(%s, %s, %s, %s::vector, %s)",
+                page_size=500,
+            )
+        conn.commit()
+    return len(rows)
+
+
+def drop_chunks(article_ids):
+    with get_connection() as conn, conn.cursor() as cur:
+        _ensure_table(cur)
+        cur.execute("DELETE FROM article_chunks WHERE article_id = ANY(%s)", (list(article_ids),))
+        conn.commit()
+
+
+def safe_index_articles(articles):
+    # Kegagalan chunking tidak menggagalkan simpan artikel, ask() memakai isi penuh sebagai cadangan
+    if not CHUNKING_ENABLED or not articles:
+        return 0
+    try:
+        return index_articles(articles)
+    except Exception:
+        print("❌ Gagal membuat potongan artikel:")
+        traceback.print_exc()
+    # Potongan lama berisi teks sebelum artikel diubah, hapus agar tidak masuk prompt
+    try:
+        drop_chunks({article["id"] for article in articles})
+    except Exception as e:
+        # relevant_chunks tetap melewati potongan yang hash-nya tidak cocok
+        print(f"❌ Gagal menghapus potongan artikel lama: {e}")
+    return 0
+
+
+def relevant_chunks(text: str, article_ids, per_article=CHUNKS_PER_ARTICLE):
+    """Potongan paling mirip dengan `text` per artikel: {article_id: [isi, ...]} urut sesuai posisi di artikel."""
+    if not CHUNKING_ENABLED or not article_ids:
+        return {}
+    q_vector = embed_query(text)
+    # Per artikel: ambil potongan lewat primary key (article_id, chunk_index) lalu urutkan jaraknya.
+    # Potongan yang dibuat dari isi artikel versi lama (hash berbeda) dilewati
+    query = """
+        SELECT c.article_id, c.chunk_index, c.content
+        FROM unnest(%(article_ids)s::bigint[]) AS ids(article_id)
+        JOIN articles a ON a.id = ids.article_id
+        CROSS JOIN LATERAL (
+            SELECT article_id, chunk_index, content
+            FROM article_chunks
+            WHERE article_id = ids.article_id
+              AND content_hash = md5(coalesce(a.content, ''))
+            ORDER BY embedding <=> %(vector)s::vector
+            LIMIT %(per_article)s
+        ) c
+        ORDER BY c.article_id, c.chunk_index
+    """
+    with get_connection() as conn, conn.cursor() as cur:
+        _ensure_table(cur)
+        cur.execute(query, {"vector": q_vector, "article_ids": list(article_ids), "per_article": per_article})
+        rows = cur.fetchall()
+        conn.commit()
+
+    chunks = {}
+    for row in rows:
+        chunks.setdefault(row["article_id"], []).append(row["content"])
+    return chunks
+
+
+def attach_chunks(q_data, text: str):
+    # Menambahkan "chunks" ke setiap artikel hasil match_question; artikel tanpa potongan tetap memakai isi penuh
+    article_ids = {
+        article["id"]
+        for entry in q_data or []
+        for article in entry.get("articles") or []
+        if isinstance(article, dict) and "id" in article
+        and estimate_tokens(article.get("content")) > CHUNK_TOKENS
+    }
+    if not article_ids:
+        return q_data
+    try:
+        chunks = relevant_chunks(text, article_ids)
+    except Exception as e:
+        print(f"❌ Gagal mengambil potongan artikel, memakai isi penuh: {e}")
+        return q_data
+    return [
+        dict(entry, articles=[
+            dict(article, chunks=chunks[article["id"]])
+            if isinstance(article, dict) and article.get("id") in chunks else article
+            for article in entry.get("articles") or []
+        ])
+        for entry in q_data
+    ]
@@ -0,0 +1,90 @@
+import os, threading
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from model.settings import org_setting
+
+load_dotenv()
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.3"))
+
+# Transport HTTP bersama (keep-alive) untuk seluruh client OpenAI
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "60"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+
+_lock = threading.RLock()
+_http_client = None
+_http_async_client = None
+_llms = {}
+_embeddings = {}
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+
+
+def http_client():
+    global _http_client
+    if _http_client is None:
+        with _lock:
+            if _http_client is None:
+                _http_client = httpx.Client(limits=_limits(), timeout=_timeout())
+    return _http_client
+
+
+def http_async_client():
+    global _http_async_client
+    if _http_async_client is None:
+        with _lock:
+            if _http_async_client is None:
+                _http_async_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+    return _http_async_client
+
+
+def get_llm(organization_id=None):
+    # Model & temperature bisa diatur per organisasi lewat ORG_SETTINGS (llm_model, llm_temperature)
+    model = org_setting(organization_id, "llm_model", LLM_MODEL)
+    temperature = float(org_setting(organization_id, "llm_temperature", LLM_TEMPERATURE))
+    key = (model, temperature)
+    llm = _llms.get(key)
+    if llm is None:
+        with _lock:
+            llm = _llms.get(key)
+            if llm is None:
+                llm = ChatOpenAI(
+                    model=model,
+                    temperature=temperature,
+                    http_client=http_client(),
+                    http_async_client=http_async_client(),
+                )
+                _llms[key] = llm
+    return llm
+
+
+def get_embeddings(model):
+    embeddings = _embeddings.get(model)
+    if embeddings is None:
+        with _lock:
+            embeddings = _embeddings.get(model)
+            if embeddings is None:
+                embeddings = OpenAIEmbeddings(
+                    model=model,
+                    http_client=http_client(),
+                    http_async_client=http_async_client(),
+                )
+                _embeddings[model] = embeddings
+    return embeddings
@@ -0,0 +1,197 @@
+import os, hashlib, threading, unicodedata, traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from connection.connection import get_connection
+from model.cache import TTLCache
+from model.clients import get_embeddings
+
+load_dotenv()
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "5000"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+# Tier persisten di Postgres, TTL dalam hari (0 = tidak pernah kedaluwarsa)
+EMBED_CACHE_DB = os.getenv("EMBED_CACHE_DB", "1") == "1"
+EMBED_CACHE_DB_TTL_DAYS = int(os.getenv("EMBED_CACHE_DB_TTL_DAYS", "30"))
+# Ukuran batch dan jumlah request embedding paralel untuk ingest massal
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split())
+
+
+def _digest(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache embedding berbasis konten: LRU di memori proses di depan
+    tabel `embedding_cache` di Postgres. Kunci = (model, teks ternormalisasi).
+    """
+
+    def __init__(self, maxsize=EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL,
+                 use_db=EMBED_CACHE_DB, db_ttl_days=EMBED_CACHE_DB_TTL_DAYS):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.use_db = use_db
+        self.db_ttl_days = db_ttl_days
+        self.db_hits = 0
+        self.db_misses = 0
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _ensure_table(self, cur):
+        if self._table_ready:
+            return
+        with self._lock:
+            if self._table_ready:
+                return
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding DOUBLE PRECISION[] NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS embedding_cache_created_at_idx
+                ON embedding_cache (created_at)
+            """)
+            self._table_ready = True
+
+    def _db_get_many(self, model, digests):
+        query = """
+            SELECT text_hash, embedding
+            FROM embedding_cache
+            WHERE model = %s
+                AND text_hash = ANY(%s)
+                AND (%s = 0 OR created_at >= NOW() - make_interval(days => %s))
+        """
+        with get_connection() as conn, conn.cursor() as cur:
+            self._ensure_table(cur)
+            cur.execute(query, (model, list(digests), self.db_ttl_days, self.db_ttl_days))
+            rows = cur.fetchall()
+            conn.commit()
+        return {row["text_hash"]: list(row["embedding"]) for row in rows}
+
+    def _db_put_many(self, model, items):
+        query = """
+            INSERT INTO embedding_cache (model, text_hash, embedding)
+            VALUES %s
+            ON CONFLICT (model, text_hash)
+                DO UPDATE SET embedding = EXCLUDED.embedding, created_at = NOW()
+        """
+        with get_connection() as conn, conn.cursor() as cur:
+            self._ensure_table(cur)
+            execute_values(cur, query, [(model, d, v) for d, v in items.items()])
+            conn.commit()
+
+    def get_many(self, model, texts):
+        """Mengembalikan {teks: vektor} untuk teks yang sudah ada di cache."""
+        found = {}
+        pending = {}
+        for text in texts:
+            digest = _digest(model, text)
+            vector = self.memory.get(digest)
+            if vector is not None:
+                found[text] = vector
+            else:
+                pending[digest] = text
+
+        if pending and self.use_db:
+            try:
+                rows = self._db_get_many(model, pending.keys())
+            except Exception:
+                print("❌ Error saat membaca embedding_cache:")
+                traceback.print_exc()
+                rows = {}
+            with self._lock:
+                self.db_hits += len(rows)
+                self.db_misses += len(pending) - len(rows)
+            for digest, vector in rows.items():
+                self.memory.set(digest, vector)
+                found[pending[digest]] = vector
+        return found
+
+    def put_many(self, model, vectors):
+        """Menyimpan {teks: vektor} ke LRU dan tier persisten."""
+        items = {_digest(model, text): vector for text, vector in vectors.items()}
+        for digest, vector in items.items():
+            self.memory.set(digest, vector)
+        if items and self.use_db:
+            try:
+                self._db_put_many(model, items)
+            except Exception:
+                print("❌ Error saat menyimpan embedding_cache:")
+                traceback.print_exc()
+
+    def purge_expired(self):
+        if not self.use_db or not self.db_ttl_days:
+            return 0
+        with get_connection() as conn, conn.cursor() as cur:
+            self._ensure_table(cur)
+            cur.execute(
+                "DELETE FROM embedding_cache WHERE created_at < NOW() - make_interval(days => %s)",
+                (self.db_ttl_days,)
+            )
+            deleted = cur.rowcount
+            conn.commit()
+        return deleted
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update({
+            "db_enabled": self.use_db,
+            "db_hits": self.db_hits,
+            "db_misses": self.db_misses,
+        })
+        return stats
+
+
+embedding_cache = EmbeddingCache()
+
+
+def embed_documents(texts, model=EMBEDDING_MODEL):
+    """Embedding banyak teks sekaligus, hanya teks yang belum ada di cache dikirim ke OpenAI."""
+    texts = [normalize_text(t) for t in texts]
+    unique = list(dict.fromkeys(texts))
+    found = embedding_cache.get_many(model, unique)
+    missing = [t for t in unique if t not in found]
+    if missing:
+        vectors = dict(zip(missing, get_embeddings(model).embed_documents(missing)))
+        embedding_cache.put_many(model, vectors)
+        found.update(vectors)
+    return [found[t] for t in texts]
+
+
+def embed_query(text, model=EMBEDDING_MODEL):
+    return embed_documents([text], model=model)[0]
+
+
+def iter_embedded_chunks(texts, chunk_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY, model=EMBEDDING_MODEL):
+    """
+    Membagi `texts` menjadi potongan berukuran `chunk_size` dan meng-embed
+    maksimal `concurrency` potongan sekaligus. Menghasilkan (offset, vektor)
+    per potongan sesuai urutan input.
+    """
+    chunk_size = max(1, int(chunk_size))
+    concurrency = max(1, int(concurrency))
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if not chunks:
+        return
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(chunks))) as executor:
+        futures = [executor.submit(embed_documents, chunk, model) for chunk in chunks]
+        try:
+            for index, future in enumerate(futures):
+                yield index * chunk_size, future.result()
+        finally:
+            for future in futures:
+                future.cancel()
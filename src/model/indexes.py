@@ -0,0 +1,254 @@
+import os, time, threading
+
+from dotenv import load_dotenv
+from psycopg2 import sql
+
+from connection.connection import get_connection
+
+load_dotenv()
+
+# Parameter index ANN (pgvector) untuk questions.question_vector
+VECTOR_INDEX_KIND = os.getenv("VECTOR_INDEX_KIND", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+# Query yang difilter (mis. per organisasi) membuang hasil index setelah scan,
+# ef_search lebih besar agar organisasi kecil tetap mendapat k baris
+HNSW_FILTERED_EF_SEARCH = int(os.getenv("HNSW_FILTERED_EF_SEARCH", "200"))
+# pgvector >= 0.8: "relaxed_order"/"strict_order" melanjutkan scan sampai LIMIT terpenuhi (kosong = nonaktif)
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "")
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# Jumlah kandidat tetangga terdekat yang diambil sebelum join ke artikel
+ANN_CANDIDATES = int(os.getenv("ANN_CANDIDATES", "10"))
+
+INDEX_KINDS = ("hnsw", "ivfflat")
+
+# Konfigurasi full-text search. Postgres tidak punya konfigurasi bahasa Indonesia,
+# "simple" (tanpa stemming) cocok untuk kode produk, nama paket, singkatan.
+TEXT_SEARCH_CONFIG = os.getenv("TEXT_SEARCH_CONFIG", "simple")
+
+TEXT_SEARCH_RETRY_AFTER = float(os.getenv("TEXT_SEARCH_RETRY_AFTER", "300"))
+
+_text_search_ready = False
+_text_search_failed_at = None
+_text_search_lock = threading.Lock()
+
+
+def vector_index_name(kind=VECTOR_INDEX_KIND, organization_id=None):
+    if organization_id is None:
+        return f"questions_question_vector_{kind}_idx"
+    return f"questions_question_vector_{kind}_org{int(organization_id)}_idx"
+
+
+def apply_search_params(cur, ef_search=None, probes=None, filtered=False):
+    # Berlaku hanya untuk transaksi berjalan (is_local = true)
+    default_ef = HNSW_FILTERED_EF_SEARCH if filtered else HNSW_EF_SEARCH
+    cur.execute(
+        "SELECT set_config('hnsw.ef_search', %s, true), set_config('ivfflat.probes', %s, true)",
+        (str(ef_search or default_ef), str(probes or IVFFLAT_PROBES))
+    )
+    if filtered and HNSW_ITERATIVE_SCAN:
+        cur.execute("SELECT set_config('hnsw.iterative_scan', %s, true)", (HNSW_ITERATIVE_SCAN,))
+
+
+def create_vector_index(kind=VECTOR_INDEX_KIND, organization_id=None):
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Jenis index tidak dikenal: {kind}")
+
+    name = vector_index_name(kind, organization_id)
+    if kind == "hnsw":
+        options = sql.SQL("WITH (m = {}, ef_construction = {})").format(
+            sql.Literal(HNSW_M), sql.Literal(HNSW_EF_CONSTRUCTION))
+    else:
+        options = sql.SQL("WITH (lists = {})").format(sql.Literal(IVFFLAT_LISTS))
+
+    where = sql.SQL("")
+    if organization_id is not None:
+        # Index parsial per organisasi
+        where = sql.SQL("WHERE organization_id = {}").format(sql.Literal(int(organization_id)))
+
+    query = sql.SQL("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}
+        ON questions USING {method} (question_vector vector_cosine_ops)
+        {options} {where}
+    """).format(name=sql.Identifier(name), method=sql.SQL(kind), options=options, where=where)
+
+    # CREATE INDEX CONCURRENTLY tidak boleh berada di dalam transaksi
+    with get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(query)
+    return name
+
+
+def rebuild_vector_index(name):
+    with get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("REINDEX INDEX CONCURRENTLY {}").format(sql.Identifier(name)))
+    return name
+
+
+def drop_vector_index(name):
+    with get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(name)))
+    return name
+
+
+def text_search_available():
+    """
+    True jika kolom tsvector sudah dibuat lewat migrasi (create_text_search).
+    Jalur request hanya mengecek keberadaan kolom, tidak pernah mengubah skema.
+    """
+    global _text_search_ready, _text_search_failed_at
+    if _text_search_ready:
+        return True
+    # Hasil negatif disimpan sebentar agar tidak query information_schema di setiap request
+    if _text_search_failed_at and time.monotonic() - _text_search_failed_at < TEXT_SEARCH_RETRY_AFTER:
+        return False
+    with _text_search_lock:
+        if _text_search_ready:
+            return True
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT count(*) AS total FROM information_schema.columns
+                    WHERE (table_name, column_name) IN (('questions', 'question_tsv'), ('articles', 'search_tsv'))
+                """)
+                ready = cur.fetchone()["total"] == 2
+        except Exception as e:
+            print(f"❌ Gagal mengecek kolom full-text search: {e}")
+            ready = False
+        if not ready:
+            if _text_search_failed_at is None:
+                print("❌ Kolom full-text search belum ada, retrieval memakai vektor saja. Jalankan: python -m model.indexes text-search")
+            _text_search_failed_at = time.monotonic()
+            return False
+        _text_search_ready = True
+        return True
+
+
+def create_text_search():
+    """
+    Migrasi: kolom tsvector (generated, otomatis ikut ter-update saat insert/update) dan
+    index GIN untuk questions.question serta articles.title/content. ALTER TABLE menulis
+    ulang tabel (ACCESS EXCLUSIVE lock), jadi dijalankan lewat admin/CLI, bukan dari request.
+    """
+    global _text_search_ready, _text_search_failed_at
+    config = sql.Literal(TEXT_SEARCH_CONFIG)
+    with get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT table_name FROM information_schema.columns
+                WHERE (table_name, column_name) IN (('questions', 'question_tsv'), ('articles', 'search_tsv'))
+            """)
+            existing = {row["table_name"] for row in cur.fetchall()}
+            # ALTER TABLE hanya jika kolom belum ada (menulis ulang tabel)
+            if "questions" not in existing:
+                cur.execute(sql.SQL("""
+                    ALTER TABLE questions ADD COLUMN IF NOT EXISTS question_tsv tsvector
+                    GENERATED ALWAYS AS (to_tsvector({config}::regconfig, coalesce(question, ''))) STORED
+                """).format(config=config))
+            if "articles" not in existing:
+                cur.execute(sql.SQL("""
+                    ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_tsv tsvector
+                    GENERATED ALWAYS AS (
+                        setweight(to_tsvector({config}::regconfig, coalesce(title, '')), 'A') ||
+                        setweight(to_tsvector({config}::regconfig, coalesce(content, '')), 'B')
+                    ) STORED
+                """).format(config=config))
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS questions_question_tsv_idx ON questions USING gin (question_tsv)")
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS articles_search_tsv_idx ON articles USING gin (search_tsv)")
+    with _text_search_lock:
+        _text_search_ready = True
+        _text_search_failed_at = None
+
+
+def create_log_indexes():
+    """
+    Migrasi: index keyset (time, id) untuk paginasi /log dan /log/export. Tabel log besar,
+    CREATE INDEX CONCURRENTLY tetap membaca seluruh tabel, jadi dijalankan lewat admin/CLI.
+    """
+    with get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS log_time_id_idx ON log (time DESC, id DESC)")
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS log_org_time_id_idx ON log (organization_id, time DESC, id DESC)")
+            cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS log_session_time_id_idx ON log (session_id, time DESC, id DESC)")
+    return "log_time_id_idx, log_org_time_id_idx, log_session_time_id_idx"
+
+
+def vector_index_health():
+    with get_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT
+                i.indexrelid::regclass::text AS name,
+                am.amname AS method,
+                i.indisvalid AS valid,
+                i.indisready AS ready,
+                pg_relation_size(i.indexrelid) AS size_bytes,
+                pg_size_pretty(pg_relation_size(i.indexrelid)) AS size,
+                COALESCE(s.idx_scan, 0) AS scans,
+                pg_get_indexdef(i.indexrelid) AS definition
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = i.indexrelid
+            WHERE i.indrelid = 'questions'::regclass
+                AND am.amname IN ('hnsw', 'ivfflat')
+            ORDER BY name
+        """)
+        indexes = cur.fetchall()
+
+        cur.execute("""
+            SELECT
+                n_live_tup AS live_rows,
+                n_dead_tup AS dead_rows,
+                last_vacuum,
+                last_autovacuum,
+                last_analyze,
+                last_autoanalyze
+            FROM pg_stat_user_tables
+            WHERE relid = 'questions'::regclass
+        """)
+        table = cur.fetchone() or {}
+
+    warnings = []
+    if not indexes:
+        warnings.append("Tidak ada index ANN pada questions.question_vector, pencarian memakai sequential scan")
+    for index in indexes:
+        if not index["valid"]:
+            warnings.append(f"Index {index['name']} tidak valid (build CONCURRENTLY gagal), perlu rebuild")
+        if index["method"] == "ivfflat" and table.get("live_rows"):
+            # Rekomendasi pgvector: lists ~ rows / 1000
+            recommended = max(10, table["live_rows"] // 1000)
+            if IVFFLAT_LISTS > 4 * recommended or IVFFLAT_LISTS * 4 < recommended:
+                warnings.append(f"Index {index['name']}: lists={IVFFLAT_LISTS}, rekomendasi sekitar {recommended}")
+
+    return {
+        "indexes": indexes,
+        "table": table,
+        "search_params": {
+            "hnsw.ef_search": HNSW_EF_SEARCH,
+            "hnsw.ef_search_filtered": HNSW_FILTERED_EF_SEARCH,
+            "hnsw.iterative_scan": HNSW_ITERATIVE_SCAN or "off",
+            "ivfflat.probes": IVFFLAT_PROBES,
+        },
+        "warnings": warnings,
+    }
+
+
+# Migrasi manual: python -m model.indexes text-search | log-indexes
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["text-search"]:
+        create_text_search()
+        print("Kolom tsvector dan index GIN full-text search siap")
+    elif sys.argv[1:] == ["log-indexes"]:
+        print(f"Index log siap: {create_log_indexes()}")
+    else:
+        print("Pemakaian: python -m model.indexes text-search | log-indexes")
@@ -0,0 +1,82 @@
+import os, re
+
+from dotenv import load_dotenv
+
+from model.cache import TTLCache
+from model.embedding import normalize_text
+
+load_dotenv()
+
+# Bahasa yang dipakai index artikel/pertanyaan
+INDEX_LANGUAGE = os.getenv("INDEX_LANGUAGE", "id")
+# Selisih skor minimal agar bahasa dianggap terdeteksi
+LANG_DETECT_MARGIN = float(os.getenv("LANG_DETECT_MARGIN", "1"))
+TRANSLATE_CACHE_SIZE = int(os.getenv("TRANSLATE_CACHE_SIZE", "5000"))
+TRANSLATE_CACHE_TTL = float(os.getenv("TRANSLATE_CACHE_TTL", "86400"))
+
+_ID_WORDS = set("""
+    ada adalah agar akan aku anda apa apakah atau bagaimana bagi bahwa baru bapak belum berapa
+    bisa boleh bu buat bukan cara dan dapat dari dengan di dia dimana ga gak gimana hari harus
+    ibu ini itu jadi jam jika juga kak kalau kami kamu kan kapan karena ke kenapa kok lagi
+    lewat mana masih mau melalui mengapa mereka min minta mohon nya pada pak para perlu saat saja
+    sama sampai saya sebelum sedang sejak selama sesudah setelah siapa sih silakan sudah supaya
+    tahun tapi tetapi tidak tolong untuk yang ya yg dgn utk tdk gk udah belom banget dong deh
+    bulan gaji karyawan cuti lembur absen tagihan bayar daftar lupa kata sandi ganti ubah hapus
+    tambah lihat cek gangguan internet lambat mati pasang berlangganan paket harga
+    halo hai terima kasih selamat pagi siang sore malam
+""".split())
+
+_EN_WORDS = set("""
+    a about after all am an and any are as at be because been before being but by can could
+    did do does doing for from had has have he her his how i if in into is it its just me my
+    no not of on or our please she should so than that the their them then there these they
+    this those to up was we were what when where which who why will with would you your
+    account bill change check delete employee forgot help leave login overtime password pay
+    payment register reset salary show slow update
+""".split())
+
+_ID_AFFIXES = re.compile(r"^(me|mem|men|meng|meny|ber|di|ter|pe|pen|pem|peng)\w{3,}|\w{3,}(kan|nya|lah|kah)$")
+_TOKEN = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def language_scores(text: str) -> dict:
+    tokens = _TOKEN.findall((text or "").lower())
+    scores = {"id": 0.0, "en": 0.0}
+    for token in tokens:
+        in_id = token in _ID_WORDS
+        in_en = token in _EN_WORDS
+        if in_id and not in_en:
+            scores["id"] += 1
+        elif in_en and not in_id:
+            scores["en"] += 1
+        elif not in_id and not in_en and _ID_AFFIXES.match(token):
+            # Kata berimbuhan khas Indonesia (menggunakan, dibayar, gajinya)
+            scores["id"] += 0.5
+    return scores
+
+
+def detect_language(text: str) -> str:
+    """Deteksi bahasa lokal (tanpa network): 'id', 'en', atau 'unknown'."""
+    scores = language_scores(text)
+    if scores["id"] - scores["en"] >= LANG_DETECT_MARGIN:
+        return "id"
+    if scores["en"] - scores["id"] >= LANG_DETECT_MARGIN:
+        return "en"
+    return "unknown"
+
+
+def needs_translation(text: str) -> bool:
+    # Hanya dilewati jika yakin sudah bahasa index dan tidak ada kata khas bahasa lain;
+    # kalimat campuran ("cara change password") tetap diterjemahkan
+    scores = language_scores(text)
+    if any(score > 0 for lang, score in scores.items() if lang != INDEX_LANGUAGE):
+        return True
+    return detect_language(text) != INDEX_LANGUAGE
+
+
+# Cache hasil terjemahan per teks ternormalisasi
+translation_cache = TTLCache(maxsize=TRANSLATE_CACHE_SIZE, ttl=TRANSLATE_CACHE_TTL)
+
+
+def translation_key(text: str) -> str:
+    return normalize_text(text).lower()
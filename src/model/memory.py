@@ -0,0 +1,226 @@
+import os, json, time, uuid, threading
+
+from dotenv import load_dotenv
+
+from connection.connection import get_connection
+from model.settings import estimate_tokens
+
+load_dotenv()
+
+# Memori percakapan per (session_id, organization_id) dengan batas token
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "800"))
+MEMORY_RESPONSE_TOKENS = int(os.getenv("MEMORY_RESPONSE_TOKENS", "150"))
+MEMORY_TTL_HOURS = int(os.getenv("MEMORY_TTL_HOURS", "24"))
+# Sesi lama yang belum punya memori diisi dari tabel history (sekali saja)
+MEMORY_SEED_FROM_HISTORY = os.getenv("MEMORY_SEED_FROM_HISTORY", "1") == "1"
+MEMORY_SEED_LIMIT = int(os.getenv("MEMORY_SEED_LIMIT", "10"))
+# Giliran yang masih di write-behind queue ikut dibaca load() selama maksimal ini (detik)
+MEMORY_PENDING_TTL = float(os.getenv("MEMORY_PENDING_TTL", "120"))
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    text = " ".join((text or "").split())
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "…"
+
+
+def make_turn(question: str, response: str, turn_id=None) -> dict:
+    turn = {
+        "question": _clip(question, MEMORY_RESPONSE_TOKENS),
+        "response": _clip(response, MEMORY_RESPONSE_TOKENS),
+    }
+    # id dipakai load() untuk mengenali giliran pending yang sudah tersimpan
+    if turn_id:
+        turn["id"] = turn_id
+    return turn
+
+
+def render_turns(turns) -> str:
+    return "\n".join(f"User: {t['question']}\nNaila: {t['response']}" for t in turns)
+
+
+def fit_budget(turns, token_budget: int):
+    # Buang giliran paling lama sampai muat di budget, giliran terbaru selalu disimpan
+    turns = list(turns)
+    while len(turns) > 1 and estimate_tokens(render_turns(turns)) > token_budget:
+        turns.pop(0)
+    return turns
+
+
+class SessionMemory:
+    """
+    Memori bergulir per sesi di tabel `session_memory`. Setiap jawaban hanya
+    menambahkan giliran terbaru lalu memangkas giliran lama sesuai budget token,
+    jadi biayanya tetap (O(1)) berapa pun panjang percakapan.
+    """
+
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET, ttl_hours=MEMORY_TTL_HOURS,
+                 seed_from_history=MEMORY_SEED_FROM_HISTORY):
+        self.token_budget = token_budget
+        self.ttl_hours = ttl_hours
+        self.seed_from_history = seed_from_history
+        self._lock = threading.Lock()
+        self._table_ready = False
+        # Giliran yang belum tersimpan: (session_id, organization_id) -> [(id, waktu, turn)]
+        self._pending = {}
+
+    def _ensure_table(self, cur):
+        if self._table_ready:
+            return
+        with self._lock:
+            if self._table_ready:
+                return
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS session_memory (
+                    session_id TEXT NOT NULL,
+                    organization_id INTEGER NOT NULL,
+                    turns JSONB NOT NULL DEFAULT '[]'::jsonb,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (session_id, organization_id)
+                )
+            """)
+            cur.execute("""
+                CREATE INDEX IF NOT EXISTS session_memory_updated_at_idx
+                ON session_memory (updated_at)
+            """)
+            self._table_ready = True
+
+    def _seed(self, cur, session_id, organization_id, before=None):
+        # Riwayat lama dari tabel history (urutan lama -> baru)
+        cur.execute("""
+            SELECT question, response
+            FROM history
+            WHERE session_id = %s
+                AND organization_id = %s
+                AND time >= NOW() - make_interval(hours => %s)
+                AND (%s::timestamp IS NULL OR time < %s::timestamp)
+            ORDER BY time DESC
+            LIMIT %s
+        """, (session_id, organization_id, self.ttl_hours, before, before, MEMORY_SEED_LIMIT))
+        rows = cur.fetchall()
+        return [make_turn(row["question"], row["response"]) for row in reversed(rows)]
+
+    def remember(self, item):
+        """
+        Catat giliran baru di memori proses sebelum masuk write-behind queue, agar
+        pertanyaan lanjutan yang datang sebelum flush tetap melihat giliran ini.
+        Mengembalikan item untuk append_batch (dengan pending_id, juga dipakai sebagai id giliran).
+        """
+        if not item.get("session_id") or not item.get("organization_id"):
+            return item
+        key = (item["session_id"], item["organization_id"])
+        pending_id = uuid.uuid4().hex
+        with self._lock:
+            self._pending.setdefault(key, []).append(
+                (pending_id, time.monotonic(), make_turn(item["question"], item["response"], pending_id))
+            )
+        return dict(item, pending_id=pending_id)
+
+    def _pending_turns(self, key):
+        cutoff = time.monotonic() - MEMORY_PENDING_TTL
+        with self._lock:
+            # Entri yang terlalu lama (mis. penulisan gagal permanen) dibuang
+            entries = [entry for entry in self._pending.get(key, []) if entry[1] >= cutoff]
+            if entries:
+                self._pending[key] = entries
+            else:
+                self._pending.pop(key, None)
+        return [turn for _, _, turn in entries]
+
+    def _forget(self, items):
+        done = {item["pending_id"] for item in items if item.get("pending_id")}
+        if not done:
+            return
+        with self._lock:
+            for key in {(item["session_id"], item["organization_id"]) for item in items}:
+                entries = [entry for entry in self._pending.get(key, []) if entry[0] not in done]
+                if entries:
+                    self._pending[key] = entries
+                else:
+                    self._pending.pop(key, None)
+
+    def load(self, session_id, organization_id) -> str:
+        # Tanpa session/organization tidak ada memori yang bisa dicari
+        if not session_id or not organization_id:
+            return ""
+        with get_connection() as conn, conn.cursor() as cur:
+            self._ensure_table(cur)
+            cur.execute("""
+                SELECT turns
+                FROM session_memory
+                WHERE session_id = %s
+                    AND organization_id = %s
+                    AND updated_at >= NOW() - make_interval(hours => %s)
+            """, (session_id, organization_id, self.ttl_hours))
+            row = cur.fetchone()
+            if row is not None:
+                turns = row["turns"]
+            elif self.seed_from_history:
+                turns = self._seed(cur, session_id, organization_id)
+            else:
+                turns = []
+            conn.commit()
+        # Tambahkan giliran yang belum di-flush; yang sudah tersimpan (id sama) tidak diulang.
+        # Pertanyaan sama yang memang ditanyakan dua kali tetap dua giliran
+        pending = self._pending_turns((session_id, organization_id))
+        if pending:
+            stored = {turn.get("id") for turn in turns if isinstance(turn, dict)}
+            turns = list(turns) + [turn for turn in pending if turn["id"] not in stored]
+        return render_turns(fit_budget(turns, self.token_budget))
+
+    def append_batch(self, items):
+        # Dipakai oleh write-behind queue; item = {session_id, organization_id, question, response, time}
+        items = [item for item in items if item.get("session_id") and item.get("organization_id")]
+        if not items:
+            return
+        # Urutan kunci tetap agar dua flush yang mengunci sesi yang sama tidak deadlock;
+        # sort stabil, urutan giliran dalam satu sesi tidak berubah
+        items = sorted(items, key=lambda item: (str(item["session_id"]), item["organization_id"]))
+        with get_connection() as conn, conn.cursor() as cur:
+            self._ensure_table(cur)
+            for item in items:
+                key = (item["session_id"], item["organization_id"])
+                # FOR UPDATE tidak mengunci baris yang belum ada (sesi baru), advisory lock
+                # per sesi menahan flush lain sampai transaksi ini commit
+                cur.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext(%s), %s)",
+                    (f"session_memory:{key[0]}", key[1]),
+                )
+                cur.execute("""
+                    SELECT turns, updated_at >= NOW() - make_interval(hours => %s) AS fresh
+                    FROM session_memory
+                    WHERE session_id = %s AND organization_id = %s
+                """, (self.ttl_hours, *key))
+                row = cur.fetchone()
+                if row is not None:
+                    turns = row["turns"] if row["fresh"] else []
+                elif self.seed_from_history:
+                    turns = self._seed(cur, *key, before=item.get("time"))
+                else:
+                    turns = []
+                turn = make_turn(item["question"], item["response"], item.get("pending_id"))
+                turns = fit_budget(turns + [turn], self.token_budget)
+                cur.execute("""
+                    INSERT INTO session_memory (session_id, organization_id, turns, updated_at)
+                    VALUES (%s, %s, %s::jsonb, NOW())
+                    ON CONFLICT (session_id, organization_id)
+                    DO UPDATE SET turns = EXCLUDED.turns, updated_at = EXCLUDED.updated_at
+                """, (*key, json.dumps(turns)))
+            conn.commit()
+        self._forget(items)
+
+    def purge_expired(self):
+        with get_connection() as conn, conn.cursor() as cur:
+            self._ensure_table(cur)
+            cur.execute(
+                "DELETE FROM session_memory WHERE updated_at < NOW() - make_interval(hours => %s)",
+                (self.ttl_hours,)
+            )
+            deleted = cur.rowcount
+            conn.commit()
+        return deleted
+
+
+session_memory = SessionMemory()
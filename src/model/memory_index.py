@@ -0,0 +1,248 @@
+import os, time, threading
+
+import numpy as np
+from dotenv import load_dotenv
+
+from connection.connection import get_connection
+
+load_dotenv()
+
+# "db" (pgvector) atau "memory" (matriks NumPy per organisasi di proses ini)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "db")
+# Snapshot dimuat ulang penuh setelah umur ini (perubahan dari proses lain ikut terbaca)
+MEMORY_INDEX_TTL = float(os.getenv("MEMORY_INDEX_TTL", "300"))
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class _OrgSnapshot:
+    # Tidak pernah diubah setelah dibuat; refresh membuat snapshot baru (copy-on-write)
+    def __init__(self, ids, questions, matrix, links, articles):
+        self.ids = ids
+        self.questions = questions
+        self.matrix = matrix
+        self.links = links
+        self.articles = articles
+        self.loaded_at = time.monotonic()
+
+
+class MemoryVectorIndex:
+    """
+    Index vektor in-process: vektor pertanyaan ternormalisasi per organisasi
+    dalam satu matriks NumPy, top-k lewat satu perkalian matriks, relasi
+    pertanyaan -> artikel juga disimpan di memori.
+    """
+
+    def __init__(self, ttl=MEMORY_INDEX_TTL):
+        self.ttl = ttl
+        self._orgs = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.loads = 0
+        self.refreshes = 0
+
+    def _fetch(self, organization_id, question_ids=None):
+        question_filter = "" if question_ids is None else "AND q.id = ANY(%(question_ids)s)"
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT q.id, q.question, q.question_vector::real[] AS vector
+                FROM questions q
+                WHERE q.organization_id = %(organization_id)s
+                    AND q.question_vector IS NOT NULL
+                    {question_filter}
+                ORDER BY q.id
+            """, {"organization_id": organization_id, "question_ids": question_ids})
+            questions = cur.fetchall()
+
+            cur.execute(f"""
+                SELECT qa.question_id, a.id, a.title, a.content
+                FROM question_articles qa
+                JOIN questions q ON q.id = qa.question_id
+                JOIN articles a ON a.id = qa.article_id
+                WHERE q.organization_id = %(organization_id)s
+                    {question_filter}
+                ORDER BY qa.question_id, a.id
+            """, {"organization_id": organization_id, "question_ids": question_ids})
+            links = cur.fetchall()
+        return questions, links
+
+    @staticmethod
+    def _build(rows, links, base=None):
+        # Gabungkan baris baru ke snapshot lama (baris dengan id sama diganti)
+        questions = dict(zip(base.ids.tolist(), base.questions)) if base else {}
+        vectors = dict(zip(base.ids.tolist(), base.matrix)) if base else {}
+        link_map = dict(base.links) if base else {}
+        articles = dict(base.articles) if base else {}
+
+        fresh_ids = {row["id"] for row in rows}
+        for qid in fresh_ids:
+            link_map[qid] = []
+        for row in rows:
+            questions[row["id"]] = row["question"]
+            vectors[row["id"]] = np.asarray(row["vector"], dtype=np.float32)
+        for row in links:
+            if row["question_id"] not in fresh_ids:
+                continue
+            link_map[row["question_id"]].append(row["id"])
+            articles[row["id"]] = {"id": row["id"], "title": row["title"], "content": row["content"]}
+
+        ids = np.array(sorted(questions), dtype=np.int64)
+        if len(ids):
+            matrix = _normalize_rows(np.vstack([vectors[qid] for qid in ids.tolist()]))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return _OrgSnapshot(ids, [questions[qid] for qid in ids.tolist()], matrix, link_map, articles)
+
+    def _snapshot(self, organization_id):
+        snapshot = self._orgs.get(organization_id)
+        if snapshot and time.monotonic() - snapshot.loaded_at < self.ttl:
+            return snapshot
+        # Satu loader per organisasi, request lain menunggu hasilnya
+        with self._lock:
+            load_lock = self._load_locks.setdefault(organization_id, threading.Lock())
+        with load_lock:
+            snapshot = self._orgs.get(organization_id)
+            if snapshot and time.monotonic() - snapshot.loaded_at < self.ttl:
+                return snapshot
+            rows, links = self._fetch(organization_id)
+            snapshot = self._build(rows, links)
+            with self._lock:
+                self._orgs[organization_id] = snapshot
+                self.loads += 1
+            return snapshot
+
+    def search(self, q_vector, organization_id, candidates):
+        """Hasil sama dengan search_questions(): list hit urut similarity tertinggi."""
+        snapshot = self._snapshot(organization_id)
+        if not len(snapshot.ids):
+            return []
+        query = np.asarray(q_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        similarities = snapshot.matrix @ query
+        k = min(candidates, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+
+        with self._lock:
+            self.hits += 1
+        hits = []
+        for index in top.tolist():
+            qid = int(snapshot.ids[index])
+            articles = [dict(snapshot.articles[aid]) for aid in snapshot.links.get(qid, [])]
+            # Sama seperti query DB (inner join): pertanyaan tanpa artikel tidak dikembalikan
+            if not articles:
+                continue
+            hits.append({
+                "id_question": qid,
+                "question": snapshot.questions[index],
+                "similarity": float(similarities[index]),
+                "articles": articles,
+            })
+        return hits
+
+    def refresh_questions(self, organization_id, question_ids):
+        # Muat ulang sebagian pertanyaan saja; organisasi yang belum dimuat tidak perlu apa-apa
+        if organization_id not in self._orgs or not question_ids:
+            return
+        try:
+            rows, links = self._fetch(organization_id, list(question_ids))
+        except Exception as e:
+            # Gagal refresh sebagian: muat ulang penuh saat dipakai berikutnya
+            print(f"❌ Gagal refresh index memori organisasi {organization_id}: {e}")
+            self.invalidate(organization_id)
+            return
+        with self._lock:
+            base = self._orgs.get(organization_id)
+            if base is None:
+                return
+            loaded_at = base.loaded_at
+            # Pertanyaan yang tidak lagi ada/berpindah organisasi dibuang
+            missing = set(question_ids) - {row["id"] for row in rows}
+            if missing:
+                keep = ~np.isin(base.ids, list(missing))
+                base = _OrgSnapshot(
+                    base.ids[keep], [q for q, k in zip(base.questions, keep) if k], base.matrix[keep],
+                    {qid: aids for qid, aids in base.links.items() if qid not in missing}, base.articles,
+                )
+            snapshot = self._build(rows, links, base)
+            snapshot.loaded_at = loaded_at
+            self._orgs[organization_id] = snapshot
+            self.refreshes += 1
+
+    def refresh_all_questions(self, question_ids):
+        # Untuk penulisan yang tidak tahu organisasinya (mis. relink question_articles)
+        if not question_ids or not self._orgs:
+            return
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "SELECT organization_id, array_agg(id) AS ids FROM questions WHERE id = ANY(%s) GROUP BY organization_id",
+                    (list(question_ids),)
+                )
+                groups = cur.fetchall()
+        except Exception as e:
+            print(f"❌ Gagal refresh index memori: {e}")
+            self.invalidate()
+            return
+        for row in groups:
+            self.refresh_questions(row["organization_id"], row["ids"])
+
+    def refresh_articles(self, article_ids):
+        # Perbarui isi artikel yang sudah ada di snapshot; artikel terhapus dilepas dari pertanyaan
+        article_ids = set(article_ids or ())
+        if not article_ids or not self._orgs:
+            return
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT id, title, content FROM articles WHERE id = ANY(%s)", (list(article_ids),))
+                fresh = {row["id"]: {"id": row["id"], "title": row["title"], "content": row["content"]} for row in cur.fetchall()}
+        except Exception as e:
+            print(f"❌ Gagal refresh artikel di index memori: {e}")
+            self.invalidate()
+            return
+        deleted = article_ids - set(fresh)
+        with self._lock:
+            for org, snapshot in list(self._orgs.items()):
+                if not article_ids & set(snapshot.articles):
+                    continue
+                articles = {aid: fresh.get(aid, article) for aid, article in snapshot.articles.items() if aid not in deleted}
+                links = {qid: [aid for aid in aids if aid not in deleted] for qid, aids in snapshot.links.items()}
+                updated = _OrgSnapshot(snapshot.ids, snapshot.questions, snapshot.matrix, links, articles)
+                updated.loaded_at = snapshot.loaded_at
+                self._orgs[org] = updated
+                self.refreshes += 1
+
+    def invalidate(self, organization_id=None):
+        # Dimuat ulang penuh saat dipakai berikutnya (mis. setelah artikel berubah)
+        with self._lock:
+            if organization_id is None:
+                self._orgs.clear()
+            else:
+                self._orgs.pop(organization_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": RETRIEVAL_BACKEND,
+                "organizations": {
+                    str(org): {
+                        "questions": int(len(s.ids)),
+                        "articles": len(s.articles),
+                        "age_seconds": round(time.monotonic() - s.loaded_at, 1),
+                    }
+                    for org, s in self._orgs.items()
+                },
+                "searches": self.hits,
+                "loads": self.loads,
+                "refreshes": self.refreshes,
+            }
+
+
+memory_index = MemoryVectorIndex()
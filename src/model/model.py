@@ -1,17 +1,30 @@
-import os, json
+import os, json, time, asyncio, traceback
 
 from dotenv import load_dotenv
-from flask import jsonify
 from datetime import datetime
 
 # Import from file
 from connection.connection import get_connection
+from model.embedding import embed_query, embed_documents
+from model.indexes import apply_search_params, text_search_available, ANN_CANDIDATES, TEXT_SEARCH_CONFIG
+from model.settings import (
+    org_setting, estimate_tokens, RETRIEVAL_TOP_K, RETRIEVAL_THRESHOLD, CONTEXT_TOKEN_BUDGET,
+    RETRIEVAL_MODE, RRF_K, HYBRID_MIN_SIMILARITY, HYBRID_MIN_TERM_COVERAGE,
+)
+from model.memory import session_memory
+from model.language import needs_translation, translation_cache, translation_key
+from model.chunks import attach_chunks
+from model.memory_index import memory_index, RETRIEVAL_BACKEND
+from model.pipeline import Pipeline, run_blocking
+from model.writer import create_writer
+from model.answer_cache import answer_cache, ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD
+from model.clients import get_llm
+from psycopg2.extras import execute_values
 
 # Import langchain
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.prompts import PromptTemplate
 
-from service.chat import notification
+from service.chat import notifier
 
 # Creating datetime
 now = datetime.now()
@@ -24,429 +37,648 @@ load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 os.environ["OPENAI_API_KEY"] = openai_api_key
 
-# Melakukan konversi teks ke vektor
+# Melakukan konversi teks ke vektor (lewat cache embedding)
 def convert(question: str):
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    return embeddings.embed_query(question)
+    return embed_query(question)
 
-# Melakukan match question ke database
-def match_question(question:str, organization_id: int):
-    conn = get_connection()
-    cur = conn.cursor()
-    # Konversi question ke vektor
-    q_vector = convert(question)
-
-    if q_vector is None:
-        return[{"article_content": "Tidak dapat melakukan konversi vektor"}]
-    try:
-        query = """
+# Mencari pertanyaan terdekat beserta artikelnya, urut dari similarity tertinggi
+def search_questions(q_vector, organization_id: int, candidates: int):
+    # Nearest-neighbour dulu (bisa memakai index HNSW/IVFFlat),
+    # baru join ke artikel untuk kandidat top-k saja
+    query = """
+                WITH nearest AS (
                     SELECT
-                        q.id AS question_id,
+                        q.id,
                         q.question,
-                        (1 - (q.question_vector <=> %s::vector)) AS cosine_similarity,
-                        a.id AS article_id,
-                        a.title AS article_title,
-                        a.content AS article_content
+                        q.question_vector <=> %(vector)s::vector AS distance
                     FROM
                         questions q
-                    JOIN
-                        question_articles qa ON q.id = qa.question_id
-                    JOIN
-                        articles a ON qa.article_id = a.id
                     WHERE
-                        q.organization_id = %s
-                    ORDER BY cosine_similarity DESC 
-                    LIMIT 1;
-                """
-        cur.execute(query, (q_vector, organization_id,))
+                        q.organization_id = %(organization_id)s
+                    ORDER BY q.question_vector <=> %(vector)s::vector
+                    LIMIT %(candidates)s
+                )
+                SELECT
+                    n.id AS question_id,
+                    n.question,
+                    (1 - n.distance) AS cosine_similarity,
+                    a.id AS article_id,
+                    a.title AS article_title,
+                    a.content AS article_content
+                FROM
+                    nearest n
+                JOIN
+                    question_articles qa ON n.id = qa.question_id
+                JOIN
+                    articles a ON qa.article_id = a.id
+                ORDER BY n.distance ASC, a.id ASC;
+            """
+    with get_connection() as conn, conn.cursor() as cur:
+        # Filter organization_id diterapkan setelah scan index
+        apply_search_params(cur, filtered=True)
+        cur.execute(query, {
+            "vector": q_vector,
+            "organization_id": organization_id,
+            "candidates": candidates,
+        })
         results = cur.fetchall()
 
-        grouped = {}
-        for row in results:
-            qid = row["question_id"]
-            if qid not in grouped:
-                grouped[qid] = {
-                    "id_question": row["question_id"],
-                    "question": row["question"],
-                    "similarity": row["cosine_similarity"],  # angka asli dari query
-                    "articles": []
-                }
-
-            grouped[qid]["articles"].append({
-                "id": row["article_id"],
-                "title": row["article_title"],
-                "content": row["article_content"]
-            })
-
-        # karena LIMIT 1, pasti hanya ada 1 item
-        if grouped:
-            item = next(iter(grouped.values()))
-            if item["similarity"] < 0.70:  # threshold 0.7 (karena hasil query range 0-1)
-                return [{
-                    "question": question,
-                    "similar_question": item['question'],
-                    "article_content": (
-                        f"Mohon maaf pertanyaan anda mengenai {question} belum dapat saya jawab. "
-                        f"Silahkan hubungi nusa.net.id. Gunakan Bahasa Indonesia atau Inggris sesuai dengan pertanyaan user {question}"
-                    ),
-                    "similarity": item["similarity"],  # tampilkan angka similarity asli
-                }]
-            return [item]
-
-        # fallback kalau query tidak mengembalikan baris
-        return [{
-            "question": question,
-            "article_content": (
-                f"Mohon maaf pertanyaan anda mengenai {question} belum dapat saya jawab. "
-                f"Silahkan hubungi nusa.net.id. Gunakan Bahasa Indonesia atau Inggris sesuai dengan pertanyaan user {question}"
-            ),
-            "similarity": 0,
-        }]
-
-    except Exception as e:
-        return [{"article_content": "Gagal query database: " + str(e)}], []
-    finally:
-        cur.close()
-        conn.close()
-
-# Melakukan pencarian history
-def find_history(session_id, organization_id):
-    if not session_id or not organization_id:
-        return jsonify({"success": False, "message": "Session dan Organization wajib diisi"}), 400
-
-    conn = get_connection()
-    cur = conn.cursor()
+    return group_hits(results)
 
+# Pencarian hybrid: kandidat vektor + kandidat full-text (pertanyaan maupun judul/isi artikel)
+# digabung dengan reciprocal-rank fusion, urut dari skor RRF tertinggi
+def search_questions_hybrid(q_vector, text: str, organization_id: int, candidates: int):
     query = """
+                WITH tsq AS (
+                    -- Semua kata bersifat OR agar query pendek/kata kunci tetap cocok
+                    SELECT replace(plainto_tsquery(%(config)s::regconfig, %(text)s)::text, '&', '|')::tsquery AS query
+                ),
+                terms AS (
+                    -- Kata query satu per satu, untuk menghitung porsi kata yang cocok
+                    SELECT quote_literal(word)::tsquery AS query
+                    FROM unnest(tsvector_to_array(to_tsvector(%(config)s::regconfig, %(text)s))) AS word
+                ),
+                vec AS (
+                    SELECT id, row_number() OVER (ORDER BY distance) AS rnk
+                    FROM (
+                        SELECT q.id, q.question_vector <=> %(vector)s::vector AS distance
+                        FROM questions q
+                        WHERE q.organization_id = %(organization_id)s
+                        ORDER BY q.question_vector <=> %(vector)s::vector
+                        LIMIT %(candidates)s
+                    ) nearest
+                ),
+                lex AS (
+                    SELECT id, coverage, row_number() OVER (ORDER BY rank DESC) AS rnk
+                    FROM (
+                        SELECT id, max(rank) AS rank, max(coverage) AS coverage
+                        FROM (
+                            SELECT
+                                q.id,
+                                ts_rank_cd(q.question_tsv, tsq.query) AS rank,
+                                (SELECT count(*) FROM terms t WHERE q.question_tsv @@ t.query)::float8
+                                    / GREATEST((SELECT count(*) FROM terms), 1) AS coverage
+                            FROM questions q, tsq
+                            WHERE q.organization_id = %(organization_id)s
+                                AND q.question_tsv @@ tsq.query
+                            UNION ALL
+                            SELECT
+                                q.id,
+                                ts_rank_cd(a.search_tsv, tsq.query) AS rank,
+                                (SELECT count(*) FROM terms t WHERE a.search_tsv @@ t.query)::float8
+                                    / GREATEST((SELECT count(*) FROM terms), 1) AS coverage
+                            FROM articles a
+                            JOIN question_articles qa ON qa.article_id = a.id
+                            JOIN questions q ON q.id = qa.question_id, tsq
+                            WHERE q.organization_id = %(organization_id)s
+                                AND a.search_tsv @@ tsq.query
+                        ) matches
+                        GROUP BY id
+                        ORDER BY rank DESC
+                        LIMIT %(candidates)s
+                    ) ranked
+                ),
+                fused AS (
+                    SELECT
+                        COALESCE(vec.id, lex.id) AS id,
+                        lex.rnk AS lexical_rank,
+                        lex.coverage AS lexical_coverage,
+                        COALESCE(1.0 / (%(rrf_k)s + vec.rnk), 0) + COALESCE(1.0 / (%(rrf_k)s + lex.rnk), 0) AS score
+                    FROM vec
+                    FULL OUTER JOIN lex ON vec.id = lex.id
+                )
                 SELECT
-                    question,
-                    response
+                    q.id AS question_id,
+                    q.question,
+                    1 - (q.question_vector <=> %(vector)s::vector) AS cosine_similarity,
+                    f.lexical_rank,
+                    f.lexical_coverage,
+                    f.score AS rrf_score,
+                    a.id AS article_id,
+                    a.title AS article_title,
+                    a.content AS article_content
                 FROM
-                    history
-                WHERE
-                    session_id = %s
-                    AND organization_id = %s
-                    AND time >= NOW() - INTERVAL '24 HOURS'
-                ORDER BY
-                    time DESC
-                LIMIT 10;
+                    fused f
+                JOIN
+                    questions q ON q.id = f.id
+                JOIN
+                    question_articles qa ON q.id = qa.question_id
+                JOIN
+                    articles a ON qa.article_id = a.id
+                ORDER BY f.score DESC, q.id ASC, a.id ASC;
             """
-    
-    cur.execute(query, (session_id, organization_id))
-    result = cur.fetchall()
-    
-    data = []
-    for row in result:
-        data.append({
-            "question": row["question"],
-            "response": row["response"]
+    with get_connection() as conn, conn.cursor() as cur:
+        # Filter organization_id diterapkan setelah scan index
+        apply_search_params(cur, filtered=True)
+        cur.execute(query, {
+            "vector": q_vector,
+            "text": text,
+            "config": TEXT_SEARCH_CONFIG,
+            "organization_id": organization_id,
+            "candidates": candidates,
+            "rrf_k": RRF_K,
         })
+        results = cur.fetchall()
 
-    cur.close()
-    conn.close()
+    return group_hits(results)
+
+# Mengelompokkan baris hasil query per pertanyaan beserta artikelnya
+def group_hits(results):
+    grouped = {}
+    for row in results:
+        qid = row["question_id"]
+        if qid not in grouped:
+            grouped[qid] = {
+                "id_question": row["question_id"],
+                "question": row["question"],
+                "similarity": row["cosine_similarity"],  # angka asli dari query
+                "articles": []
+            }
+            if "rrf_score" in row:
+                grouped[qid]["rrf_score"] = float(row["rrf_score"])
+                grouped[qid]["lexical_rank"] = row["lexical_rank"]
+                grouped[qid]["lexical_coverage"] = float(row["lexical_coverage"] or 0)
+
+        grouped[qid]["articles"].append({
+            "id": row["article_id"],
+            "title": row["article_title"],
+            "content": row["article_content"]
+        })
+    return list(grouped.values())
 
-    return data 
+# Melakukan match question ke database
+def match_question(question:str, organization_id: int, top_k: int = None, threshold: float = None):
+    top_k = top_k or org_setting(organization_id, "top_k", RETRIEVAL_TOP_K)
+    threshold = threshold if threshold is not None else org_setting(organization_id, "threshold", RETRIEVAL_THRESHOLD)
 
-# Menyimpan seluruh informasi percakapan
-import traceback
+    # Konversi question ke vektor
+    q_vector = convert(question)
 
-def save_log(data):
-    conn = get_connection()
-    cur = conn.cursor()
+    if q_vector is None:
+        return[{"article_content": "Tidak dapat melakukan konversi vektor"}]
+    candidates = max(ANN_CANDIDATES, top_k)
+    hybrid = org_setting(organization_id, "retrieval", RETRIEVAL_MODE) == "hybrid"
+    hits = None
+    if org_setting(organization_id, "retrieval_backend", RETRIEVAL_BACKEND) == "memory":
+        # Index NumPy di memori (vektor saja), tanpa round trip ke database
+        try:
+            hits = memory_index.search(q_vector, organization_id, candidates)
+        except Exception as e:
+            print(f"❌ Index memori gagal, memakai database: {e}")
+    try:
+        # Kolom tsvector dibuat lewat migrasi; sebelum itu cukup pencarian vektor
+        if hits is None and hybrid and text_search_available():
+            try:
+                hits = search_questions_hybrid(q_vector, question, organization_id, candidates)
+            except Exception as e:
+                print(f"❌ Pencarian hybrid gagal, memakai vektor saja: {e}")
+        if hits is None:
+            hits = search_questions(q_vector, organization_id, candidates)
+    except Exception as e:
+        return [{"article_content": "Gagal query database: " + str(e)}]
+
+    # Ambil top-k hit yang lolos ambang similarity organisasi. Pada mode hybrid, hit yang
+    # cocok dengan sebagian besar kata query cukup melewati HYBRID_MIN_SIMILARITY
+    # (satu kata umum yang kebetulan sama tidak cukup).
+    min_lexical = org_setting(organization_id, "hybrid_min_similarity", HYBRID_MIN_SIMILARITY)
+    min_coverage = org_setting(organization_id, "hybrid_min_term_coverage", HYBRID_MIN_TERM_COVERAGE)
+    matched = [
+        item for item in hits
+        if item["similarity"] >= threshold
+        or (item.get("lexical_rank") is not None
+            and item.get("lexical_coverage", 0) >= min_coverage
+            and item["similarity"] >= min_lexical)
+    ][:top_k]
+    if matched:
+        return matched
+
+    not_found = {
+        "question": question,
+        "article_content": (
+            f"Mohon maaf pertanyaan anda mengenai {question} belum dapat saya jawab. "
+            f"Silahkan hubungi nusa.net.id. Gunakan Bahasa Indonesia atau Inggris sesuai dengan pertanyaan user {question}"
+        ),
+        "similarity": 0,
+    }
+    if hits:
+        # tampilkan pertanyaan terdekat dan angka similarity asli
+        closest = max(hits, key=lambda item: item["similarity"])
+        not_found["similar_question"] = closest["question"]
+        not_found["similarity"] = closest["similarity"]
+    return [not_found]
+
+# Menyusun konteks dari beberapa hit, artikel duplikat hanya dipakai sekali
+def build_context(q_data, token_budget: int):
+    join_article = []
+    part_context = []
+    used = 0
+    for entry in q_data:
+        articles = entry.get("articles", [])
+        if not isinstance(articles, list):
+            continue
+        for article in articles:
+            if not article or "id" not in article or article["id"] in join_article:
+                continue
+            # Artikel panjang cukup diwakili potongan yang relevan (lihat model/chunks.py)
+            content = "\n...\n".join(article["chunks"]) if article.get("chunks") else article.get('content', '')
+            part = f"Judul: {article.get('title', 'Tanpa Judul')}\n{content}"
+            cost = estimate_tokens(part)
+            if used + cost > token_budget:
+                if part_context:
+                    continue
+                # Artikel terbaik tetap dipakai walau harus dipotong
+                part = part[:token_budget * 4]
+                cost = token_budget
+            join_article.append(article["id"])
+            part_context.append(part)
+            used += cost
+
+    return "\n".join(part_context), join_article
+
+# Menyimpan banyak log sekaligus (dipakai oleh write-behind queue).
+# Item boleh membawa "vector" atau "vector_text" yang di-embed di sini secara batch.
+def save_log_batch(items):
+    pending = [item for item in items if item.get("vector") is None and item.get("vector_text")]
+    if pending:
+        vectors = embed_documents([item["vector_text"] for item in pending])
+        for item, vector in zip(pending, vectors):
+            item["vector"] = vector
+
+    rows = [(
+        item['time'],
+        item['organization_id'],
+        item['question'],
+        item['similar_question'],
+        item['similarity'],
+        item['context'],
+        item['system_instruction'],
+        item['response'],
+        item['session_id'],
+        item['summary'],
+        item.get('vector'),
+    ) for item in items]
 
     query = """
         INSERT INTO log (
-            time,
-            organization_id,
-            question,
-            similar_question,
-            similarity,
-            context,
-            system_instruction,
-            response,
-            session_id,
-            summary,
-            sum_vector
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
-        RETURNING id
+            time, organization_id, question, similar_question, similarity, context,
+            system_instruction, response, session_id, summary, sum_vector
+        ) VALUES %s
     """
-
-    try:
-        cur.execute(query, (
-            data['time'],
-            data['organization_id'],
-            data['question'],
-            data['similar_question'],
-            data['similarity'],
-            data['context'],
-            data['system_instruction'],
-            data['response'],
-            data['session_id'],
-            data['summary'],
-            data['vector']
-        ))
-        row = cur.fetchone()
-        log_id = row["id"] if isinstance(row, tuple) else row["id"]
+    with get_connection() as conn, conn.cursor() as cur:
+        execute_values(cur, query, rows, page_size=len(rows))
         conn.commit()
-        return {"success": True, "log_id": log_id}
-
-    except Exception as e:
-        conn.rollback()
-        print("❌ Error saat insert log:")
-        traceback.print_exc()  # <<=== ini akan tampilkan error lengkap
-        return {"success": False, "error": str(e)}
-
-    finally:
-        cur.close()
-        conn.close()
 
-
-
-# Menyimpan history
-def save_history(data):
-    conn = get_connection()
-    cur = conn.cursor()
+# Menyimpan banyak history sekaligus (dipakai oleh write-behind queue)
+def save_history_batch(items):
+    rows = [(
+        item['time'],
+        item['session_id'],
+        item['organization_id'],
+        item['question'],
+        item['response'],
+        item['context'],
+    ) for item in items]
 
     query = """
         INSERT INTO history (
             time, session_id, organization_id, question, response, context
-        )
-        VALUES (%s, %s, %s, %s, %s, %s)
+        ) VALUES %s
     """
-
-    try:
-        cur.execute(query, (
-            data['time'],
-            data['session_id'],
-            data['organization_id'],
-            data['question'],
-            data['response'],
-            data['context'],
-        ))
+    with get_connection() as conn, conn.cursor() as cur:
+        execute_values(cur, query, rows, page_size=len(rows))
         conn.commit()
-        return {"success": True}
-    except Exception as e:
-        conn.rollback()
-        return {"success": False, "error": str(e)}
-    finally:
-        cur.close()
-        conn.close()
 
-
-# Mengajukan pertanyaan
-def ask(question: str, session_id: str, organization_id: int):
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
-    print("Hellow")
-
-    history = find_history(session_id, organization_id)
-    print(history)
+writer = create_writer({
+    "log": save_log_batch,
+    "history": save_history_batch,
+    "memory": session_memory.append_batch,
+})
+
+# Log dan history dikirim ke write-behind queue, user tidak perlu menunggu
+def finalize_answer(pipe, log_dt, history_dt, event, vector_text=None):
+    writer.enqueue("history", history_dt)
+    # Memori sesi cukup ditambah giliran terbaru; giliran ini langsung terbaca oleh
+    # session_memory.load() walau queue belum di-flush
+    writer.enqueue("memory", session_memory.remember(history_dt))
+    writer.enqueue("log", dict(log_dt, vector=None, vector_text=vector_text))
+    # Notifier hanya mencatat event; pengiriman ringkasan berjalan di thread sendiri
+    notifier.notify(event, log_dt["session_id"], log_dt["question"], log_dt["organization_id"])
+    pipe.report()
+
+# Langkah-langkah menyiapkan prompt jawaban akhir beserta data untuk log/history.
+# Generator ini hanya berisi logika; pemanggilan LLM/database dilakukan oleh driver
+# (prepare_answer untuk sync, aprepare_answer untuk async) lewat yield (tahap, jenis, argumen):
+# jenis "llm" dengan argumen prompt, atau "call" dengan argumen (fungsi, *args).
+def answer_steps(question: str, organization_id: int, history):
     if history:
-        try:
-            reformat_sum = prompt_sum.format(
-                history=history,
-                question=question
-            )
-            res_sum = llm.invoke(reformat_sum)
-            summary_text = getattr(res_sum, "content", "") or "Summary kosong"
-            reformat_q = prompt_translate_h.format(
-                history=summary_text
-            )
-            res_t = llm.invoke(reformat_q)
-            translate_text = getattr(res_t, "content", "") or question
-
-            q_data = match_question(translate_text, organization_id)
-            if not q_data or not isinstance(q_data, list) or not q_data[0].get("articles"):
-                reformat_notfoundh = prompt_notfoundh.format(
-                    question=question,
-                    history=history,
-                    month=curr_month,
-                    year=curr_year
-                )
-                res_nf = llm.invoke(reformat_notfoundh)
-                response_text = getattr(res_nf, "content", "") or "Tidak ditemukan jawaban"
-
-                save_log_dt = {
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "organization_id": organization_id,
-                    "question": question,
-                    "similar_question": q_data[0].get("similar_question"),
-                    "similarity": q_data[0].get("similarity"),
-                    "context": "Not Found",
-                    "system_instruction": reformat_notfoundh,
-                    "response": response_text,
-                    "session_id": session_id,
-                    "summary": summary_text,
-                    "vector": convert(summary_text) if summary_text else None,
-                }
-
-                save_history_dt = {
-                    "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "session_id": session_id,
-                    "organization_id": organization_id,
-                    "question": question,
-                    "response": response_text,
-                    "context": "Not Found"
-                }
-
-                save_history(save_history_dt)
-                save_log(save_log_dt)
-                notification("Not Found", session_id, question)
-                return response_text, summary_text, "Not found article", history, reformat_notfoundh
-
-            join_article = set()
-            part_context = []
-            for entry in q_data:
-                articles = entry.get("articles", [])
-                if not isinstance(articles, list):
-                    continue
-                for article in articles:
-                    if not article or "id" not in article:
-                        continue
-                    if article["id"] not in join_article:
-                        join_article.add(article["id"])
-                        part_context.append(
-                            f"Judul: {article.get('title', 'Tanpa Judul')}\n{article.get('content', '')}"
-                        )
-
-            context = "\n".join(part_context) if part_context else "Tidak ada artikel valid"
-
-            reformat_ans_h = prompt_answrh.format(
+        # Satu panggilan LLM: gabungkan memori sesi + pertanyaan jadi query pencarian berbahasa Indonesia
+        reformat_q = prompt_condense.format(
+            history=history,
+            question=question
+        )
+        res_t = yield "llm_condense", "llm", reformat_q
+        translate_text = getattr(res_t, "content", "") or question
+        summary_text = translate_text
+
+        q_data = yield "match_question", "call", (match_question, translate_text, organization_id)
+        if not q_data or not isinstance(q_data, list) or not q_data[0].get("articles"):
+            reformat_notfoundh = prompt_notfoundh.format(
                 question=question,
-                articles=context,
+                history=history,
                 month=curr_month,
-                year=curr_year,
-                history=history
+                year=curr_year
             )
-            res_ans_h = llm.invoke(reformat_ans_h)
-            response_text = getattr(res_ans_h, "content", "") or "Jawaban kosong"
-
-            save_log_dt = {
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "organization_id": organization_id,
-                "question": question,
-                "similar_question": q_data[0].get("question", "Unknown"),
-                "similarity": q_data[0].get("similarity", "0"),
-                "context": context,
-                "system_instruction": reformat_ans_h,
-                "response": response_text,
-                "session_id": session_id,
-                "summary": summary_text,
-                "vector": convert(summary_text) if summary_text else None,
-            }
-
-            save_history_dt = {
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "session_id": session_id,
-                "organization_id": organization_id,
-                "question": question,
-                "response": response_text,
-                "context": context,
-            }
-            save_history(save_history_dt)
-            save_log(save_log_dt)
-            notification("Article Found", session_id, question)
-            return response_text, summary_text, "Article Found"
-        except Exception as e:
-            import traceback
-            err_msg = f"Internal error: {e}"
-            print(err_msg)
-            print(traceback.format_exc())
             return {
-                "error": "1",
-                "message": err_msg,
-                "success": False}
-    else:
-        reformat_q = prompt_translate.format(
-            question = question
-        )
-        res_tranlate = llm.invoke(reformat_q)
-        q_data= match_question(res_tranlate.content, organization_id)
-        if not q_data or "articles" not in q_data[0]:
-            
-            reformat_notfound = prompt_notfound.format(
-                question = question,
-                month = curr_month,
-                year = curr_year
-            )
-
-            res_nf = llm.invoke(reformat_notfound)
-
-            save_log_dt = {
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "organization_id": organization_id,
-                "question": question,
+                "prompt": reformat_notfoundh,
+                "fallback": "Tidak ditemukan jawaban",
+                "event": "Not Found",
+                "context": "Not Found",
                 "similar_question": q_data[0].get("similar_question"),
                 "similarity": q_data[0].get("similarity"),
-                "context": "Not Found",
-                "system_instruction": reformat_notfound,
-                "response": res_nf.content,
-                "session_id": session_id,
-                "summary": "Not Have Summary",
-                "vector": convert(question),
-            }
-
-            save_history_dt = {
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "session_id": session_id,
-                "organization_id": organization_id,
-                "question": question,
-                "response": res_nf.content,
-                "context": "Not Found"
+                "summary": summary_text,
+                "vector_text": summary_text,
+                "result": lambda text: (text, summary_text, "Not found article", history, reformat_notfoundh),
             }
 
-            save_history(save_history_dt)
-            save_log(save_log_dt)
-            notification("Not Found", session_id, question)
-            return res_nf.content, "Article Not Found"
-     
-        join_article = set()
-        part_context = []
-        for entry in q_data:
-            for article in entry["articles"]:
-                if article["id"] not in join_article:
-                    join_article.add(article["id"])
-                    part_context.append(f"Judul: {article['title']}\n{article['content']}")
-
-        context = "\n".join(part_context)
-        print(context)
-        reformat_ans = prompt_answr.format(
+        q_data = yield "article_chunks", "call", (attach_chunks, q_data, translate_text)
+        context, article_ids = build_context(
+            q_data, org_setting(organization_id, "context_token_budget", CONTEXT_TOKEN_BUDGET)
+        )
+        context = context or "Tidak ada artikel valid"
+
+        reformat_ans_h = prompt_answrh.format(
+            question=question,
+            articles=context,
+            month=curr_month,
+            year=curr_year,
+            history=history
+        )
+        return {
+            "prompt": reformat_ans_h,
+            "fallback": "Jawaban kosong",
+            "event": "Article Found",
+            "context": context,
+            "similar_question": q_data[0].get("question", "Unknown"),
+            "similarity": q_data[0].get("similarity", "0"),
+            "summary": summary_text,
+            "vector_text": summary_text,
+            "article_ids": article_ids,
+            "result": lambda text: (text, summary_text, "Article Found"),
+        }
+
+    # Terjemahan LLM hanya jika pertanyaan belum berbahasa Indonesia, hasilnya di-cache
+    search_text = question
+    if needs_translation(question):
+        key = translation_key(question)
+        search_text = translation_cache.get(key)
+        if search_text is None:
+            reformat_q = prompt_translate.format(
+                question = question
+            )
+            res_tranlate = yield "llm_translate", "llm", reformat_q
+            search_text = getattr(res_tranlate, "content", "") or question
+            translation_cache.set(key, search_text)
+    q_data = yield "match_question", "call", (match_question, search_text, organization_id)
+    if not q_data or "articles" not in q_data[0]:
+        reformat_notfound = prompt_notfound.format(
             question = question,
-            articles = context,
             month = curr_month,
-            year = curr_year,
+            year = curr_year
         )
+        return {
+            "prompt": reformat_notfound,
+            "fallback": "",
+            "event": "Not Found",
+            "context": "Not Found",
+            "similar_question": q_data[0].get("similar_question"),
+            "similarity": q_data[0].get("similarity"),
+            "summary": "Not Have Summary",
+            "vector_text": question,
+            "result": lambda text: (text, "Article Not Found"),
+        }
+
+    q_data = yield "article_chunks", "call", (attach_chunks, q_data, search_text)
+    context, article_ids = build_context(
+        q_data, org_setting(organization_id, "context_token_budget", CONTEXT_TOKEN_BUDGET)
+    )
+    reformat_ans = prompt_answr.format(
+        question = question,
+        articles = context,
+        month = curr_month,
+        year = curr_year,
+    )
+    return {
+        "prompt": reformat_ans,
+        "fallback": "",
+        "event": "Article Found",
+        "context": context,
+        "similar_question": q_data[0]["question"],
+        "similarity": q_data[0]["similarity"],
+        "summary": "Percakapan awal",
+        "vector_text": question,
+        "article_ids": article_ids,
+        "result": lambda text: (text, "Article Found"),
+    }
+
+def prepare_answer(question: str, session_id: str, organization_id: int, history, llm, pipe):
+    steps = answer_steps(question, organization_id, history)
+    try:
+        stage, kind, arg = next(steps)
+        while True:
+            if kind == "llm":
+                result = pipe.run(stage, llm.invoke, arg)
+            else:
+                fn, *args = arg
+                result = pipe.run(stage, fn, *args)
+            stage, kind, arg = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+async def aprepare_answer(question: str, session_id: str, organization_id: int, history, llm, pipe):
+    steps = answer_steps(question, organization_id, history)
+    try:
+        stage, kind, arg = next(steps)
+        while True:
+            if kind == "llm":
+                result = await pipe.arun(stage, llm.ainvoke(arg))
+            else:
+                # psycopg2 bersifat blocking, query dijalankan di thread terpisah
+                fn, *args = arg
+                result = await pipe.arun(stage, run_blocking(fn, *args))
+            stage, kind, arg = steps.send(result)
+    except StopIteration as done:
+        return done.value
+
+# Menyimpan hasil jawaban (lewat write-behind queue) dan membentuk nilai kembalian ask()
+def complete_answer(plan, question: str, session_id: str, organization_id: int, response_text: str, pipe):
+    response_text = response_text or plan["fallback"]
+    save_log_dt = {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "organization_id": organization_id,
+        "question": question,
+        "similar_question": plan["similar_question"],
+        "similarity": plan["similarity"],
+        "context": plan["context"],
+        "system_instruction": plan["prompt"],
+        "response": response_text,
+        "session_id": session_id,
+        "summary": plan["summary"],
+    }
+
+    save_history_dt = {
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "session_id": session_id,
+        "organization_id": organization_id,
+        "question": question,
+        "response": response_text,
+        "context": plan["context"],
+    }
+
+    finalize_answer(pipe, save_log_dt, save_history_dt, plan["event"], vector_text=plan["vector_text"])
+    return plan["result"](response_text)
+
+def start_pipeline(question: str, session_id: str, organization_id: int):
+    pipe = Pipeline("ask")
+    # Memori sesi diambil bersamaan dengan embedding pertanyaan (hasilnya juga masuk cache embedding)
+    history_future = pipe.submit("load_memory", session_memory.load, session_id, organization_id)
+    vector_future = pipe.submit("embed_question", convert, question)
+    history = history_future.result()
+    # Vektor pertanyaan hanya ditunggu jika dibutuhkan cache jawaban (tanpa history)
+    vector = None if history or not ANSWER_CACHE_ENABLED else vector_future.result()
+    return pipe, history, vector
+
+async def astart_pipeline(question: str, session_id: str, organization_id: int):
+    pipe = Pipeline("aask")
+    history, vector = await asyncio.gather(
+        pipe.arun("load_memory", run_blocking(session_memory.load, session_id, organization_id)),
+        pipe.arun("embed_question", run_blocking(convert, question)),
+    )
+    return pipe, history, vector
+
+# Cache jawaban hanya untuk pertanyaan pertama (tanpa history percakapan)
+def lookup_cached_answer(pipe, organization_id: int, history, vector):
+    if not ANSWER_CACHE_ENABLED or history or vector is None:
+        return None
+    threshold = org_setting(organization_id, "answer_cache_threshold", ANSWER_CACHE_THRESHOLD)
+    return pipe.run("answer_cache", answer_cache.lookup, organization_id, vector, threshold)
+
+def remember_answer(organization_id: int, history, vector, plan, response_text: str):
+    if not ANSWER_CACHE_ENABLED or history or vector is None:
+        return
+    if plan["event"] != "Article Found" or not response_text:
+        return
+    value = dict(plan, response=response_text, summary="Jawaban dari cache")
+    answer_cache.store(organization_id, vector, value, plan.get("article_ids", ()))
+
+def internal_error(e):
+    err_msg = f"Internal error: {e}"
+    print(err_msg)
+    print(traceback.format_exc())
+    return {
+        "error": "1",
+        "message": err_msg,
+        "success": False}
 
-        res_ans = llm.invoke(reformat_ans)
-        save_log_dt = {
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "organization_id": organization_id,
-                "question": question,
-                "similar_question": q_data[0]["question"],
-                "similarity": q_data[0]["similarity"],
-                "context": context,
-                "system_instruction": reformat_ans,
-                "response": res_ans.content,
-                "session_id": session_id,
-                "summary": "Percakapan awal",
-                "vector": convert(question),
-            }
+# Mengajukan pertanyaan
+def ask(question: str, session_id: str, organization_id: int):
+    llm = get_llm(organization_id)
+    pipe, history, vector = start_pipeline(question, session_id, organization_id)
 
-        save_history_dt = {
-                "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "session_id": session_id,
-                "organization_id": organization_id,
-                "question": question,
-                "response": res_ans.content,
-                "context": context
-            }
+    try:
+        cached = lookup_cached_answer(pipe, organization_id, history, vector)
+        if cached:
+            return complete_answer(cached, question, session_id, organization_id, cached["response"], pipe)
+
+        plan = prepare_answer(question, session_id, organization_id, history, llm, pipe)
+        res_ans = pipe.run("llm_answer", llm.invoke, plan["prompt"])
+        response_text = getattr(res_ans, "content", "")
+        remember_answer(organization_id, history, vector, plan, response_text)
+        return complete_answer(plan, question, session_id, organization_id, response_text, pipe)
+    except Exception as e:
+        if not history:
+            raise
+        return internal_error(e)
 
-        save_history(save_history_dt)
-        save_log(save_log_dt)
-        notification("Article Found", session_id, question)
+# Versi async dari ask() untuk mode ASGI: LLM memakai ainvoke, database lewat thread
+async def aask(question: str, session_id: str, organization_id: int):
+    llm = get_llm(organization_id)
+    pipe, history, vector = await astart_pipeline(question, session_id, organization_id)
 
-        return res_ans.content, "Article Found"
+    try:
+        # Lookup cache bisa membaca tabel invalidasi, jangan di event loop
+        cached = await run_blocking(lookup_cached_answer, pipe, organization_id, history, vector)
+        if cached:
+            return complete_answer(cached, question, session_id, organization_id, cached["response"], pipe)
+
+        plan = await aprepare_answer(question, session_id, organization_id, history, llm, pipe)
+        res_ans = await pipe.arun("llm_answer", llm.ainvoke(plan["prompt"]))
+        response_text = getattr(res_ans, "content", "")
+        remember_answer(organization_id, history, vector, plan, response_text)
+        return complete_answer(plan, question, session_id, organization_id, response_text, pipe)
+    except Exception as e:
+        if not history:
+            raise
+        return internal_error(e)
+
+# Mengajukan pertanyaan dengan jawaban di-stream per token.
+# Menghasilkan ("token", teks) selama jawaban dibuat lalu ("done", hasil ask()).
+def ask_stream(question: str, session_id: str, organization_id: int):
+    llm = get_llm(organization_id)
+    pipe, history, vector = start_pipeline(question, session_id, organization_id)
+
+    cached = lookup_cached_answer(pipe, organization_id, history, vector)
+    if cached:
+        yield "token", cached["response"]
+        yield "done", complete_answer(cached, question, session_id, organization_id, cached["response"], pipe)
+        return
+
+    plan = prepare_answer(question, session_id, organization_id, history, llm, pipe)
+
+    parts = []
+    started = time.perf_counter()
+    for chunk in llm.stream(plan["prompt"]):
+        token = getattr(chunk, "content", "")
+        if not token:
+            continue
+        if not parts:
+            pipe.record("llm_first_token", started)
+        parts.append(token)
+        yield "token", token
+    pipe.record("llm_answer", started)
+
+    # Persistensi baru dijalankan setelah stream selesai
+    response_text = "".join(parts)
+    remember_answer(organization_id, history, vector, plan, response_text)
+    yield "done", complete_answer(plan, question, session_id, organization_id, response_text, pipe)
+
+# Versi async dari ask_stream() memakai llm.astream
+async def aask_stream(question: str, session_id: str, organization_id: int):
+    llm = get_llm(organization_id)
+    pipe, history, vector = await astart_pipeline(question, session_id, organization_id)
+
+    cached = await run_blocking(lookup_cached_answer, pipe, organization_id, history, vector)
+    if cached:
+        yield "token", cached["response"]
+        yield "done", complete_answer(cached, question, session_id, organization_id, cached["response"], pipe)
+        return
+
+    plan = await aprepare_answer(question, session_id, organization_id, history, llm, pipe)
+
+    parts = []
+    started = time.perf_counter()
+    async for chunk in llm.astream(plan["prompt"]):
+        token = getattr(chunk, "content", "")
+        if not token:
+            continue
+        if not parts:
+            pipe.record("llm_first_token", started)
+        parts.append(token)
+        yield "token", token
+    pipe.record("llm_answer", started)
+
+    response_text = "".join(parts)
+    remember_answer(organization_id, history, vector, plan, response_text)
+    yield "done", complete_answer(plan, question, session_id, organization_id, response_text, pipe)
 
 # def check_question(question: str):
 #     llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
@@ -458,30 +690,24 @@ def ask(question: str, session_id: str, organization_id: int):
 #     return res_ans.content
 
 
-prompt_sum = PromptTemplate.from_template(
+prompt_condense = PromptTemplate.from_template(
     """
-        ⚠️ RULE PENTING:
-        Selalu deteksi bahasa dari {question} dan JAWAB dengan bahasa YANG SAMA.
-        Jika user pakai bahasa Inggris → jawab dalam bahasa Inggris.
-        Jika user pakai bahasa Indonesia → jawab dalam bahasa Indonesia.
-        Jika campuran, pilih bahasa yang paling dominan.
-
-        Tugas pertama kamu adalah mendeteksi bahasa yang digunakan oleh user melalui {question}. 
-        Gunakan bahasa serupa dalam menjawab.
-        Gabungkan informasi dari riwayat pertanyaan sebelumnya dengan pertanyaan terakhir
-        untuk membentuk satu pertanyaan tunggal yang jelas, ringkas, dan lengkap.
+        Tugas kamu adalah menggabungkan riwayat percakapan dengan pertanyaan terakhir user
+        menjadi SATU pertanyaan tunggal yang jelas, ringkas, dan lengkap dalam bahasa Indonesia,
+        khusus untuk kebutuhan pencarian artikel di knowledge base.
 
-        - Pastikan semua konteks penting dari riwayat pertanyaan tetap ada.
-        - Hindari menyalin mentah pertanyaan terakhir, tapi perjelas maksudnya tanpa mengubah makna.
-        - Gunakan bahasa Indonesia atau Inggris (sesuai dengan bahasa pertanyaan terakhir user).
-        - Jika ada pertanyaan campuran, gunakan bahasa yang paling dominan.
-        - Ingat yang kamu ringkas hanya pertanyaan (question) tidak ikut context nya!
+        Aturan:
+        1. Pastikan semua konteks penting dari riwayat percakapan tetap ada.
+        2. Hindari menyalin mentah pertanyaan terakhir, tapi perjelas maksudnya tanpa mengubah makna.
+        3. Jika pertanyaan atau riwayat memakai bahasa Inggris atau campuran → terjemahkan ke bahasa Indonesia.
+        4. Yang diringkas hanya pertanyaan user, jangan ikut meringkas jawaban pada riwayat.
+        5. Kembalikan hanya pertanyaan hasilnya tanpa penjelasan tambahan.
 
         Riwayat percakapan sebelumnya:
         {history}
         Pertanyaan terakhir:
         {question}
-        Hasil (1 pertanyaan tunggal) dalam bahasa yang sesuai dengan pertanyaan terakhir tanpa ikut meringkas context pada Riwayat:
+        Hasil (1 pertanyaan tunggal dalam bahasa Indonesia):
     """
 )
 
@@ -631,23 +857,6 @@ prompt_translate = PromptTemplate.from_template(
     """
 )
 
-prompt_translate_h = PromptTemplate.from_template(
-    """
-        Tugas kamu adalah menerjemahkan gabungan riwayat pertanyaan berikut ke dalam bahasa Indonesia,
-        khusus untuk kebutuhan pencarian artikel di knowledge base.
-
-        Aturan:
-        1. Jika teks sudah menggunakan bahasa Indonesia → jangan diterjemahkan, kembalikan persis sama tanpa perubahan.
-        2. Jika teks menggunakan bahasa Inggris → terjemahkan ke bahasa Indonesia.
-        3. Jika teks campuran (Indonesia + Inggris) → terjemahkan semua ke bahasa Indonesia.
-        4. Jangan menambah atau mengurangi kata. Pertahankan tanda baca, simbol tanya (?), dan format aslinya.
-
-        Riwayat pertanyaan user: {history}
-
-        Hasil (dalam bahasa Indonesia):
-    """
-)
-
 prompt_check = PromptTemplate.from_template(
     """
     Kamu adalah asisten cerdas resmi dari PT. Media Antar Nusa (Nusanet),
@@ -0,0 +1,66 @@
+import os, time, asyncio, functools, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from connection.connection import POOL_MAX
+
+load_dotenv()
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "16"))
+# Thread untuk panggilan blocking (psycopg2, embedding) di jalur async (aask). Default executor
+# asyncio hanya min(32, cpu+4) thread; DB_POOL_MAX untuk query, sisanya untuk embedding (HTTP)
+ASYNC_BLOCKING_WORKERS = int(os.getenv("ASYNC_BLOCKING_WORKERS", str(POOL_MAX + 32)))
+
+# Thread pool bersama untuk tahapan ask() yang saling independen
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+_async_executor = ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_WORKERS, thread_name_prefix="async-blocking")
+
+
+def run_blocking(fn, *args, **kwargs):
+    # Pengganti asyncio.to_thread yang memakai executor berukuran ASYNC_BLOCKING_WORKERS
+    return asyncio.get_running_loop().run_in_executor(_async_executor, functools.partial(fn, *args, **kwargs))
+
+
+class Pipeline:
+    """Menjalankan tahapan sebuah request (inline atau paralel) dan mencatat durasinya."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.timings = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _timed(self, stage, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.timings[stage] = round(elapsed, 1)
+
+    def record(self, stage, started):
+        # `started` dari time.perf_counter(), untuk tahap yang tidak dibungkus run/submit
+        with self._lock:
+            self.timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+    def run(self, stage, fn, *args, **kwargs):
+        return self._timed(stage, fn, *args, **kwargs)
+
+    async def arun(self, stage, awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(stage, started)
+
+    def submit(self, stage, fn, *args, **kwargs):
+        return _executor.submit(self._timed, stage, fn, *args, **kwargs)
+
+    def report(self):
+        with self._lock:
+            timings = dict(self.timings)
+        timings["total"] = round((time.perf_counter() - self._started) * 1000, 1)
+        print(f"⏱️ [{self.name}] " + ", ".join(f"{stage}={ms}ms" for stage, ms in timings.items()))
+        return timings
@@ -0,0 +1,36 @@
+import os, json
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Default retrieval
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+RETRIEVAL_THRESHOLD = float(os.getenv("RETRIEVAL_THRESHOLD", "0.70"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# "hybrid" (full-text + vektor, digabung dengan reciprocal-rank fusion) atau "vector"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Hit yang cocok secara leksikal boleh lolos di bawah threshold selama similarity >= nilai ini
+HYBRID_MIN_SIMILARITY = float(os.getenv("HYBRID_MIN_SIMILARITY", "0.40"))
+# ...asalkan porsi kata query yang cocok secara leksikal minimal sebesar ini
+HYBRID_MIN_TERM_COVERAGE = float(os.getenv("HYBRID_MIN_TERM_COVERAGE", "0.6"))
+
+# Override per organisasi dalam bentuk JSON, contoh:
+# ORG_SETTINGS={"1": {"top_k": 5, "threshold": 0.65}, "2": {"context_token_budget": 1500, "retrieval": "vector"}}
+try:
+    ORG_SETTINGS = json.loads(os.getenv("ORG_SETTINGS") or "{}")
+except ValueError:
+    print("❌ ORG_SETTINGS bukan JSON valid, memakai default")
+    ORG_SETTINGS = {}
+
+
+def org_setting(organization_id, key, default=None):
+    settings = ORG_SETTINGS.get(str(organization_id)) or {}
+    value = settings.get(key)
+    return default if value is None else value
+
+
+# Estimasi kasar jumlah token (~4 karakter per token)
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + 3) // 4
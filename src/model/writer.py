@@ -0,0 +1,157 @@
+import os, time, queue, atexit, threading, traceback
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WRITER_WORKERS = int(os.getenv("WRITER_WORKERS", "2"))
+WRITER_QUEUE_MAX = int(os.getenv("WRITER_QUEUE_MAX", "10000"))
+WRITER_BATCH_SIZE = int(os.getenv("WRITER_BATCH_SIZE", "50"))
+WRITER_FLUSH_INTERVAL = float(os.getenv("WRITER_FLUSH_INTERVAL", "0.5"))
+WRITER_MAX_RETRIES = int(os.getenv("WRITER_MAX_RETRIES", "3"))
+WRITER_RETRY_BACKOFF = float(os.getenv("WRITER_RETRY_BACKOFF", "0.5"))
+WRITER_SHUTDOWN_TIMEOUT = float(os.getenv("WRITER_SHUTDOWN_TIMEOUT", "10"))
+
+
+class WriteBehindQueue:
+    """
+    Antrian write-behind: pekerjaan (insert log/history, notifikasi) dikumpulkan
+    lalu diproses per batch oleh worker di background. Setiap jenis pekerjaan
+    punya handler yang menerima list item.
+    """
+
+    def __init__(self, handlers, workers=WRITER_WORKERS, maxsize=WRITER_QUEUE_MAX,
+                 batch_size=WRITER_BATCH_SIZE, flush_interval=WRITER_FLUSH_INTERVAL,
+                 max_retries=WRITER_MAX_RETRIES, retry_backoff=WRITER_RETRY_BACKOFF):
+        self.handlers = handlers
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.counters = {"enqueued": 0, "processed": 0, "retries": 0, "splits": 0, "failed": 0, "inline": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"writer-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, kind, item):
+        if kind not in self.handlers:
+            raise ValueError(f"Jenis pekerjaan tidak dikenal: {kind}")
+        if self._stopping:
+            self._count("inline")
+            self._run(kind, [item])
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((kind, item))
+            self._count("enqueued")
+        except queue.Full:
+            # Antrian penuh: tulis langsung di thread pemanggil agar data tidak hilang
+            self._count("inline")
+            self._run(kind, [item])
+
+    def _worker(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                if self._stopping:
+                    return
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                grouped = {}
+                for kind, item in batch:
+                    grouped.setdefault(kind, []).append(item)
+                for kind, items in grouped.items():
+                    self._run(kind, items)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _run(self, kind, items):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.handlers[kind](items)
+                self._count("processed", len(items))
+                return
+            except Exception:
+                if attempt == self.max_retries:
+                    print(f"❌ Write-behind '{kind}' gagal setelah {attempt + 1} percobaan ({len(items)} item):")
+                    traceback.print_exc()
+                    self._isolate(kind, items)
+                    return
+                self._count("retries")
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+    def _isolate(self, kind, items):
+        # Satu baris rusak tidak boleh membuang baris session lain dalam batch yang sama:
+        # batch dibelah dua sampai hanya item yang memang gagal yang dibuang
+        if len(items) == 1:
+            self._count("failed")
+            print(f"❌ Write-behind '{kind}' membuang 1 item: {str(items[0])[:200]}")
+            return
+        self._count("splits")
+        middle = len(items) // 2
+        for part in (items[:middle], items[middle:]):
+            try:
+                self.handlers[kind](part)
+                self._count("processed", len(part))
+            except Exception:
+                self._isolate(kind, part)
+
+    def flush(self, timeout=WRITER_SHUTDOWN_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._queue.unfinished_tasks == 0
+
+    def shutdown(self, timeout=WRITER_SHUTDOWN_TIMEOUT):
+        self._stopping = True
+        flushed = self.flush(timeout)
+        if not flushed:
+            print(f"❌ Write-behind berhenti dengan {self._queue.unfinished_tasks} item belum tersimpan")
+        return flushed
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters.update({
+            "depth": self._queue.qsize(),
+            "maxsize": self._queue.maxsize,
+            "workers": len(self._threads),
+        })
+        return counters
+
+
+def create_writer(handlers, **kwargs):
+    writer = WriteBehindQueue(handlers, **kwargs)
+    # Pastikan antrian dikosongkan saat proses berhenti
+    atexit.register(writer.shutdown)
+    return writer
@@ -1,36 +1,257 @@
-import datetime, requests, os
-from flask import jsonify
+import datetime, requests, os, time, queue, atexit, threading
+from collections import Counter
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from model.settings import org_setting
+
 load_dotenv()
 GOOGLE_CHAT_WEBHOOK_URL = os.getenv("GOOGLE_CHAT_KEY")
 
-def notification(respon, noHandphone, question):
+# "digest" (ringkasan per jendela waktu) atau "immediate" (satu pesan per pertanyaan)
+NOTIFY_MODE = os.getenv("NOTIFY_MODE", "digest")
+NOTIFY_WINDOW = float(os.getenv("NOTIFY_WINDOW", "60"))
+# Jenis event yang dikirim, bisa di-override per organisasi lewat ORG_SETTINGS "notify_events"
+NOTIFY_EVENTS = os.getenv("NOTIFY_EVENTS", "Not Found,Article Found")
+NOTIFY_TOP_QUESTIONS = int(os.getenv("NOTIFY_TOP_QUESTIONS", "5"))
+# Batas pertanyaan berbeda yang dihitung per jendela, sisanya hanya masuk hitungan total
+NOTIFY_MAX_QUESTIONS = int(os.getenv("NOTIFY_MAX_QUESTIONS", "1000"))
+# Google Chat membatasi pesan per space, kirim di bawah batas itu
+NOTIFY_RATE_PER_MINUTE = float(os.getenv("NOTIFY_RATE_PER_MINUTE", "30"))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "10"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+NOTIFY_BACKOFF = float(os.getenv("NOTIFY_BACKOFF", "1.0"))
+NOTIFY_QUEUE_MAX = int(os.getenv("NOTIFY_QUEUE_MAX", "1000"))
+NOTIFY_SHUTDOWN_TIMEOUT = float(os.getenv("NOTIFY_SHUTDOWN_TIMEOUT", "10"))
+
+LOG_URL = "https://dev.nwa.nusa.net.id/?phone={phone}&phone_number_id=194329327102301"
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def parse_events(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return {event.strip() for event in value or () if event.strip()}
+
+
+def format_event(respon, noHandphone, question):
     today = datetime.date.today().strftime("%Y-%m-%d")
+    text = (
+        f"*---- RAG Notifikasi ----*\n\n"
+        f"*⏰ Tanggal:* {today}\n\n"
+        f"*📞 Log:* {LOG_URL.format(phone=noHandphone)}\n\n"
+        f"*❓ Pertanyaan User:* {question}\n\n"
+    )
     if respon == "Not Found":
-        text = (
-            f"*---- RAG Notifikasi ----*\n\n"
-            f"*⏰ Tanggal:* {today}\n\n"
-            f"*📞 Log:* https://dev.nwa.nusa.net.id/?phone={noHandphone}&phone_number_id=194329327102301\n\n"
-            f"*❓ Pertanyaan User:* {question}\n\n"
-
-            f"Pertanyaan ini tidak dapat di respon oleh AI."
-        )
-    else:
-        text = (
-            f"*---- RAG Notifikasi ----*\n\n"
-            f"*⏰ Tanggal:* {today}\n\n"
-            f"*📞 Log:* https://dev.nwa.nusa.net.id/?phone={noHandphone}&phone_number_id=194329327102301\n\n"
-            f"*❓ Pertanyaan User:* {question}\n\n"
-        )
-    
-    payload = {
-        "text": text
-    }
-
-    resp = requests.post(GOOGLE_CHAT_WEBHOOK_URL, json=payload)
-
-    return jsonify({
-        "ok": resp.ok,
-        "status_code": resp.status_code,
-        "chat_response": resp.text
-    }), 200
\ No newline at end of file
+        text += "Pertanyaan ini tidak dapat di respon oleh AI."
+    return text
+
+
+class _Window:
+    def __init__(self):
+        self.started = datetime.datetime.now()
+        self.counts = Counter()
+        self.unanswered = Counter()
+        # Pertanyaan ternormalisasi -> (teks asli, session terakhir)
+        self.samples = {}
+        self.last = None
+
+    def add(self, event, session_id, question):
+        self.counts[event] += 1
+        self.last = (event, session_id, question)
+        if event != "Not Found":
+            return
+        key = " ".join((question or "").lower().split())
+        if key in self.unanswered or len(self.unanswered) < NOTIFY_MAX_QUESTIONS:
+            self.unanswered[key] += 1
+            self.samples[key] = (question, session_id)
+
+    def render(self, organization_id, top=NOTIFY_TOP_QUESTIONS):
+        total = sum(self.counts.values())
+        # Hanya satu event: pakai format pesan tunggal seperti biasa
+        if total == 1:
+            return format_event(*self.last)
+        ended = datetime.datetime.now()
+        lines = [
+            "*---- RAG Notifikasi (ringkasan) ----*\n",
+            f"*⏰ Periode:* {self.started:%Y-%m-%d %H:%M:%S} - {ended:%H:%M:%S}",
+            f"*🏢 Organisasi:* {organization_id}",
+            f"*📊 Jumlah:* {total} pertanyaan ("
+            + ", ".join(f"{event}: {count}" for event, count in self.counts.most_common()) + ")",
+        ]
+        if self.unanswered:
+            lines.append("\n*❓ Pertanyaan tidak terjawab teratas:*")
+            for i, (key, count) in enumerate(self.unanswered.most_common(top), 1):
+                question, session_id = self.samples[key]
+                if len(question) > 200:
+                    question = question[:200] + "…"
+                lines.append(f"{i}. ({count}x) {question}\n    {LOG_URL.format(phone=session_id)}")
+        return "\n".join(lines)
+
+
+class NotificationDispatcher:
+    """
+    Notifikasi Google Chat: event dikumpulkan per organisasi per jendela waktu
+    menjadi satu pesan ringkasan, lalu dikirim oleh thread background lewat
+    session keep-alive dengan rate limit dan backoff.
+    """
+
+    def __init__(self, mode=NOTIFY_MODE, window=NOTIFY_WINDOW, rate_per_minute=NOTIFY_RATE_PER_MINUTE):
+        self.mode = mode
+        self.window = window
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self._windows = {}
+        self._outbox = queue.Queue(maxsize=NOTIFY_QUEUE_MAX)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._next_send = {}
+        self._session = None
+        self.counters = {"events": 0, "filtered": 0, "messages": 0, "sent": 0, "retries": 0, "failed": 0, "dropped": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    @property
+    def session(self):
+        if self._session is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def _ensure_started(self):
+        if self._thread:
+            return
+        with self._lock:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._worker, name="notifier", daemon=True)
+            self._thread.start()
+
+    def notify(self, event, session_id, question, organization_id=None):
+        # Dipanggil dari jalur request: hanya mencatat event, tidak pernah menunggu HTTP
+        if event not in parse_events(org_setting(organization_id, "notify_events", NOTIFY_EVENTS)):
+            self._count("filtered")
+            return
+        webhook = org_setting(organization_id, "notify_webhook", GOOGLE_CHAT_WEBHOOK_URL)
+        if not webhook:
+            self._count("dropped")
+            return
+        self._count("events")
+        if self._stopping:
+            self.send(webhook, format_event(event, session_id, question))
+            return
+        self._ensure_started()
+        if org_setting(organization_id, "notify_mode", self.mode) == "immediate":
+            self._put(webhook, format_event(event, session_id, question))
+            return
+        with self._lock:
+            window = self._windows.setdefault((organization_id, webhook), _Window())
+            window.add(event, session_id, question)
+
+    def _put(self, webhook, text):
+        try:
+            self._outbox.put_nowait((webhook, text))
+            self._count("messages")
+        except queue.Full:
+            # Google Chat sedang lambat/membatasi: pesan dibuang daripada menumpuk di memori
+            self._count("dropped")
+
+    def flush_windows(self):
+        with self._lock:
+            windows, self._windows = self._windows, {}
+        for (organization_id, webhook), window in windows.items():
+            self._put(webhook, window.render(organization_id))
+
+    def _wait_rate(self, webhook):
+        # Rate limit per webhook: jarak minimal antar pesan
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_send.get(webhook, now))
+            self._next_send[webhook] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def send(self, webhook, text):
+        for attempt in range(NOTIFY_MAX_RETRIES + 1):
+            self._wait_rate(webhook)
+            try:
+                resp = self.session.post(webhook, json={"text": text}, timeout=NOTIFY_TIMEOUT)
+            except requests.RequestException as e:
+                resp, error = None, str(e)
+            else:
+                if resp.ok:
+                    self._count("sent")
+                    return {"ok": True, "status_code": resp.status_code, "chat_response": resp.text}
+                error = f"{resp.status_code} {resp.text}"
+            retryable = resp is None or resp.status_code in RETRY_STATUS
+            if not retryable or attempt == NOTIFY_MAX_RETRIES:
+                break
+            self._count("retries")
+            delay = NOTIFY_BACKOFF * (2 ** attempt)
+            if resp is not None and resp.headers.get("Retry-After", "").isdigit():
+                delay = max(delay, float(resp.headers["Retry-After"]))
+            time.sleep(delay)
+
+        self._count("failed")
+        print(f"❌ Gagal mengirim notifikasi Google Chat: {error}")
+        return {"ok": False, "status_code": resp.status_code if resp is not None else None, "chat_response": error}
+
+    def _worker(self):
+        next_flush = time.monotonic() + self.window
+        while True:
+            try:
+                webhook, text = self._outbox.get(timeout=max(0.05, min(1.0, next_flush - time.monotonic())))
+            except queue.Empty:
+                if self._stopping:
+                    return
+            else:
+                try:
+                    self.send(webhook, text)
+                finally:
+                    self._outbox.task_done()
+            if time.monotonic() >= next_flush:
+                self.flush_windows()
+                next_flush = time.monotonic() + self.window
+
+    def shutdown(self, timeout=NOTIFY_SHUTDOWN_TIMEOUT):
+        # Ringkasan jendela yang sedang berjalan tetap dikirim sebelum proses berhenti
+        self.flush_windows()
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        while self._thread and self._outbox.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self._outbox.unfinished_tasks:
+            print(f"❌ Notifier berhenti dengan {self._outbox.unfinished_tasks} pesan belum terkirim")
+            return False
+        return True
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            pending_events = sum(sum(w.counts.values()) for w in self._windows.values())
+        counters.update({
+            "mode": self.mode,
+            "window_seconds": self.window,
+            "pending_events": pending_events,
+            "outbox": self._outbox.qsize(),
+        })
+        return counters
+
+
+notifier = NotificationDispatcher()
+atexit.register(notifier.shutdown)
+
+
+def notification(respon, noHandphone, question, organization_id=None):
+    # Kirim langsung (sinkron) satu notifikasi, tetap lewat session, timeout dan rate limit notifier
+    webhook = org_setting(organization_id, "notify_webhook", GOOGLE_CHAT_WEBHOOK_URL)
+    # Dict biasa (bukan jsonify) agar bisa dipanggil di luar request context
+    if not webhook:
+        notifier._count("dropped")
+        return {"ok": False, "status_code": None, "chat_response": "Webhook Google Chat belum dikonfigurasi"}
+    return notifier.send(webhook, format_event(respon, noHandphone, question))
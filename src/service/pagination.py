@@ -0,0 +1,69 @@
+import os, json, base64
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+
+# Cursor keyset dikirim ke client sebagai string opaque (base64 dari JSON)
+def encode_cursor(*values):
+    raw = json.dumps([v.isoformat() if hasattr(v, "isoformat") else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _valid_cursor_value(kind, value):
+    if kind == "id":
+        return isinstance(value, int) and not isinstance(value, bool)
+    if kind == "time":
+        if not isinstance(value, str):
+            return False
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            return False
+        return True
+    raise ValueError(f"Jenis cursor tidak dikenal: {kind}")
+
+
+# kinds = jenis tiap nilai sesuai urutan keyset, mis. decode_cursor(cursor, "time", "id")
+def decode_cursor(cursor, *kinds):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise ValueError("Cursor tidak valid")
+    # Cursor yang diedit tidak boleh sampai ke SQL
+    if not isinstance(values, list) or len(values) != len(kinds):
+        raise ValueError("Cursor tidak valid")
+    if not all(_valid_cursor_value(kind, value) for kind, value in zip(kinds, values)):
+        raise ValueError("Cursor tidak valid")
+    return values
+
+
+def parse_limit(value, default=PAGE_SIZE_DEFAULT):
+    if value in (None, ""):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit harus berupa integer")
+    if limit < 1:
+        raise ValueError("limit minimal 1")
+    return min(limit, PAGE_SIZE_MAX)
+
+
+def parse_fields(value, allowed, default):
+    # ?fields=a,b,c -> daftar kolom yang diizinkan, urutan sesuai permintaan
+    if not value:
+        return list(default)
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Field tidak dikenal: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
@@ -0,0 +1,170 @@
+import os, time, threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+PROXY_CONNECT_TIMEOUT = float(os.getenv("PROXY_CONNECT_TIMEOUT", "5"))
+PROXY_READ_TIMEOUT = float(os.getenv("PROXY_READ_TIMEOUT", "60"))
+PROXY_POOL_SIZE = int(os.getenv("PROXY_POOL_SIZE", "20"))
+# Host tujuan yang boleh diteruskan, dipisah koma (mis. api.nusa.net.id,users.nusa.net.id).
+# Kosong = semua host diizinkan
+PROXY_ALLOWED_HOSTS = {h.strip().lower() for h in os.getenv("PROXY_ALLOWED_HOSTS", "").split(",") if h.strip()}
+# Jumlah host maksimal yang session keep-alive-nya disimpan (LRU, session tertua ditutup)
+PROXY_MAX_SESSIONS = int(os.getenv("PROXY_MAX_SESSIONS", "16"))
+PROXY_CHUNK_SIZE = int(os.getenv("PROXY_CHUNK_SIZE", "65536"))
+# Dipakai jika TOKEN_API tidak mengirim expires_in
+PROXY_TOKEN_TTL = float(os.getenv("PROXY_TOKEN_TTL", "300"))
+# Token diperbarui sebelum benar-benar kedaluwarsa
+PROXY_TOKEN_MARGIN = float(os.getenv("PROXY_TOKEN_MARGIN", "30"))
+
+
+class UpstreamTokenError(Exception):
+    pass
+
+
+def check_target(url):
+    # url_target datang dari caller: hanya http(s) dan host yang ada di allowlist
+    parts = urlsplit(url or "")
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("url_target harus URL http/https")
+    if PROXY_ALLOWED_HOSTS and parts.hostname.lower() not in PROXY_ALLOWED_HOSTS:
+        raise ValueError(f"Host {parts.hostname} tidak diizinkan")
+    return url
+
+
+class UpstreamProxy:
+    """
+    Meneruskan request ke API upstream: token upstream di-cache per set
+    kredensial sampai mendekati kedaluwarsa, session keep-alive per host,
+    dan body response di-stream tanpa dibuffer.
+    """
+
+    def __init__(self, timeout=(PROXY_CONNECT_TIMEOUT, PROXY_READ_TIMEOUT), max_sessions=PROXY_MAX_SESSIONS):
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self._tokens = {}
+        self._token_locks = {}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"token_fetches": 0, "token_hits": 0, "requests": 0, "retries_401": 0, "sessions_evicted": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def session(self, url):
+        host = urlsplit(url).netloc.lower()
+        evicted = []
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PROXY_POOL_SIZE)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                while len(self._sessions) > self.max_sessions:
+                    evicted.append(self._sessions.popitem(last=False)[1])
+                    self.counters["sessions_evicted"] += 1
+            else:
+                self._sessions.move_to_end(host)
+        # Request yang masih memakai session lama tetap selesai; koneksi idle-nya ditutup
+        for old in evicted:
+            old.close()
+        return session
+
+    def get_token(self, token_url, client_id, client_secret, force=False):
+        key = (token_url, client_id)
+        cached = self._tokens.get(key)
+        if not force and cached and cached[1] > time.monotonic():
+            self._count("token_hits")
+            return cached[0]
+
+        # Single-flight: hanya satu request ke TOKEN_API per set kredensial
+        with self._lock:
+            lock = self._token_locks.setdefault(key, threading.Lock())
+        with lock:
+            cached = self._tokens.get(key)
+            if not force and cached and cached[1] > time.monotonic():
+                self._count("token_hits")
+                return cached[0]
+            try:
+                resp = self.session(token_url).post(
+                    token_url, auth=(client_id, client_secret), timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                raise UpstreamTokenError(str(e))
+            if resp.status_code != 200:
+                raise UpstreamTokenError(resp.text)
+            # Response TOKEN_API yang rusak adalah kegagalan upstream, bukan request caller yang salah
+            try:
+                data = resp.json()
+                token = data["access_token"]
+                expires_in = float(data.get("expires_in") or PROXY_TOKEN_TTL)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise UpstreamTokenError(f"Response TOKEN_API tidak valid: {e!r}")
+            ttl = max(expires_in - PROXY_TOKEN_MARGIN, expires_in / 2)
+            self._tokens[key] = (token, time.monotonic() + ttl)
+            self._count("token_fetches")
+            return token
+
+    def invalidate(self, token_url, client_id, token):
+        key = (token_url, client_id)
+        cached = self._tokens.get(key)
+        if cached and cached[0] == token:
+            self._tokens.pop(key, None)
+
+    def forward(self, credentials, method, url, payload=None):
+        """
+        credentials = (token_url, client_id, client_secret). Mengembalikan
+        requests.Response dengan stream=True; pemanggil wajib menutupnya.
+        """
+        token_url, client_id, client_secret = credentials
+        check_target(url)
+        token = self.get_token(token_url, client_id, client_secret)
+        session = self.session(url)
+
+        def send(token):
+            self._count("requests")
+            return session.request(
+                method, url,
+                headers={"Authorization": f"Bearer {token}"},
+                json=payload,
+                timeout=self.timeout,
+                stream=True,
+            )
+
+        resp = send(token)
+        if resp.status_code == 401:
+            # Token di-cache mungkin sudah dicabut upstream, ambil baru sekali
+            resp.close()
+            self._count("retries_401")
+            self.invalidate(token_url, client_id, token)
+            resp = send(self.get_token(token_url, client_id, client_secret, force=True))
+        return resp
+
+    def iter_body(self, resp):
+        try:
+            for chunk in resp.iter_content(chunk_size=PROXY_CHUNK_SIZE):
+                if chunk:
+                    yield chunk
+        finally:
+            resp.close()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters.update({
+            "cached_tokens": len(self._tokens),
+            "hosts": list(self._sessions),
+            "allowed_hosts": sorted(PROXY_ALLOWED_HOSTS) or None,
+        })
+        return counters
+
+
+upstream_proxy = UpstreamProxy()
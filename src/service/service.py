@@ -1,13 +1,59 @@
+import os
+from psycopg2.extras import execute_values
+
 from connection.connection import get_connection
-from model.model import convert, ask #, check_question
+from model.model import convert, ask, ask_stream, aask, aask_stream #, check_question
+from model.embedding import iter_embedded_chunks, EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+from model.answer_cache import answer_cache
+from model.chunks import safe_index_articles
+from model.memory_index import memory_index
+from service.pagination import encode_cursor, decode_cursor
+
+ARTICLE_BATCH_SIZE = int(os.getenv("ARTICLE_BATCH_SIZE", "500"))
+# Kunci advisory lock untuk sinkronisasi question_articles
+RELINK_LOCK_KEY = 72001
+
+# Kolom /articles dan /questions yang boleh diminta lewat ?fields=
+ARTICLE_FIELDS = {
+    "id": "a.id",
+    "title": "a.title",
+    "content": "a.content",
+    "author": "a.author",
+    "organization_id": "a.organization_id",
+    "organization_name": "o.name AS organization_name",
+    "status": "a.status",
+    "created_by": "a.created_by",
+    "updated_by": "a.updated_by",
+    "created_at": "a.created_at",
+}
+QUESTION_FIELDS = {
+    "id": "q.id",
+    "question": "q.question",
+    "status": "q.status",
+    "created_by": "q.created_by",
+    "updated_by": "q.updated_by",
+    "created_at": "q.created_at",
+    "updated_at": "q.updated_at",
+    "organization_id": "q.organization_id",
+    "organization_name": "o.name AS organization_name",
+    # diisi dari question_articles, bukan kolom
+    "articles": None,
+}
+QUESTION_ARTICLE_MODES = ("full", "summary", "ref", "none")
+
+def page_result(rows, limit, cursor_of):
+    # rows berisi maksimal limit + 1 baris; baris ekstra menandakan ada halaman berikutnya
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*cursor_of(rows[-1]))
+    data = [{k: v for k, v in row.items() if not k.startswith("_cursor_")} for row in rows]
+    return {"data": data, "next_cursor": next_cursor}
 
 
 class ArticleService:
     # Menginput artikel ke database
     def create_article(self, article):
-        conn = get_connection()
-        cur = conn.cursor()
-
         query = """
                     INSERT INTO articles (id, title, content, author, organization_id, status, created_by, updated_by)
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
@@ -35,82 +81,126 @@ class ArticleService:
             article.get("updated_by")
         ]
 
-        cur.execute(query, values)
-        result = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, values)
+            result = cur.fetchone()
+            conn.commit()
 
+        # Jawaban yang memakai artikel ini tidak lagi valid
+        answer_cache.invalidate_articles([article.get("id")])
+        memory_index.refresh_articles([article.get("id")])
+        # Potongan + embedding untuk konteks jawaban, dibuat setelah artikel tersimpan
+        safe_index_articles([result])
         return result
     
-    def create_article_batch(self, pairs: list[dict]):
-        conn = get_connection()
-        cur = conn.cursor()
-        try:
-                for item in pairs:
-                    article_id = item["id"]
-                    title = item["title"]
-                    content = item["content"]
-                    author = item["author"]
-                    organization_id = item["organization_id"]
-                    status = item["status"]
-                    created_by = item["created_by"]
-                    updated_by = item["updated_by"]
-
-                    cur.execute(
-                        """
-                        INSERT INTO articles (id, title, content, author, organization_id, status, created_by, updated_by)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                                ON CONFLICT (id)
-                                DO UPDATE SET
-                                    title = EXCLUDED.title,
-                                    content = EXCLUDED.content,
-                                    author = EXCLUDED.author,
-                                    organization_id = EXCLUDED.organization_id,
-                                    status = EXCLUDED.status,
-                                    created_by = EXCLUDED.created_by,
-                                    updated_by = EXCLUDED.updated_by
-                                RETURNING *
-                        """,
-                        (article_id, title, content, author, organization_id, status, created_by, updated_by)
+    def create_article_batch(self, pairs, chunk_size=None, chunked_commit=False):
+        # `pairs` boleh list atau iterator (mis. body NDJSON yang di-stream)
+        chunk_size = chunk_size or ARTICLE_BATCH_SIZE
+        query = """
+            INSERT INTO articles (id, title, content, author, organization_id, status, created_by, updated_by)
+                VALUES %s
+                    ON CONFLICT (id)
+                    DO UPDATE SET
+                        title = EXCLUDED.title,
+                        content = EXCLUDED.content,
+                        author = EXCLUDED.author,
+                        organization_id = EXCLUDED.organization_id,
+                        status = EXCLUDED.status,
+                        created_by = EXCLUDED.created_by,
+                        updated_by = EXCLUDED.updated_by
+        """
+
+        processed = 0
+        committed = 0
+        touched = []
+        pending_chunks = {}
+        with get_connection() as conn, conn.cursor() as cur:
+            def flush(chunk):
+                # id duplikat dalam satu statement tidak boleh, ambil yang terakhir
+                rows = list({
+                    item["id"]: (
+                        item["id"], item["title"], item["content"], item["author"],
+                        item["organization_id"], item["status"], item["created_by"], item["updated_by"],
                     )
+                    for item in chunk
+                }.values())
+                execute_values(cur, query, rows, page_size=len(rows))
+                touched.extend(row[0] for row in rows)
+                for row in rows:
+                    pending_chunks[row[0]] = {"id": row[0], "title": row[1], "content": row[2]}
+
+            try:
+                chunk = []
+                for item in pairs:
+                    chunk.append(item)
+                    if len(chunk) >= chunk_size:
+                        flush(chunk)
+                        processed += len(chunk)
+                        if chunked_commit:
+                            conn.commit()
+                            committed = processed
+                            answer_cache.invalidate_articles(touched)
+                            memory_index.refresh_articles(touched)
+                            touched = []
+                            safe_index_articles(list(pending_chunks.values()))
+                            pending_chunks.clear()
+                        chunk = []
+                if chunk:
+                    flush(chunk)
+                    processed += len(chunk)
 
                 conn.commit()
-                return {"success": True} 
+                # Jawaban yang memakai artikel-artikel ini tidak lagi valid
+                answer_cache.invalidate_articles(touched)
+                memory_index.refresh_articles(touched)
+                safe_index_articles(list(pending_chunks.values()))
+                return {"success": True, "processed": processed}
 
-        except Exception as e:
+            except Exception as e:
                 conn.rollback()
+                e.committed = committed
                 raise e
 
-        finally:
-                cur.close()
-                conn.close()
-
-    
     # Mengakses seluruh data artikel pada database
-    def get_all_articles(self):
-        conn = get_connection()
-        cur = conn.cursor()
-
-        query = """
-                SELECT a.*, o.name AS organization_name
+    # Tanpa limit/cursor seluruh artikel dikembalikan (perilaku lama)
+    def get_all_articles(self, fields=None, filters=None, cursor=None, limit=None):
+        filters = filters or {}
+        columns = "a.*, o.name AS organization_name"
+        if fields:
+            columns = ", ".join(ARTICLE_FIELDS[f] for f in fields)
+        where = []
+        params = {}
+        if filters.get("organization_id") is not None:
+            where.append("a.organization_id = %(organization_id)s")
+            params["organization_id"] = filters["organization_id"]
+        if filters.get("status"):
+            where.append("a.status = %(status)s")
+            params["status"] = filters["status"]
+        after = decode_cursor(cursor, "time", "id")
+        if after:
+            where.append("(a.created_at, a.id) < (%(cursor_time)s, %(cursor_id)s)")
+            params["cursor_time"], params["cursor_id"] = after
+
+        query = f"""
+                SELECT {columns}, a.created_at AS _cursor_time, a.id AS _cursor_id
                 FROM articles a
                 LEFT JOIN organizations o ON a.organization_id = o.id
-                ORDER BY a.created_at DESC
+                {"WHERE " + " AND ".join(where) if where else ""}
+                ORDER BY a.created_at DESC, a.id DESC
         """
+        if limit:
+            # Satu baris lebih untuk tahu masih ada halaman berikutnya
+            query += " LIMIT %(limit)s"
+            params["limit"] = limit + 1
 
-        cur.execute(query)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
 
-        return rows
+        return page_result(rows, limit, lambda row: (row["_cursor_time"], row["_cursor_id"]))
 
     # Mengakses artikel berdasarkan id pada database
     def get_article_by_id(self, article_id):
-        conn = get_connection()
-        cur = conn.cursor()
-
         query = """
                 SELECT a.*, o.name AS organization_name
                 FROM articles a
@@ -118,261 +208,310 @@ class ArticleService:
                 WHERE a.id = %s
         """
 
-        cur.execute(query, (article_id))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, (article_id))
+            row = cur.fetchone()
 
         return row if row else None
     
     def getArticle_Id(self):
-        conn = get_connection()
-        cur = conn.cursor()
-
-        cur.execute("SELECT id, title, content FROM articles ORDER BY ID ASC;")
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id, title, content FROM articles ORDER BY ID ASC;")
+            rows = cur.fetchall()
 
         return rows
 
     def deleteArticle(self, articelId):
-        conn = get_connection();
-        cur = conn.cursor()
-
-        cur.execute("DELETE FROM articles WHERE id = %s", (articelId.get("id"),))
-        conn.commit()  # pastikan perubahan disimpan
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM articles WHERE id = %s", (articelId.get("id"),))
+            conn.commit()  # pastikan perubahan disimpan
 
-        cur.close()
-        conn.close()
+        answer_cache.invalidate_articles([articelId.get("id")])
+        memory_index.refresh_articles([articelId.get("id")])
         return "ok", 200
 
 class QuestionService:
     def create_questions(self, questions):
-        conn = get_connection()
-        cur = conn.cursor()
-        try:
-            questions_vector = convert(questions.get("question"))
-            if questions_vector is None:
-                raise Exception("Gagal dalam mengkonversi vektor.")
-
-            query = """
-                INSERT INTO questions (
-                    id, question, question_vector, organization_id, created_by, updated_by, status
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id)
-                    DO UPDATE SET
-                        question = EXCLUDED.question,
-                        question_vector = EXCLUDED.question_vector,
-                        organization_id = EXCLUDED.organization_id,
-                        created_by = EXCLUDED.created_by,
-                        updated_by = EXCLUDED.updated_by,
-                        status = EXCLUDED.status
-                RETURNING *;
-            """
+        with get_connection() as conn, conn.cursor() as cur:
+            try:
+                questions_vector = convert(questions.get("question"))
+                if questions_vector is None:
+                    raise Exception("Gagal dalam mengkonversi vektor.")
+
+                query = """
+                    INSERT INTO questions (
+                        id, question, question_vector, organization_id, created_by, updated_by, status
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (id)
+                        DO UPDATE SET
+                            question = EXCLUDED.question,
+                            question_vector = EXCLUDED.question_vector,
+                            organization_id = EXCLUDED.organization_id,
+                            created_by = EXCLUDED.created_by,
+                            updated_by = EXCLUDED.updated_by,
+                            status = EXCLUDED.status
+                    RETURNING *;
+                """
 
-            updated_by = questions.get("updated_by") or questions.get("created_by")
+                updated_by = questions.get("updated_by") or questions.get("created_by")
 
-            cur.execute(query, (
-                questions.get("id"),
-                questions.get("question"),
-                questions_vector,
-                questions.get("organization_id"),
-                questions.get("created_by"),
-                updated_by,
-                questions.get("status"),
-            ))
+                cur.execute(query, (
+                    questions.get("id"),
+                    questions.get("question"),
+                    questions_vector,
+                    questions.get("organization_id"),
+                    questions.get("created_by"),
+                    updated_by,
+                    questions.get("status"),
+                ))
 
-            question_id = cur.fetchone()["id"]
-            conn.commit()
+                question_id = cur.fetchone()["id"]
+                conn.commit()
+                memory_index.refresh_questions(questions.get("organization_id"), [question_id])
 
-            return {
-                "id": question_id,
-                "question": questions.get("question"),
-                "organization_id": questions.get("organization_id")
-            }
+                return {
+                    "id": question_id,
+                    "question": questions.get("question"),
+                    "organization_id": questions.get("organization_id")
+                }
 
-        except Exception as e:
-            conn.rollback()
-            raise e
+            except Exception as e:
+                conn.rollback()
+                raise e
 
-        finally:
-            cur.close()
-            conn.close()
+    def create_question_batch(self, pairs: list[dict], batch_size=None, concurrency=None):
+        batch_size = batch_size or EMBED_BATCH_SIZE
+        concurrency = concurrency or EMBED_CONCURRENCY
 
-    def create_question_batch(self, pairs: list[dict]):
-        conn = get_connection()
-        cur = conn.cursor()
-        try:
-                for item in pairs:
-                    question_id = item["id"]
-                    question = item["question"]
-                    question_vector = convert(item["question"])
-                    organization_id = item["organization_id"]
-                    created_by = item["created_by"]
-                    updated_by = item["updated_by"]
-                    status = item["status"]
-
-                    cur.execute(
-                        """
-                            INSERT INTO questions (
-                                id, question, question_vector, organization_id, created_by, updated_by, status
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (id)
-                                DO UPDATE SET
-                                    question = EXCLUDED.question,
-                                    question_vector = EXCLUDED.question_vector,
-                                    organization_id = EXCLUDED.organization_id,
-                                    created_by = EXCLUDED.created_by,
-                                    updated_by = EXCLUDED.updated_by,
-                                    status = EXCLUDED.status
-                            RETURNING *;
-                        """,
-                        (question_id, question, question_vector, organization_id, created_by, updated_by, status)
+        # ON CONFLICT tidak boleh menyentuh baris yang sama dua kali dalam satu statement,
+        # jadi id duplikat diambil yang terakhir
+        items = list({item["id"]: item for item in pairs}.values())
+        texts = [item["question"] for item in items]
+
+        query = """
+            INSERT INTO questions (
+                id, question, question_vector, organization_id, created_by, updated_by, status
+            ) VALUES %s
+            ON CONFLICT (id)
+                DO UPDATE SET
+                    question = EXCLUDED.question,
+                    question_vector = EXCLUDED.question_vector,
+                    organization_id = EXCLUDED.organization_id,
+                    created_by = EXCLUDED.created_by,
+                    updated_by = EXCLUDED.updated_by,
+                    status = EXCLUDED.status
+            RETURNING id;
+        """
+
+        progress = []
+        saved_ids = []
+        with get_connection() as conn, conn.cursor() as cur:
+            try:
+                for offset, vectors in iter_embedded_chunks(texts, batch_size, concurrency):
+                    chunk = items[offset:offset + len(vectors)]
+                    rows = [
+                        (
+                            item["id"],
+                            item["question"],
+                            vector,
+                            item["organization_id"],
+                            item["created_by"],
+                            item.get("updated_by") or item["created_by"],
+                            item["status"],
+                        )
+                        for item, vector in zip(chunk, vectors)
+                    ]
+                    result = execute_values(
+                        cur, query, rows,
+                        template="(%s, %s, %s::vector, %s, %s, %s, %s)",
+                        page_size=len(rows),
+                        fetch=True,
                     )
+                    saved_ids.extend(row["id"] for row in result)
+                    progress.append({
+                        "chunk": len(progress) + 1,
+                        "size": len(rows),
+                        "processed": offset + len(rows),
+                        "total": len(items),
+                    })
 
                 conn.commit()
-                return {"success": True} 
-
-        except Exception as e:
+                # Index memori cukup memuat ulang pertanyaan yang baru ditulis
+                by_org = {}
+                for item in items:
+                    by_org.setdefault(item["organization_id"], []).append(item["id"])
+                for organization_id, ids in by_org.items():
+                    memory_index.refresh_questions(organization_id, ids)
+                return {"success": True, "data": saved_ids, "chunks": progress}
+
+            except Exception as e:
                 conn.rollback()
                 raise e
 
-        finally:
-                cur.close()
-                conn.close()
-
-
-
-    def attach_articles_to_questions_batch(self, pairs: list[dict]):
-        conn = None
-        cur = None
-        
-        try:
-            if not pairs:
+    def attach_articles_to_questions_batch(self, pairs: list[dict], full_replace=False):
+        if not pairs:
+            return {
+                "success": False,
+                "message": "Tidak ada data untuk diproses."
+            }
+        validated_pairs = []
+        for i, item in enumerate(pairs):
+            try:
+                question_id = int(item["question_id"])
+                article_id = int(item["article_id"])
+                validated_pairs.append((question_id, article_id))
+            except (ValueError, KeyError) as e:
                 return {
                     "success": False,
-                    "message": "Tidak ada data untuk diproses."
+                    "message": f"Data tidak valid pada item {i+1}: {str(e)}"
                 }
-            validated_pairs = []
-            for i, item in enumerate(pairs):
-                try:
-                    question_id = int(item["question_id"])
-                    article_id = int(item["article_id"])
-                    validated_pairs.append((question_id, article_id))
-                except (ValueError, KeyError) as e:
-                    return {
-                        "success": False,
-                        "message": f"Data tidak valid pada item {i+1}: {str(e)}"
-                    }
 
-            conn = get_connection()
-            cur = conn.cursor()
+        with get_connection() as conn, conn.cursor() as cur:
+            try:
+                question_ids = list({q for q, a in validated_pairs})
+                article_ids = list({a for q, a in validated_pairs})
 
-            question_ids = list({q for q, a in validated_pairs})
-            article_ids = list({a for q, a in validated_pairs})
+                # FIX: Gunakan key name, bukan index
+                cur.execute("SELECT id FROM questions WHERE id = ANY(%s)", (question_ids,))
+                found_questions = {row['id'] for row in cur.fetchall()}  # ← PERBAIKAN!
 
-            # FIX: Gunakan key name, bukan index
-            cur.execute("SELECT id FROM questions WHERE id = ANY(%s)", (question_ids,))
-            found_questions = {row['id'] for row in cur.fetchall()}  # ← PERBAIKAN!
+                cur.execute("SELECT id FROM articles WHERE id = ANY(%s)", (article_ids,))
+                found_articles = {row['id'] for row in cur.fetchall()}  # ← PERBAIKAN!
 
-            cur.execute("SELECT id FROM articles WHERE id = ANY(%s)", (article_ids,))
-            found_articles = {row['id'] for row in cur.fetchall()}  # ← PERBAIKAN!
-
-            missing_questions = set(question_ids) - found_questions
-            missing_articles = set(article_ids) - found_articles
-            if missing_questions or missing_articles:
-                return {
-                    "success": False,
-                    "message": "ID tidak valid ditemukan.",
-                    "missing_questions": list(missing_questions),
-                    "missing_articles": list(missing_articles),
-                }
-
-            # Truncate dan insert
-            cur.execute("TRUNCATE TABLE question_articles RESTART IDENTITY;")
-            
-            insert_query = """
-                INSERT INTO question_articles (question_id, article_id, created_at)
-                VALUES (%s, %s, NOW())
-            """
+                missing_questions = set(question_ids) - found_questions
+                missing_articles = set(article_ids) - found_articles
+                if missing_questions or missing_articles:
+                    return {
+                        "success": False,
+                        "message": "ID tidak valid ditemukan.",
+                        "missing_questions": list(missing_questions),
+                        "missing_articles": list(missing_articles),
+                    }
 
-            cur.executemany(insert_query, validated_pairs)
-            conn.commit()
+                insert_query = """
+                    INSERT INTO question_articles (question_id, article_id, created_at)
+                    VALUES %s
+                """
+                insert_template = "(%s, %s, NOW())"
+
+                if full_replace:
+                    # Mode lama: truncate dan insert ulang seluruh relasi
+                    cur.execute("TRUNCATE TABLE question_articles RESTART IDENTITY;")
+                    execute_values(cur, insert_query, validated_pairs,
+                                   template=insert_template, page_size=len(validated_pairs))
+                    conn.commit()
+                    answer_cache.clear()
+                    memory_index.invalidate()
+                    return {"success": True, "added": len(validated_pairs), "removed": None}
+
+                # Mode diff: hanya tambah/hapus selisih terhadap isi tabel saat ini.
+                # Advisory lock mencegah dua sync berjalan bersamaan tanpa mengunci pembaca.
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (RELINK_LOCK_KEY,))
+                cur.execute("SELECT question_id, article_id FROM question_articles")
+                current = {(row["question_id"], row["article_id"]) for row in cur.fetchall()}
+                desired = set(validated_pairs)
+
+                to_remove = list(current - desired)
+                to_add = list(desired - current)
+
+                if to_remove:
+                    execute_values(cur, """
+                        DELETE FROM question_articles qa
+                        USING (VALUES %s) AS d (question_id, article_id)
+                        WHERE qa.question_id = d.question_id
+                            AND qa.article_id = d.article_id
+                    """, to_remove, page_size=len(to_remove))
+                if to_add:
+                    execute_values(cur, insert_query, to_add,
+                                   template=insert_template, page_size=len(to_add))
+                conn.commit()
 
-            return {"success": True}
+                # Relasi berubah, jawaban untuk artikel terkait di-invalidate
+                answer_cache.invalidate_articles({a for q, a in to_add + to_remove})
+                memory_index.refresh_all_questions({q for q, a in to_add + to_remove})
+                return {"success": True, "added": len(to_add), "removed": len(to_remove)}
 
-        except Exception as e:
-            if conn:
+            except Exception as e:
                 conn.rollback()
-            print(f"Error: {str(e)}")
-            raise e
-
-        finally:
-            if cur:
-                cur.close()
-            if conn:
-                conn.close()
-
-    def get_all_question(self):
-        conn = get_connection()
-        cur = conn.cursor()
+                print(f"Error: {str(e)}")
+                raise e
 
-        query = """
-            SELECT 
-                q.id AS question_id,
-                q.question,
-                q.status,
-                q.created_by,
-                q.updated_by,
-                q.created_at,
-                q.updated_at,
-                q.organization_id,
-                o.name AS organization_name,
-                a.id AS article_id,
-                a.title AS article_title,
-                a.content AS article_content
+    # Tanpa limit/cursor seluruh pertanyaan dikembalikan (perilaku lama).
+    # articles: "full" (judul + isi), "summary" (judul saja), "ref" (id saja,
+    # artikel dikirim sekali di level atas) atau "none".
+    def get_all_question(self, fields=None, filters=None, cursor=None, limit=None, articles="full"):
+        filters = filters or {}
+        fields = fields or list(QUESTION_FIELDS)
+        columns = [QUESTION_FIELDS[f] for f in fields if QUESTION_FIELDS[f]]
+        where = []
+        params = {}
+        if filters.get("organization_id") is not None:
+            where.append("q.organization_id = %(organization_id)s")
+            params["organization_id"] = filters["organization_id"]
+        if filters.get("status"):
+            where.append("q.status = %(status)s")
+            params["status"] = filters["status"]
+        after = decode_cursor(cursor, "id")
+        if after:
+            where.append("q.id > %(cursor_id)s")
+            params["cursor_id"] = after[0]
+
+        # Halaman pertanyaan dulu, artikelnya diambil terpisah sehingga tidak ada baris duplikat
+        query = f"""
+            SELECT {", ".join(columns + ["q.id AS _cursor_id"])}
             FROM questions q
             LEFT JOIN organizations o ON q.organization_id = o.id
-            LEFT JOIN question_articles qa ON qa.question_id = q.id
-            LEFT JOIN articles a ON a.id = qa.article_id
-            ORDER BY q.id;
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY q.id
         """
-        cur = conn.cursor()
-        cur.execute(query)
-        rows = cur.fetchall()
-
-        result = {}
-        for row in rows:
-            qid = row["question_id"]
-            if qid not in result:
-                result[qid] = {
-                    "id": qid,
-                    "question": row["question"],
-                    "status": row["status"],
-                    "created_by": row["created_by"],
-                    "updated_by": row["updated_by"],
-                    "created_at": row["created_at"],
-                    "updated_at": row["updated_at"],
-                    "organization_id": row["organization_id"],
-                    "organization_name": row["organization_name"],
-                    "articles": []
-                }
-            if row["article_id"]:
-                result[qid]["articles"].append({
-                    "article_id": row["article_id"],
-                    "title": row["article_title"],
-                    "content": row["article_content"]
-                })
-
-        cur.close()
-        conn.close()
-        return list(result.values())
+        if limit:
+            query += " LIMIT %(limit)s"
+            params["limit"] = limit + 1
+
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            page = page_result(rows, limit, lambda row: (row["_cursor_id"],))
+            question_ids = [row["_cursor_id"] for row in (rows[:limit] if limit else rows)]
+
+            links = []
+            if "articles" in fields and articles != "none" and question_ids:
+                article_columns = {
+                    "full": ", a.title, a.content",
+                    "summary": ", a.title",
+                    "ref": ", a.title",
+                }[articles]
+                cur.execute(f"""
+                    SELECT qa.question_id, a.id AS article_id{article_columns}
+                    FROM question_articles qa
+                    JOIN articles a ON a.id = qa.article_id
+                    WHERE qa.question_id = ANY(%s)
+                    ORDER BY qa.question_id, a.id
+                """, (question_ids,))
+                links = cur.fetchall()
+
+        by_question = {}
+        for link in links:
+            by_question.setdefault(link["question_id"], []).append(link)
+        for row, qid in zip(page["data"], question_ids):
+            if "articles" not in fields:
+                continue
+            linked = by_question.get(qid, [])
+            if articles == "ref":
+                row["article_ids"] = [link["article_id"] for link in linked]
+            elif articles != "none":
+                row["articles"] = [
+                    {k: v for k, v in link.items() if k != "question_id"}
+                    for link in linked
+                ]
+        if articles == "ref" and "articles" in fields:
+            page["articles"] = list({
+                link["article_id"]: {"id": link["article_id"], "title": link["title"]}
+                for link in links
+            }.values())
+        return page
 
     def get_questions_by_id(self, questions_id):
-        conn = get_connection()
-        cur = conn.cursor()
-
         query = """
             SELECT 
                 q.id AS question_id,
@@ -393,86 +532,71 @@ class QuestionService:
             LEFT JOIN articles a ON a.id = qa.article_id
             WHERE q.id = %s;
         """
-        cur = conn.cursor()
-        cur.execute(query, (questions_id,))
-        rows = cur.fetchall()
-
-        if not rows:
-            cur.close()
-            conn.close()
-            return None
-
-        # karena rows sudah dict, bisa pakai key langsung
-        result = {
-            "id": rows[0]["question_id"],
-            "question": rows[0]["question"],
-            "status": rows[0]["status"],
-            "created_by": rows[0]["created_by"],
-            "updated_by": rows[0]["updated_by"],
-            "created_at": rows[0]["created_at"],
-            "updated_at": rows[0]["updated_at"],
-            "organization_id": rows[0]["organization_id"],
-            "organization_name": rows[0]["organization_name"],
-            "articles": []
-        }
-
-        for row in rows:
-            if row["article_id"]:
-                result["articles"].append({
-                    "article_id": row["article_id"],
-                    "title": row["article_title"],
-                    "content": row["article_content"]
-                })
-
-        cur.close()
-        conn.close()
-        return result
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, (questions_id,))
+            rows = cur.fetchall()
+
+            if not rows:
+                return None
+
+            # karena rows sudah dict, bisa pakai key langsung
+            result = {
+                "id": rows[0]["question_id"],
+                "question": rows[0]["question"],
+                "status": rows[0]["status"],
+                "created_by": rows[0]["created_by"],
+                "updated_by": rows[0]["updated_by"],
+                "created_at": rows[0]["created_at"],
+                "updated_at": rows[0]["updated_at"],
+                "organization_id": rows[0]["organization_id"],
+                "organization_name": rows[0]["organization_name"],
+                "articles": []
+            }
+
+            for row in rows:
+                if row["article_id"]:
+                    result["articles"].append({
+                        "article_id": row["article_id"],
+                        "title": row["article_title"],
+                        "content": row["article_content"]
+                    })
+
+            return result
 
 class OrganizationService:
     def get_organizations(self):
-        conn = get_connection()
-        cur = conn.cursor()
-
         query= """
                 SELECT id, name FROM organizations
             """
-        
-        cur.execute(query)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
+
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query)
+            rows = cur.fetchall()
 
         return rows
     
     def get_organizations_by_id(self, id):
-        conn = get_connection()
-        cur = conn.cursor()
-
         query = """
                     SELECT * FROM organizations
                     WHERE id=%s
                 """
-        
-        cur.execute(query, (id))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, (id))
+            row = cur.fetchone()
 
         return row if row else None
     
     def create_organizations(self, organizations):
-        conn = get_connection()
-        cur = conn.cursor()
         query = """
             INSERT INTO organizations (name, created_at, updated_at)
             VALUES (%s, NOW(), NOW())
             RETURNING *
         """
-        cur.execute(query, (organizations.get("name"),))  # <-- perbaikan di sini
-        result = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, (organizations.get("name"),))  # <-- perbaikan di sini
+            result = cur.fetchone()
+            conn.commit()
 
         return result
 
@@ -492,42 +616,127 @@ class AskService:
         # else:
         #     return check, "Not Respond with Database"
 
+    def asking_stream(self, request_data: dict):
+        question_text = request_data.get("question")
+        user_id = request_data.get("session_id")
+        organization_id = request_data.get("organization_id")
+        if not question_text:
+            raise ValueError("Kunci 'question' tidak ditemukan dalam body request JSON.")
+
+        return ask_stream(question_text, user_id, organization_id)
+
+    # Versi async untuk mode ASGI (asgi.py)
+    async def aasking(self, request_data: dict):
+        question_text = request_data.get("question")
+        user_id = request_data.get("session_id")
+        organization_id = request_data.get("organization_id")
+        if not question_text and user_id:
+            raise ValueError("Kunci 'question' tidak ditemukan dalam body request JSON.")
+
+        return await aask(question_text, user_id, organization_id)
+
+    def aasking_stream(self, request_data: dict):
+        question_text = request_data.get("question")
+        user_id = request_data.get("session_id")
+        organization_id = request_data.get("organization_id")
+        if not question_text:
+            raise ValueError("Kunci 'question' tidak ditemukan dalam body request JSON.")
+
+        return aask_stream(question_text, user_id, organization_id)
+
+# Kolom /log yang boleh diminta lewat ?fields=
+LOG_FIELDS = {
+    "id": "l.id",
+    "session_id": "l.session_id",
+    "time": "l.time",
+    "organization_id": "o.name AS organization_id",
+    "question": "l.question",
+    "similar_question": "l.similar_question",
+    "similarity": "l.similarity",
+    "context": "l.context",
+    "system_instruction": "l.system_instruction",
+    "response": "l.response",
+    "summary": "l.summary",
+}
+# context dan system_instruction (prompt penuh) besar, hanya dikirim jika diminta
+LOG_DEFAULT_FIELDS = [f for f in LOG_FIELDS if f not in ("context", "system_instruction")]
+LOG_EXPORT_ITERSIZE = int(os.getenv("LOG_EXPORT_ITERSIZE", "1000"))
+
 class LogService:
-     def get_Log(self):
-        conn = get_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-                    SELECT
-                        l.id,
-                        l.session_id,
-                        l.time,
-                        o.name AS organization_id,
-                        l.question,
-                        l.similar_question,
-                        l.similarity,
-                        l.context,
-                        l.system_instruction,
-                        l.response,
-                        l.summary
-                    FROM log l
-                    LEFT JOIN organizations o
-                        ON l.organization_id = o.id
-                    ORDER BY l.time DESC
-                """)
-
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-        return rows
+    def _log_query(self, fields, filters, cursor=None, limit=None):
+        where = []
+        params = {}
+        if filters.get("organization_id") is not None:
+            where.append("l.organization_id = %(organization_id)s")
+            params["organization_id"] = filters["organization_id"]
+        if filters.get("session_id"):
+            where.append("l.session_id = %(session_id)s")
+            params["session_id"] = filters["session_id"]
+        if filters.get("date_from"):
+            where.append("l.time >= %(date_from)s")
+            params["date_from"] = filters["date_from"]
+        if filters.get("date_to"):
+            where.append("l.time < %(date_to)s")
+            params["date_to"] = filters["date_to"]
+        if cursor:
+            # Keyset: lanjut setelah baris terakhir halaman sebelumnya
+            where.append("(l.time, l.id) < (%(cursor_time)s::timestamp, %(cursor_id)s)")
+            params["cursor_time"], params["cursor_id"] = cursor
+
+        # time & id selalu diambil untuk cursor berikutnya
+        columns = [LOG_FIELDS[f] for f in fields]
+        columns += ["l.time AS _cursor_time", "l.id AS _cursor_id"]
+        query = f"""
+            SELECT {", ".join(columns)}
+            FROM log l
+            LEFT JOIN organizations o
+                ON l.organization_id = o.id
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY l.time DESC, l.id DESC
+        """
+        if limit:
+            query += " LIMIT %(limit)s"
+            params["limit"] = limit
+        return query, params
+
+    @staticmethod
+    def _strip(row):
+        return {k: v for k, v in row.items() if not k.startswith("_cursor_")}
+
+    def get_Log(self, fields=None, filters=None, cursor=None, limit=None):
+        # limit None = semua baris (bentuk lama /log tanpa paginasi)
+        fields = fields or LOG_DEFAULT_FIELDS
+        query, params = self._log_query(fields, filters or {}, decode_cursor(cursor, "time", "id"), limit + 1 if limit else None)
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+
+        return page_result(rows, limit, lambda row: (row["_cursor_time"], row["_cursor_id"]))
+
+    def iter_log(self, fields=None, filters=None, cursor=None, limit=None):
+        # Export: server-side named cursor, baris diambil bertahap (itersize) tanpa memuat semuanya
+        fields = fields or LOG_DEFAULT_FIELDS
+        # Cursor divalidasi di sini agar error muncul sebelum response mulai di-stream
+        query, params = self._log_query(fields, filters or {}, decode_cursor(cursor, "time", "id"), limit)
+
+        def rows():
+            with get_connection() as conn:
+                with conn.cursor(name="log_export") as cur:
+                    cur.itersize = LOG_EXPORT_ITERSIZE
+                    cur.execute(query, params)
+                    for row in cur:
+                        yield self._strip(row)
+                conn.rollback()
+
+        return rows()
 
 class webHook:
     def setListenerHook(self, payload):
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("INSERT INTO hook_data (datas) VALUES (%s)", (payload,))
-            conn.commit()
-            print("Payload berhasil disimpan")
-        except Exception as e:
-            print("Error:", e)
\ No newline at end of file
+        with get_connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("INSERT INTO hook_data (datas) VALUES (%s)", (payload,))
+                conn.commit()
+                print("Payload berhasil disimpan")
+            except Exception as e:
+                print("Error:", e)
\ No newline at end of file
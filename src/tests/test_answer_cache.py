@@ -0,0 +1,77 @@
+import model.answer_cache as ac
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if "INSERT INTO answer_cache_invalidations" in query:
+            self.table.append({"id": len(self.table) + 1, "organization_id": params[0], "article_ids": params[1]})
+        elif "max(id)" in query:
+            self.rows = [{"id": len(self.table)}]
+        elif "WHERE id >" in query:
+            self.rows = [row for row in self.table if row["id"] > params[0]]
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConn:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.table)
+
+    def commit(self):
+        pass
+
+
+def test_invalidation_reaches_other_workers(monkeypatch):
+    table = []
+    monkeypatch.setattr(ac, "get_connection", lambda: FakeConn(table))
+    # Dua worker WSGI: masing-masing punya cache sendiri
+    worker_a = ac.SemanticAnswerCache(sync_interval=0)
+    worker_b = ac.SemanticAnswerCache(sync_interval=0)
+    vector = [1.0, 0.0]
+
+    assert worker_b.lookup(1, vector) is None
+    worker_b.store(1, vector, {"response": "Rp100.000"}, article_ids=[7])
+    assert worker_b.lookup(1, vector)["response"] == "Rp100.000"
+
+    # Artikel 7 diubah lewat worker A
+    worker_a.invalidate_articles([7])
+    assert worker_b.lookup(1, vector) is None
+
+
+def test_lookup_misses_when_invalidations_unreadable(monkeypatch):
+    table = []
+    monkeypatch.setattr(ac, "get_connection", lambda: FakeConn(table))
+    cache = ac.SemanticAnswerCache(sync_interval=0)
+    vector = [1.0, 0.0]
+    cache.lookup(1, vector)
+    cache.store(1, vector, {"response": "ok"})
+
+    def down():
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(ac, "get_connection", down)
+    assert cache.lookup(1, vector) is None
+    assert cache.stats()["sync_errors"] == 1
@@ -0,0 +1,21 @@
+import service.chat as chat
+
+
+def test_notification_without_webhook_returns_immediately(monkeypatch):
+    monkeypatch.setattr(chat, "GOOGLE_CHAT_WEBHOOK_URL", None)
+    monkeypatch.setattr(chat.notifier, "send", lambda *args: (_ for _ in ()).throw(AssertionError("send dipanggil")))
+    result = chat.notification("Not Found", "628123", "halo?")
+    assert result["ok"] is False
+    assert result["status_code"] is None
+
+
+def test_digest_counts_and_top_unanswered():
+    window = chat._Window()
+    for i in range(5):
+        window.add("Not Found", f"62{i}", "Berapa harga paket?")
+    window.add("Not Found", "629", "kenapa lambat")
+    window.add("Article Found", "630", "cara bayar")
+    text = window.render(1, top=1)
+    assert "7 pertanyaan" in text
+    assert "(5x) Berapa harga paket?" in text
+    assert "kenapa lambat" not in text
@@ -0,0 +1,91 @@
+import pytest
+
+import validation.authentication as auth
+from model.bloom import BloomFilter
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.db["queries"] += 1
+        self.row = {"?column?": 1} if params[0] in self.db["users"] else None
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = {"users": {"a@x", "b@x"}, "queries": 0}
+    bloom = BloomFilter(100)
+    for user in ("a@x", "b@x"):
+        bloom.add(user)
+    monkeypatch.setattr(auth, "get_connection", lambda: FakeConn(db))
+    monkeypatch.setattr(auth, "users_bloom", lambda: auth._users_bloom["filter"])
+    monkeypatch.setitem(auth._users_bloom, "filter", bloom)
+    monkeypatch.setitem(auth._users_bloom, "loaded_at", 0.0)
+    monkeypatch.setitem(auth._users_bloom, "miss_budget", 2)
+    monkeypatch.setattr(auth, "USERS_BLOOM_MISS_CHECKS", 2)
+    auth.user_cache.clear()
+    auth.unknown_user_cache.clear()
+    yield db
+    auth.user_cache.clear()
+    auth.unknown_user_cache.clear()
+
+
+def test_user_added_after_bloom_load_is_accepted(db):
+    db["users"].add("new@x")
+    assert auth.tokenService().checkUsers({"email": "new@x"}) is True
+    # Filter belajar dari miss dan dijadwalkan dimuat ulang
+    assert "new@x" in auth._users_bloom["filter"]
+    assert auth._users_bloom["loaded_at"] is None
+
+
+def test_flood_of_unknown_emails_is_rate_limited(db):
+    service = auth.tokenService()
+    results = [service.checkUsers({"email": f"spam{i}@x"}) for i in range(50)]
+    assert not any(results)
+    # Hanya sebanyak budget yang sampai ke database
+    assert db["queries"] <= 3
+
+
+def test_known_user_is_cached(db):
+    service = auth.tokenService()
+    assert service.checkUsers({"email": "a@x"}) and service.checkUsers({"email": "a@x"})
+    assert db["queries"] == 1
+
+
+def test_rate_limited_miss_is_not_negative_cached(db, monkeypatch):
+    service = auth.tokenService()
+    for i in range(10):
+        service.checkUsers({"email": f"spam{i}@x"})
+    # Budget habis oleh spam; user baru ditolak sementara tapi tidak di-cache negatif
+    db["users"].add("new@x")
+    assert service.checkUsers({"email": "new@x"}) is False
+    assert auth.unknown_user_cache.get("new@x") is None
+    # Begitu budget tersedia lagi, user baru lolos
+    monkeypatch.setitem(auth._users_bloom, "miss_budget", 1)
+    assert service.checkUsers({"email": "new@x"}) is True
@@ -0,0 +1,52 @@
+import model.chunks as chunks
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((" ".join(query.split()), params))
+
+
+class FakeConn:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def commit(self):
+        pass
+
+
+def test_failed_reindex_drops_old_chunks(monkeypatch):
+    executed = []
+    monkeypatch.setattr(chunks, "CHUNKING_ENABLED", True)
+    monkeypatch.setattr(chunks, "_table_ready", True)
+    monkeypatch.setattr(chunks, "get_connection", lambda: FakeConn(executed))
+
+    def fail(articles):
+        raise RuntimeError("embedding API down")
+
+    monkeypatch.setattr(chunks, "index_articles", fail)
+    assert chunks.safe_index_articles([{"id": 7, "title": "Paket", "content": "isi baru"}]) == 0
+    assert executed == [("DELETE FROM article_chunks WHERE article_id = ANY(%s)", ([7],))]
+
+
+def test_content_hash_matches_postgres_md5():
+    # md5('') dan md5('abc') di Postgres
+    assert chunks.content_hash(None) == "d41d8cd98f00b204e9800998ecf8427e"
+    assert chunks.content_hash("abc") == "900150983cd24fb0d6963f7d28e17f72"
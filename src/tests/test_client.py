@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+
+from validation.client import APIClient, AsyncAPIClient
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {"access_token": "tok", "expires_in": 3600}
+
+
+class FakeAsyncHTTP:
+    def __init__(self):
+        self.calls = 0
+
+    async def post(self, url, auth=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return FakeResponse()
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    APIClient._tokens.clear()
+    AsyncAPIClient._async_locks.clear()
+    yield
+    APIClient._tokens.clear()
+
+
+def make_client():
+    client = AsyncAPIClient("http://api.test", "id", "secret")
+    client._client = FakeAsyncHTTP()
+    return client
+
+
+async def concurrent_tokens(client):
+    client.invalidate_token()
+    return await asyncio.gather(*(client.get_token() for _ in range(5)))
+
+
+def test_token_lock_works_across_event_loops():
+    client = make_client()
+    # Lock yang sama dipakai bergantian di dua event loop, keduanya dengan contention
+    assert asyncio.run(concurrent_tokens(client)) == ["tok"] * 5
+    assert asyncio.run(concurrent_tokens(client)) == ["tok"] * 5
+    assert client._client.calls == 2
+
+
+def test_invalidate_does_not_wait_for_thread_refresh():
+    client = make_client()
+    entry = client._entry(client._key)
+    entry.token = "old"
+    # Thread lain sedang memegang lock refresh sinkron
+    entry.lock.acquire()
+    try:
+        done = threading.Event()
+
+        async def invalidate():
+            client.invalidate_token("old")
+            done.set()
+
+        asyncio.run(asyncio.wait_for(invalidate(), timeout=1))
+        assert done.is_set() and entry.token is None
+    finally:
+        entry.lock.release()
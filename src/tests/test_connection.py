@@ -0,0 +1,46 @@
+import psycopg2
+import pytest
+
+from connection.connection import PooledConnection
+
+
+class FakeConn:
+    def __init__(self, fail_rollback=False):
+        self.autocommit = False
+        self.closed = 0
+        self.fail_rollback = fail_rollback
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise psycopg2.OperationalError("server closed the connection")
+
+
+class FakePool:
+    def __init__(self):
+        self.returned = []
+
+    def putconn(self, conn):
+        self.returned.append(conn)
+
+
+def test_setattr_reaches_underlying_connection():
+    pool, raw = FakePool(), FakeConn()
+    conn = PooledConnection(pool, raw)
+    conn.autocommit = True
+    assert raw.autocommit is True
+    assert conn.autocommit is True
+
+
+def test_setattr_after_close_raises():
+    conn = PooledConnection(FakePool(), FakeConn())
+    conn.close()
+    with pytest.raises(psycopg2.InterfaceError):
+        conn.autocommit = True
+
+
+def test_exit_returns_connection_when_rollback_fails():
+    pool, raw = FakePool(), FakeConn(fail_rollback=True)
+    with pytest.raises(psycopg2.OperationalError):
+        with PooledConnection(pool, raw):
+            raise ValueError("boom")
+    assert pool.returned == [raw]
@@ -0,0 +1,88 @@
+import pytest
+
+import model.indexes as indexes
+from connection.connection import PooledConnection
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        # Catat status autocommit koneksi psycopg2 asli saat DDL dijalankan
+        self.conn.executed.append((str(query), self.conn.autocommit))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return {"total": 0}
+
+
+class FakeConn:
+    def __init__(self):
+        self.autocommit = False
+        self.closed = 0
+        self.executed = []
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+
+class FakePool:
+    def putconn(self, conn):
+        pass
+
+
+@pytest.fixture
+def raw_conn(monkeypatch):
+    raw = FakeConn()
+    monkeypatch.setattr(indexes, "get_connection", lambda: PooledConnection(FakePool(), raw))
+    return raw
+
+
+@pytest.mark.parametrize("action", [
+    lambda: indexes.create_vector_index("hnsw"),
+    lambda: indexes.create_vector_index("hnsw", organization_id=7),
+    lambda: indexes.rebuild_vector_index("questions_question_vector_hnsw_idx"),
+    lambda: indexes.drop_vector_index("questions_question_vector_hnsw_idx"),
+    lambda: indexes.create_text_search(),
+    lambda: indexes.create_log_indexes(),
+])
+def test_concurrent_ddl_runs_in_autocommit(raw_conn, action):
+    action()
+    assert raw_conn.executed
+    assert all(autocommit for _, autocommit in raw_conn.executed)
+
+
+def test_text_search_check_never_alters_schema(raw_conn, monkeypatch):
+    monkeypatch.setattr(indexes, "_text_search_ready", False)
+    monkeypatch.setattr(indexes, "_text_search_failed_at", None)
+    assert indexes.text_search_available() is False
+    assert not any("ALTER" in query or "CREATE" in query for query, _ in raw_conn.executed)
+    # Hasil negatif di-cache: tidak ada query tambahan
+    count = len(raw_conn.executed)
+    assert indexes.text_search_available() is False
+    assert len(raw_conn.executed) == count
+
+
+class ParamCursor:
+    def __init__(self):
+        self.params = []
+
+    def execute(self, query, params=None):
+        self.params.append(params)
+
+
+def test_filtered_search_raises_ef_search():
+    cur = ParamCursor()
+    indexes.apply_search_params(cur, filtered=True)
+    assert cur.params[0][0] == str(indexes.HNSW_FILTERED_EF_SEARCH)
+    indexes.apply_search_params(cur)
+    assert cur.params[-1][0] == str(indexes.HNSW_EF_SEARCH)
@@ -0,0 +1,27 @@
+import pytest
+
+from model.language import detect_language, needs_translation
+
+
+@pytest.mark.parametrize("question", [
+    "bagaimana cara change password di aplikasi",
+    "cuti leave berapa hari",
+    "how do I reset my password",
+    "berapa salary karyawan kontrak",
+])
+def test_mixed_and_english_questions_are_translated(question):
+    assert needs_translation(question)
+
+
+@pytest.mark.parametrize("question", [
+    "bagaimana cara mengganti kata sandi di aplikasi",
+    "berapa hari jatah cuti karyawan",
+    "kenapa internet saya lambat sejak kemarin",
+])
+def test_pure_indonesian_questions_skip_translation(question):
+    assert detect_language(question) == "id"
+    assert not needs_translation(question)
+
+
+def test_unknown_language_is_translated():
+    assert needs_translation("xyz 123")
@@ -0,0 +1,42 @@
+import service.service as ss
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append(query)
+
+    def fetchall(self):
+        return []
+
+
+class FakeConn:
+    def __init__(self):
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+
+def test_get_log_never_changes_schema(monkeypatch):
+    conn = FakeConn()
+    monkeypatch.setattr(ss, "get_connection", lambda: conn)
+    ss.LogService().get_Log()
+    ss.LogService().get_Log(limit=10)
+    # Index log dibuat lewat migrasi (create_log_indexes), bukan dari GET /log
+    assert len(conn.executed) == 2
+    assert not any("CREATE" in query or "ALTER" in query for query in conn.executed)
@@ -0,0 +1,40 @@
+import pytest
+
+import model.model as m
+
+
+def hit(qid, similarity, coverage=None):
+    item = {"id_question": qid, "question": f"q{qid}", "similarity": similarity, "articles": [{"id": qid}]}
+    if coverage is not None:
+        item.update(lexical_rank=1, lexical_coverage=coverage, rrf_score=0.01)
+    return item
+
+
+@pytest.fixture
+def hybrid(monkeypatch):
+    monkeypatch.setattr(m, "convert", lambda text: [0.1, 0.2])
+    monkeypatch.setattr(m, "text_search_available", lambda: True)
+    monkeypatch.setattr(m, "org_setting", lambda org, key, default=None: {"retrieval_backend": "db"}.get(key, default))
+
+    def use(hits):
+        monkeypatch.setattr(m, "search_questions_hybrid", lambda *args: hits)
+    return use
+
+
+def test_single_common_word_does_not_lower_the_floor(hybrid):
+    hybrid([hit(1, 0.45, coverage=0.2)])
+    result = m.match_question("bagaimana cara reset modem", 1, threshold=0.7)
+    assert "id_question" not in result[0]
+
+
+def test_strong_lexical_match_passes_lower_floor(hybrid):
+    hybrid([hit(1, 0.45, coverage=0.75)])
+    result = m.match_question("harga paket dedicated 100mbps", 1, threshold=0.7)
+    assert result[0]["id_question"] == 1
+
+
+def test_vector_only_when_text_search_missing(hybrid, monkeypatch):
+    monkeypatch.setattr(m, "text_search_available", lambda: False)
+    monkeypatch.setattr(m, "search_questions_hybrid", lambda *args: pytest.fail("hybrid dipanggil"))
+    monkeypatch.setattr(m, "search_questions", lambda *args: [hit(2, 0.9)])
+    assert m.match_question("halo", 1, threshold=0.7)[0]["id_question"] == 2
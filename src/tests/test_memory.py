@@ -0,0 +1,101 @@
+import json
+
+import model.memory as memory
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if "pg_advisory_xact_lock" in query:
+            self.db.setdefault("_locks", []).append(params)
+        elif "FROM session_memory" in query and "SELECT" in query:
+            key = (params[0], params[1]) if "AS fresh" not in query else (params[1], params[2])
+            turns = self.db.get(key)
+            self.row = None if turns is None else {"turns": turns, "fresh": True}
+        elif "INSERT INTO session_memory" in query:
+            self.db[(params[0], params[1])] = json.loads(params[2])
+
+    def fetchone(self):
+        return self.row
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+
+def make_memory(monkeypatch):
+    db = {}
+    monkeypatch.setattr(memory, "get_connection", lambda: FakeConn(db))
+    mem = memory.SessionMemory(seed_from_history=False)
+    mem._table_ready = True
+    return mem, db
+
+
+def turn(question, response):
+    return {"session_id": "628", "organization_id": 1, "question": question, "response": response}
+
+
+def test_pending_turn_is_visible_before_flush(monkeypatch):
+    mem, db = make_memory(monkeypatch)
+    queued = mem.remember(turn("berapa harga paket?", "Rp100.000"))
+    # Belum di-flush: database masih kosong, tapi pertanyaan lanjutan melihat giliran ini
+    assert db == {}
+    assert "berapa harga paket?" in mem.load("628", 1)
+
+    mem.append_batch([queued])
+    assert mem._pending == {}
+    assert mem.load("628", 1).count("berapa harga paket?") == 1
+
+
+def test_flushed_turn_is_not_duplicated(monkeypatch):
+    mem, db = make_memory(monkeypatch)
+    queued = mem.remember(turn("halo", "hai"))
+    # Tersimpan di database tetapi belum sempat dihapus dari pending
+    db[("628", 1)] = [memory.make_turn("halo", "hai", queued["pending_id"])]
+    assert mem.load("628", 1).count("User: halo") == 1
+    mem.append_batch([queued])
+
+
+def test_stale_pending_turns_expire(monkeypatch):
+    mem, _ = make_memory(monkeypatch)
+    mem.remember(turn("halo", "hai"))
+    monkeypatch.setattr(memory, "MEMORY_PENDING_TTL", -1)
+    assert mem.load("628", 1) == ""
+    assert mem._pending == {}
+
+
+def test_repeated_question_is_kept(monkeypatch):
+    mem, db = make_memory(monkeypatch)
+    first = mem.remember(turn("halo", "hai"))
+    mem.append_batch([first])
+    # Pertanyaan yang sama ditanyakan lagi sebelum flush: tetap muncul dua kali
+    mem.remember(turn("halo", "hai"))
+    assert mem.load("628", 1).count("User: halo") == 2
+
+
+def test_append_locks_each_session(monkeypatch):
+    mem, db = make_memory(monkeypatch)
+    mem.append_batch([mem.remember(turn("a", "1")), mem.remember(dict(turn("b", "2"), session_id="629"))])
+    assert db["_locks"] == [("session_memory:628", 1), ("session_memory:629", 1)]
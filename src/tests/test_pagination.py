@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pytest
+
+from service.pagination import encode_cursor, decode_cursor
+
+
+def test_round_trip():
+    cursor = encode_cursor(datetime(2025, 1, 2, 3, 4, 5), 42)
+    assert decode_cursor(cursor, "time", "id") == ["2025-01-02T03:04:05", 42]
+    assert decode_cursor(encode_cursor(7), "id") == [7]
+    assert decode_cursor(None, "id") is None
+
+
+@pytest.mark.parametrize("values,kinds", [
+    (("abc",), ("id",)),
+    ((True,), ("id",)),
+    ((1.5,), ("id",)),
+    ((1, 2), ("id",)),
+    (("2025-01-02T03:04:05",), ("time", "id")),
+    (("kemarin", 1), ("time", "id")),
+    ((20250102, 1), ("time", "id")),
+])
+def test_edited_cursor_is_rejected(values, kinds):
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(*values), *kinds)
+
+
+def test_garbage_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("%%%not-base64", "id")
@@ -0,0 +1,11 @@
+import asyncio, threading
+
+import model.pipeline as pipeline
+
+
+def test_run_blocking_uses_sized_executor():
+    async def main():
+        return await pipeline.run_blocking(lambda: threading.current_thread().name)
+
+    assert asyncio.run(main()).startswith("async-blocking")
+    assert pipeline._async_executor._max_workers == pipeline.ASYNC_BLOCKING_WORKERS
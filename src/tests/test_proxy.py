@@ -0,0 +1,67 @@
+import pytest
+
+import service.proxy as proxy
+
+
+def test_only_allowed_hosts_are_forwarded(monkeypatch):
+    monkeypatch.setattr(proxy, "PROXY_ALLOWED_HOSTS", {"api.example.com"})
+    assert proxy.check_target("https://api.example.com/v1/users")
+    assert proxy.check_target("https://API.example.com:8443/x")
+    with pytest.raises(ValueError):
+        proxy.check_target("http://169.254.169.254/latest/meta-data")
+    with pytest.raises(ValueError):
+        proxy.check_target("file:///etc/passwd")
+    with pytest.raises(ValueError):
+        proxy.check_target(None)
+
+
+def test_rejected_target_does_not_fetch_token(monkeypatch):
+    monkeypatch.setattr(proxy, "PROXY_ALLOWED_HOSTS", {"api.example.com"})
+    p = proxy.UpstreamProxy()
+    monkeypatch.setattr(p, "get_token", lambda *args, **kwargs: pytest.fail("token diambil"))
+    with pytest.raises(ValueError):
+        p.forward(("http://token", "id", "secret"), "GET", "http://evil.example.org/")
+    assert p.stats()["hosts"] == []
+
+
+def test_session_cache_is_bounded_and_closes_evicted(monkeypatch):
+    closed = []
+    monkeypatch.setattr(proxy.requests.Session, "close", lambda self: closed.append(self))
+    p = proxy.UpstreamProxy(max_sessions=2)
+    first = p.session("http://a.example/")
+    p.session("http://b.example/")
+    p.session("http://a.example/x")  # a dipakai lagi, b jadi yang tertua
+    p.session("http://c.example/")
+    assert p.stats()["hosts"] == ["a.example", "c.example"]
+    assert len(closed) == 1 and closed[0] is not first
+    assert p.stats()["sessions_evicted"] == 1
+
+
+class TokenResponse:
+    status_code = 200
+    text = "<html>maintenance</html>"
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        if self.data is None:
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return self.data
+
+
+class TokenSession:
+    def __init__(self, data):
+        self.data = data
+
+    def post(self, *args, **kwargs):
+        return TokenResponse(self.data)
+
+
+@pytest.mark.parametrize("data", [None, {"token": "x"}, ["x"], {"access_token": "x", "expires_in": "soon"}])
+def test_malformed_token_response_is_upstream_error(monkeypatch, data):
+    p = proxy.UpstreamProxy()
+    monkeypatch.setattr(p, "session", lambda url: TokenSession(data))
+    with pytest.raises(proxy.UpstreamTokenError):
+        p.get_token("http://token", "id", "secret")
+    assert p.stats()["cached_tokens"] == 0
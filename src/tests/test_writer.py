@@ -0,0 +1,19 @@
+from model.writer import WriteBehindQueue
+
+
+def test_bad_row_does_not_drop_the_batch():
+    saved = []
+
+    def handler(items):
+        if any(item == "bad" for item in items):
+            raise ValueError("value too long")
+        saved.extend(items)
+
+    writer = WriteBehindQueue({"log": handler}, max_retries=1, retry_backoff=0)
+    writer._run("log", ["a", "b", "bad", "c", "d"])
+
+    assert sorted(saved) == ["a", "b", "c", "d"]
+    stats = writer.stats()
+    assert stats["failed"] == 1
+    assert stats["processed"] == 4
+    assert stats["splits"] > 0
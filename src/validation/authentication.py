@@ -1,11 +1,221 @@
 from flask import request, jsonify, current_app as app
-import base64, datetime, jwt
+import os, base64, datetime, hashlib, hmac, secrets, threading, time, jwt
 from connection.connection import get_connection
+from model.cache import TTLCache
+from model.bloom import BloomFilter
 from functools import wraps
+from dotenv import load_dotenv
 
 from datetime import datetime, timedelta, timezone
 
+load_dotenv()
+
+AUTH_CLIENT_CACHE_SIZE = int(os.getenv("AUTH_CLIENT_CACHE_SIZE", "1024"))
+AUTH_CLIENT_CACHE_TTL = float(os.getenv("AUTH_CLIENT_CACHE_TTL", "60"))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+AUTH_PBKDF2_ITERATIONS = int(os.getenv("AUTH_PBKDF2_ITERATIONS", "260000"))
+# Secret plaintext lama diganti hash setelah login berhasil
+AUTH_REHASH_LEGACY = os.getenv("AUTH_REHASH_LEGACY", "0") == "1"
+# Cache checkUsers: email terdaftar disimpan lebih lama daripada email yang tidak dikenal
+USERS_CACHE_SIZE = int(os.getenv("USERS_CACHE_SIZE", "10000"))
+USERS_CACHE_TTL = float(os.getenv("USERS_CACHE_TTL", "300"))
+USERS_NEGATIVE_CACHE_SIZE = int(os.getenv("USERS_NEGATIVE_CACHE_SIZE", "10000"))
+USERS_NEGATIVE_TTL = float(os.getenv("USERS_NEGATIVE_TTL", "30"))
+# Bloom filter dari tabel users: email yang pasti tidak ada ditolak tanpa query
+USERS_BLOOM = os.getenv("USERS_BLOOM", "0") == "1"
+USERS_BLOOM_REFRESH = float(os.getenv("USERS_BLOOM_REFRESH", "600"))
+USERS_BLOOM_ERROR_RATE = float(os.getenv("USERS_BLOOM_ERROR_RATE", "0.01"))
+USERS_BLOOM_ITERSIZE = int(os.getenv("USERS_BLOOM_ITERSIZE", "5000"))
+# Email yang tidak ada di filter tetap dicek ke database (user baru sejak filter dimuat),
+# dibatasi sekian per detik; di atas itu (banjir email tidak valid) langsung ditolak
+USERS_BLOOM_MISS_CHECKS = float(os.getenv("USERS_BLOOM_MISS_CHECKS", "20"))
+
+_NO_CLIENT = object()
+
+# Record oauth_clients per client_id (termasuk client_id yang tidak ada)
+client_cache = TTLCache(maxsize=AUTH_CLIENT_CACHE_SIZE, ttl=AUTH_CLIENT_CACHE_TTL)
+# Kombinasi client + secret yang sudah terverifikasi, agar PBKDF2 tidak dihitung ulang saat burst
+verified_secret_cache = TTLCache(maxsize=AUTH_CLIENT_CACHE_SIZE, ttl=AUTH_CLIENT_CACHE_TTL)
+# JWT yang sudah diverifikasi, kunci = sha256(token), berlaku paling lama sampai exp
+token_cache = TTLCache(maxsize=AUTH_TOKEN_CACHE_SIZE, ttl=AUTH_TOKEN_CACHE_TTL)
+# Dipisah agar banjir email tidak valid tidak menggeser email yang terdaftar dari cache
+user_cache = TTLCache(maxsize=USERS_CACHE_SIZE, ttl=USERS_CACHE_TTL)
+unknown_user_cache = TTLCache(maxsize=USERS_NEGATIVE_CACHE_SIZE, ttl=USERS_NEGATIVE_TTL)
+
+_users_bloom = {
+    "filter": None, "loaded_at": None, "loading": False, "rejects": 0,
+    "miss_checks": 0, "stale_hits": 0, "miss_budget": USERS_BLOOM_MISS_CHECKS, "miss_at": time.monotonic(),
+}
+_users_bloom_lock = threading.Lock()
+
+
+def _digest(*parts):
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+# Format: pbkdf2_sha256$<iterasi>$<salt>$<hash base64>
+def hash_secret(secret, iterations=AUTH_PBKDF2_ITERATIONS):
+    salt = secrets.token_hex(16)
+    derived = hashlib.pbkdf2_hmac("sha256", secret.encode("utf-8"), salt.encode("utf-8"), iterations)
+    return f"pbkdf2_sha256${iterations}${salt}${base64.b64encode(derived).decode()}"
+
+
+def verify_secret(stored, provided):
+    stored = stored or ""
+    if stored.startswith("pbkdf2_sha256$"):
+        try:
+            _, iterations, salt, expected = stored.split("$", 3)
+            derived = hashlib.pbkdf2_hmac("sha256", provided.encode("utf-8"), salt.encode("utf-8"), int(iterations))
+        except ValueError:
+            return False
+        return hmac.compare_digest(base64.b64encode(derived).decode(), expected)
+    # Secret lama masih plaintext, tetap dibandingkan constant-time
+    return hmac.compare_digest(stored.encode("utf-8"), provided.encode("utf-8"))
+
+
+def invalidate_client(client_id=None):
+    # Dipanggil saat data oauth_clients berubah (None = semua client)
+    if client_id is None:
+        client_cache.clear()
+        verified_secret_cache.clear()
+    else:
+        client_cache.pop(client_id)
+        # Entri verified_secret_cache ikut gugur karena kuncinya memuat secret tersimpan
+    return True
+
+
+def _load_users_bloom():
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) AS total FROM users")
+                total = cur.fetchone()["total"]
+            # Ruang tambahan untuk user baru sampai refresh berikutnya
+            bloom = BloomFilter(int(total * 1.2) + 1000, USERS_BLOOM_ERROR_RATE)
+            with conn.cursor(name="users_bloom") as cur:
+                cur.itersize = USERS_BLOOM_ITERSIZE
+                cur.execute("SELECT username FROM users WHERE username IS NOT NULL")
+                for row in cur:
+                    bloom.add(row["username"])
+            conn.rollback()
+    except Exception as e:
+        # Tanpa filter, checkUsers kembali ke cache + query biasa
+        print(f"❌ Gagal memuat bloom filter users: {e}")
+        bloom = None
+    with _users_bloom_lock:
+        _users_bloom["filter"] = bloom
+        _users_bloom["loaded_at"] = time.monotonic()
+        _users_bloom["loading"] = False
+
+
+def users_bloom():
+    # Filter lama tetap dipakai selama filter baru dimuat di background
+    if not USERS_BLOOM:
+        return None
+    with _users_bloom_lock:
+        loaded_at = _users_bloom["loaded_at"]
+        stale = loaded_at is None or time.monotonic() - loaded_at > USERS_BLOOM_REFRESH
+        if stale and not _users_bloom["loading"]:
+            _users_bloom["loading"] = True
+            threading.Thread(target=_load_users_bloom, daemon=True).start()
+        return _users_bloom["filter"]
+
+
+def _allow_miss_check():
+    # Token bucket: USERS_BLOOM_MISS_CHECKS query per detik untuk email yang tidak ada di filter
+    with _users_bloom_lock:
+        now = time.monotonic()
+        budget = min(USERS_BLOOM_MISS_CHECKS, _users_bloom["miss_budget"] + (now - _users_bloom["miss_at"]) * USERS_BLOOM_MISS_CHECKS)
+        _users_bloom["miss_at"] = now
+        if budget >= 1:
+            _users_bloom["miss_budget"] = budget - 1
+            _users_bloom["miss_checks"] += 1
+            return True
+        _users_bloom["miss_budget"] = budget
+        _users_bloom["rejects"] += 1
+        return False
+
+
+def _bloom_missed_user(bloom, username):
+    # User ada di database tapi tidak di filter: filter sudah basi, tambahkan dan muat ulang lebih awal
+    with _users_bloom_lock:
+        if _users_bloom["filter"] is bloom:
+            bloom.add(username)
+            _users_bloom["loaded_at"] = None
+        _users_bloom["stale_hits"] += 1
+
+
+def invalidate_user(username=None):
+    # Dipanggil saat tabel users berubah (None = semua, bloom filter ikut dimuat ulang)
+    if username is None:
+        user_cache.clear()
+        unknown_user_cache.clear()
+        with _users_bloom_lock:
+            _users_bloom["loaded_at"] = None
+    else:
+        user_cache.pop(username)
+        unknown_user_cache.pop(username)
+    return True
+
+
+def auth_cache_stats():
+    bloom = _users_bloom["filter"]
+    loaded_at = _users_bloom["loaded_at"]
+    return {
+        "clients": client_cache.stats(),
+        "verified_secrets": verified_secret_cache.stats(),
+        "tokens": token_cache.stats(),
+        "users": user_cache.stats(),
+        "unknown_users": unknown_user_cache.stats(),
+        "users_bloom": {
+            "enabled": USERS_BLOOM,
+            "loaded": bloom is not None,
+            "age_seconds": round(time.monotonic() - loaded_at, 1) if loaded_at is not None else None,
+            "rejects": _users_bloom["rejects"],
+            "miss_checks": _users_bloom["miss_checks"],
+            "stale_hits": _users_bloom["stale_hits"],
+            **(bloom.stats() if bloom is not None else {}),
+        },
+    }
+
+
+def verify_token(token):
+    key = _digest(token)
+    claims = token_cache.get(key)
+    if claims is not None:
+        if claims.get("exp") is None or claims["exp"] > time.time():
+            return claims
+        token_cache.pop(key)
+        raise jwt.ExpiredSignatureError("Signature has expired")
+
+    claims = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+    ttl = AUTH_TOKEN_CACHE_TTL
+    if claims.get("exp") is not None:
+        ttl = min(ttl, claims["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+
 class tokenService:
+    def _get_client(self, client_id):
+        client = client_cache.get(client_id)
+        if client is None:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT * FROM oauth_clients WHERE client_id=%s", (client_id,))
+                client = cur.fetchone() or _NO_CLIENT
+            client_cache.set(client_id, client)
+        return None if client is _NO_CLIENT else client
+
+    def _rehash(self, client_id, client_secret):
+        hashed = hash_secret(client_secret)
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE oauth_clients SET client_secret=%s WHERE client_id=%s AND client_secret=%s",
+                        (hashed, client_id, client_secret))
+            conn.commit()
+        invalidate_client(client_id)
+
     def getToken(self, auth):
         try:
             encoded = auth.split(" ")[1]
@@ -14,13 +224,17 @@ class tokenService:
         except Exception:
             return jsonify({"error": "Malformed auth"}), 400
 
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM oauth_clients WHERE client_id=%s AND client_secret=%s",
-                    (client_id, client_secret))
-        client = cur.fetchone()
-        cur.close()
-        conn.close()
+        client = self._get_client(client_id)
+        if client:
+            stored = client["client_secret"] or ""
+            verified_key = _digest(client_id, client_secret, stored)
+            if not verified_secret_cache.get(verified_key):
+                if not verify_secret(stored, client_secret):
+                    client = None
+                else:
+                    verified_secret_cache.set(verified_key, True)
+                    if AUTH_REHASH_LEGACY and not stored.startswith("pbkdf2_sha256$"):
+                        self._rehash(client_id, client_secret)
 
         if not client:
             return jsonify({"error": "Invalid client credentials"}), 401
@@ -33,16 +247,29 @@ class tokenService:
 
     def checkUsers(self, body):
         email = body.get("email")
-        if not email:
+        if not email or not isinstance(email, str):
             return False
 
-        conn = get_connection()
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT 1 FROM users WHERE username = %s LIMIT 1", (email,))
-                return cur.fetchone() is not None
-        finally:
-            conn.close()
+        if user_cache.get(email):
+            return True
+        if unknown_user_cache.get(email):
+            return False
+
+        bloom = users_bloom()
+        missed = bloom is not None and email not in bloom
+        if missed and not _allow_miss_check():
+            # Ditolak tanpa dicek ke database: jangan di-cache negatif, user yang baru
+            # terdaftar sejak filter dimuat bisa lolos pada percobaan berikutnya
+            return False
+
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM users WHERE username = %s LIMIT 1", (email,))
+            exists = cur.fetchone() is not None
+        if exists and missed:
+            _bloom_missed_user(bloom, email)
+        # Cache negatif hanya setelah database memastikan email tidak terdaftar
+        (user_cache if exists else unknown_user_cache).set(email, True)
+        return exists
 
 def require_token(role=None):
     def decorator(f):
@@ -54,7 +281,7 @@ def require_token(role=None):
 
             token = auth.split(" ")[1]
             try:
-                decoded = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+                decoded = verify_token(token)
                 request.client_id = decoded["client_id"]
                 request.roles = decoded.get("roles", [])
             except jwt.ExpiredSignatureError:
@@ -67,4 +294,10 @@ def require_token(role=None):
 
             return f(*args, **kwargs)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
+
+if __name__ == "__main__":
+    # Membuat hash secret untuk kolom oauth_clients.client_secret:
+    #   python -m validation.authentication <secret>
+    import sys
+    print(hash_secret(sys.argv[1]))
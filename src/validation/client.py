@@ -1,33 +1,223 @@
-import requests
+import os
 import time
+import asyncio
+import threading
+import weakref
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+load_dotenv()
+
+API_CLIENT_TIMEOUT = float(os.getenv("API_CLIENT_TIMEOUT", "30"))
+API_CLIENT_POOL_SIZE = int(os.getenv("API_CLIENT_POOL_SIZE", "20"))
+API_CLIENT_RETRIES = int(os.getenv("API_CLIENT_RETRIES", "3"))
+API_CLIENT_BACKOFF = float(os.getenv("API_CLIENT_BACKOFF", "0.5"))
+# Token diperbarui lebih awal jika sisa umurnya kurang dari ini (detik)
+API_CLIENT_REFRESH_MARGIN = float(os.getenv("API_CLIENT_REFRESH_MARGIN", "60"))
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+
+class _TokenEntry:
+    def __init__(self):
+        self.token = None
+        self.expiry = 0.0
+        self.refresh_at = 0.0
+        self.lock = threading.Lock()
+
 
 class APIClient:
-    def __init__(self, base_url, client_id, client_secret):
-        self.base_url = base_url
+    """
+    Client API dengan token bersama antar instance (per base_url + client_id),
+    refresh token single-flight dan session keep-alive per base_url.
+    """
+
+    _tokens = {}
+    _sessions = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, base_url, client_id, client_secret, token_path="/token", timeout=API_CLIENT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
         self.client_id = client_id
         self.client_secret = client_secret
-        self.token = None
-        self.expiry = 0
+        self.token_path = token_path
+        self.timeout = timeout
+
+    @classmethod
+    def _entry(cls, key):
+        with cls._registry_lock:
+            return cls._tokens.setdefault(key, _TokenEntry())
+
+    @property
+    def _key(self):
+        return (self.base_url, self.client_id)
+
+    @property
+    def session(self):
+        with APIClient._registry_lock:
+            session = APIClient._sessions.get(self.base_url)
+            if session is None:
+                retry = Retry(
+                    total=API_CLIENT_RETRIES,
+                    backoff_factor=API_CLIENT_BACKOFF,
+                    status_forcelist=RETRY_STATUS,
+                    allowed_methods=IDEMPOTENT_METHODS,
+                    respect_retry_after_header=True,
+                )
+                adapter = HTTPAdapter(pool_connections=API_CLIENT_POOL_SIZE, pool_maxsize=API_CLIENT_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                APIClient._sessions[self.base_url] = session
+        return session
+
+    def _store(self, entry, data):
+        now = time.time()
+        expires_in = float(data["expires_in"])
+        entry.token = data["access_token"]
+        entry.expiry = now + expires_in - 5
+        entry.refresh_at = now + max(expires_in - API_CLIENT_REFRESH_MARGIN, expires_in / 2)
+
+    def _fetch_token(self):
+        resp = self.session.post(
+            f"{self.base_url}{self.token_path}",
+            auth=(self.client_id, self.client_secret),
+            timeout=self.timeout,
+        )
+        if resp.status_code != 200:
+            raise Exception(f"Gagal ambil token: {resp.text}")
+        return resp.json()
 
-    def get_token(self):
-        if not self.token or time.time() > self.expiry:
-            resp = requests.post(
-                f"{self.base_url}/token",
-                auth=(self.client_id, self.client_secret)
+    def get_token(self, force=False):
+        entry = self._entry(self._key)
+        now = time.time()
+        if not force and entry.token and now < entry.refresh_at:
+            return entry.token
+
+        valid = entry.token and now < entry.expiry
+        # Token masih berlaku: cukup satu thread yang refresh, yang lain tetap pakai token lama
+        if not force and valid:
+            if not entry.lock.acquire(blocking=False):
+                return entry.token
+        else:
+            entry.lock.acquire()
+        try:
+            # Thread lain mungkin sudah refresh selama kita menunggu lock
+            if entry.token and time.time() < entry.refresh_at and not force:
+                return entry.token
+            try:
+                self._store(entry, self._fetch_token())
+            except Exception:
+                if valid and not force:
+                    return entry.token
+                raise
+            return entry.token
+        finally:
+            entry.lock.release()
+
+    def invalidate_token(self, token=None):
+        entry = self._entry(self._key)
+        with entry.lock:
+            if token is None or entry.token == token:
+                entry.token = None
+                entry.expiry = entry.refresh_at = 0.0
+
+    def call(self, method, path, **kwargs):
+        headers = kwargs.pop("headers", {})
+        kwargs.setdefault("timeout", self.timeout)
+        token = self.get_token()
+        headers["Authorization"] = f"Bearer {token}"
+        resp = self.session.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+        if resp.status_code == 401:
+            # Token ditolak (mis. secret server berganti): ambil token baru sekali lalu ulangi
+            self.invalidate_token(token)
+            headers["Authorization"] = f"Bearer {self.get_token()}"
+            resp = self.session.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+        return resp
+
+
+class AsyncAPIClient(APIClient):
+    """Varian async (httpx) dengan cache token yang sama seperti APIClient."""
+
+    # asyncio.Lock terikat ke event loop yang pertama memakainya, jadi disimpan per loop
+    _async_locks = weakref.WeakKeyDictionary()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            transport = httpx.AsyncHTTPTransport(retries=API_CLIENT_RETRIES)
+            limits = httpx.Limits(max_connections=API_CLIENT_POOL_SIZE, max_keepalive_connections=API_CLIENT_POOL_SIZE)
+            self._client = httpx.AsyncClient(transport=transport, limits=limits, timeout=self.timeout)
+        return self._client
+
+    def _async_lock(self):
+        loop = asyncio.get_running_loop()
+        with APIClient._registry_lock:
+            locks = AsyncAPIClient._async_locks.get(loop)
+            if locks is None:
+                locks = AsyncAPIClient._async_locks[loop] = {}
+            return locks.setdefault(self._key, asyncio.Lock())
+
+    def invalidate_token(self, token=None):
+        # Tanpa entry.lock: jangan blok event loop menunggu thread lain yang sedang refresh
+        entry = self._entry(self._key)
+        if token is None or entry.token == token:
+            entry.token = None
+            entry.expiry = entry.refresh_at = 0.0
+
+    async def get_token(self, force=False):
+        entry = self._entry(self._key)
+        if not force and entry.token and time.time() < entry.refresh_at:
+            return entry.token
+        lock = self._async_lock()
+        if not force and entry.token and time.time() < entry.expiry and lock.locked():
+            return entry.token
+        async with lock:
+            if not force and entry.token and time.time() < entry.refresh_at:
+                return entry.token
+            resp = await self.client.post(
+                f"{self.base_url}{self.token_path}",
+                auth=(self.client_id, self.client_secret),
             )
             if resp.status_code != 200:
                 raise Exception(f"Gagal ambil token: {resp.text}")
+            self._store(entry, resp.json())
+            return entry.token
 
-            data = resp.json()
-            self.token = data["access_token"]
-            self.expiry = time.time() + data["expires_in"] - 5
-        return self.token
+    async def _send(self, method, url, **kwargs):
+        # Retry dengan backoff untuk status sementara, hanya method idempoten
+        attempts = API_CLIENT_RETRIES + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            resp = await self.client.request(method, url, **kwargs)
+            if resp.status_code not in RETRY_STATUS or attempt == attempts - 1:
+                return resp
+            await asyncio.sleep(API_CLIENT_BACKOFF * (2 ** attempt))
+        return resp
 
-    def call(self, method, path, **kwargs):
-        token = self.get_token()
+    async def call(self, method, path, **kwargs):
         headers = kwargs.pop("headers", {})
+        token = await self.get_token()
         headers["Authorization"] = f"Bearer {token}"
-        return requests.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+        resp = await self._send(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+        if resp.status_code == 401:
+            self.invalidate_token(token)
+            headers["Authorization"] = f"Bearer {await self.get_token()}"
+            resp = await self._send(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+        return resp
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
 
 # Bagian ini cuma jalan kalau kamu jalankan langsung: python client.py
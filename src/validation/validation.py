@@ -1,3 +1,4 @@
+import json
 from flask import request, jsonify, g
 from connection.connection import get_connection
 
@@ -111,8 +112,51 @@ def validate_question_article_batch(func):
     wrapper.__name__ = func.__name__
     return wrapper
 
+ARTICLE_BATCH_REQUIRED = ['id','title', 'content', 'author', 'organization_id', 'status', 'created_by', 'updated_by']
+ARTICLE_BATCH_INT_FIELDS = ['id', 'organization_id']
+ARTICLE_BATCH_STR_FIELDS = ['title', 'content', 'author', 'status', 'created_by', 'updated_by']
+
+def check_article_batch_item(idx, item):
+    if not isinstance(item, dict):
+        return f"Item ke-{idx} bukan objek JSON valid"
+
+    missing = [field for field in ARTICLE_BATCH_REQUIRED if item.get(field) in [None, ""]]
+    if missing:
+        return f"Item ke-{idx}: field {', '.join(missing)} wajib diisi"
+
+    # Validasi tipe data
+    for field in ARTICLE_BATCH_INT_FIELDS:
+        if not isinstance(item.get(field), int):
+            return f"Item ke-{idx}: {field} harus berupa integer"
+
+    for field in ARTICLE_BATCH_STR_FIELDS:
+        if not isinstance(item.get(field), str):
+            return f"Item ke-{idx}: {field} harus berupa string"
+
+    return None
+
+def iter_ndjson_articles(stream):
+    # Membaca body NDJSON baris per baris tanpa memuat seluruh payload ke memori
+    for idx, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Item ke-{idx} bukan objek JSON valid")
+        error = check_article_batch_item(idx, item)
+        if error:
+            raise ValueError(error)
+        yield item
+
 def validate_article_batch(func):
     def wrapper(*args, **kwargs):
+        if request.mimetype == "application/x-ndjson":
+            g.article_batch_data = iter_ndjson_articles(request.stream)
+            g.article_batch_streamed = True
+            return func(*args, **kwargs)
+
         data = request.get_json(silent=True)
         if not isinstance(data, list) or len(data) == 0:
             return jsonify({
@@ -121,40 +165,15 @@ def validate_article_batch(func):
             }), 400
         
         for idx, item in enumerate(data, start=1):
-            if not isinstance(item, dict):
-                return jsonify({
-                    "success": False,
-                    "message": f"Item ke-{idx} bukan objek JSON valid"
-                }), 400
-
-            required_fields = ['id','title', 'content', 'author', 'organization_id', 'status', 'created_by', 'updated_by']
-            missing = [field for field in required_fields if item.get(field) in [None, ""]]
-
-            if missing:
+            error = check_article_batch_item(idx, item)
+            if error:
                 return jsonify({
                     "success": False,
-                    "message": f"Item ke-{idx}: field {', '.join(missing)} wajib diisi"
+                    "message": error
                 }), 400
 
-            # Validasi tipe data
-            int_fields = ['id', 'organization_id']
-            str_fields = ['title', 'content', 'author', 'status', 'created_by', 'updated_by']
-
-            for field in int_fields:
-                if not isinstance(item.get(field), int):
-                    return jsonify({
-                        "success": False,
-                        "message": f"Item ke-{idx}: {field} harus berupa integer"
-                    }), 400
-
-            for field in str_fields:
-                if not isinstance(item.get(field), str):
-                    return jsonify({
-                        "success": False,
-                        "message": f"Item ke-{idx}: {field} harus berupa string"
-                    }), 400
-
         g.article_batch_data = data
+        g.article_batch_streamed = False
         return func(*args, **kwargs)
 
     wrapper.__name__ = func.__name__
@@ -227,13 +246,12 @@ def validate_organizations(func):
                 "message": f"Field {', '.join(missing)} wajib diisi"
             }), 400
 
-        conn = get_connection()
-        cur = conn.cursor()
-
         # Perhatikan tuple parameter
         query = "SELECT name FROM organizations WHERE name ILIKE %s"
-        cur.execute(query, (data["name"],))
-        if cur.fetchone():
+        with get_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, (data["name"],))
+            exists = cur.fetchone()
+        if exists:
             return jsonify({
                 "success": False,
                 "message": "Nama organisasi sudah terdaftar"